@@ -0,0 +1,29 @@
+"""Notifications outbox: lease columns and claim index
+
+Revision ID: 005
+Revises: 004
+Create Date: 2026-10-18 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '005'
+down_revision = '004'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('notifications', sa.Column('claimed_by', sa.String(length=32), nullable=True))
+    op.add_column('notifications', sa.Column('claimed_until', sa.DateTime(), nullable=True))
+    op.add_column('notifications', sa.Column('sent_at', sa.DateTime(), nullable=True))
+    op.create_index('ix_notifications_outbox', 'notifications', ['sent', 'claimed_until', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_notifications_outbox', table_name='notifications')
+    op.drop_column('notifications', 'sent_at')
+    op.drop_column('notifications', 'claimed_until')
+    op.drop_column('notifications', 'claimed_by')
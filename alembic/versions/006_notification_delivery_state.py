@@ -0,0 +1,42 @@
+"""Notification delivery state and blocked recipients
+
+Revision ID: 006
+Revises: 005
+Create Date: 2026-10-18 11:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '006'
+down_revision = '005'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('notifications', sa.Column('status', sa.String(length=20), nullable=True, server_default='pending'))
+    op.add_column('notifications', sa.Column('attempts', sa.Integer(), nullable=True, server_default='0'))
+    op.add_column('notifications', sa.Column('last_error', sa.Text(), nullable=True))
+    op.add_column('notifications', sa.Column('next_attempt_at', sa.DateTime(), nullable=True))
+    op.execute("UPDATE notifications SET status = 'sent' WHERE sent = true")
+    op.execute("UPDATE notifications SET status = 'pending' WHERE status IS NULL")
+    op.execute("UPDATE notifications SET attempts = 0 WHERE attempts IS NULL")
+    
+    op.drop_index('ix_notifications_outbox', table_name='notifications')
+    op.create_index('ix_notifications_delivery', 'notifications', ['status', 'next_attempt_at', 'id'], unique=False)
+    
+    # Пользователи, заблокировавшие бота, не получают рассылок
+    op.add_column('users', sa.Column('bot_blocked', sa.Boolean(), nullable=True, server_default='false'))
+    op.execute("UPDATE users SET bot_blocked = false WHERE bot_blocked IS NULL")
+
+
+def downgrade() -> None:
+    op.drop_column('users', 'bot_blocked')
+    op.drop_index('ix_notifications_delivery', table_name='notifications')
+    op.create_index('ix_notifications_outbox', 'notifications', ['sent', 'claimed_until', 'id'], unique=False)
+    op.drop_column('notifications', 'next_attempt_at')
+    op.drop_column('notifications', 'last_error')
+    op.drop_column('notifications', 'attempts')
+    op.drop_column('notifications', 'status')
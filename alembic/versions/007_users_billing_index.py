@@ -0,0 +1,22 @@
+"""Composite index for catch-up billing
+
+Revision ID: 007
+Revises: 006
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from alembic import op
+
+
+revision = '007'
+down_revision = '006'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_users_billing', 'users', ['next_billing_date', 'status', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_users_billing', table_name='users')
@@ -0,0 +1,36 @@
+"""Expression index for per-user billing reminders
+
+Revision ID: 008
+Revises: 007
+Create Date: 2026-10-18 13:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '008'
+down_revision = '007'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Выражения app.models.REMINDER_DATE_SQL до ревизии 017
+    if op.get_bind().dialect.name == 'postgresql':
+        op.create_index(
+            'ix_users_reminder_date', 'users',
+            [sa.text('(next_billing_date - notify_before_billing_days)')]
+        )
+    else:
+        op.create_index(
+            'ix_users_reminder_date_sqlite', 'users',
+            [sa.text("date(next_billing_date, '-' || notify_before_billing_days || ' days')")]
+        )
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name == 'postgresql':
+        op.drop_index('ix_users_reminder_date', table_name='users')
+    else:
+        op.drop_index('ix_users_reminder_date_sqlite', table_name='users')
@@ -0,0 +1,55 @@
+"""Indexes for user search by name
+
+Revision ID: 009
+Revises: 008
+Create Date: 2026-10-18 14:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '009'
+down_revision = '008'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        op.create_index(
+            'ix_users_name_trgm', 'users',
+            [sa.text('lower(name) gin_trgm_ops')],
+            postgresql_using='gin'
+        )
+    else:
+        op.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS users_fts USING fts5("
+            "name, content='users', content_rowid='id', tokenize='trigram')"
+        )
+        op.execute(
+            "CREATE TRIGGER IF NOT EXISTS users_fts_ai AFTER INSERT ON users BEGIN "
+            "INSERT INTO users_fts(rowid, name) VALUES (new.id, new.name); END"
+        )
+        op.execute(
+            "CREATE TRIGGER IF NOT EXISTS users_fts_ad AFTER DELETE ON users BEGIN "
+            "INSERT INTO users_fts(users_fts, rowid, name) VALUES ('delete', old.id, old.name); END"
+        )
+        op.execute(
+            "CREATE TRIGGER IF NOT EXISTS users_fts_au AFTER UPDATE OF name ON users BEGIN "
+            "INSERT INTO users_fts(users_fts, rowid, name) VALUES ('delete', old.id, old.name); "
+            "INSERT INTO users_fts(rowid, name) VALUES (new.id, new.name); END"
+        )
+        # Заполняем индекс существующими пользователями
+        op.execute("INSERT INTO users_fts(users_fts) VALUES ('rebuild')")
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name == 'postgresql':
+        op.drop_index('ix_users_name_trgm', table_name='users')
+    else:
+        op.execute('DROP TRIGGER IF EXISTS users_fts_au')
+        op.execute('DROP TRIGGER IF EXISTS users_fts_ad')
+        op.execute('DROP TRIGGER IF EXISTS users_fts_ai')
+        op.execute('DROP TABLE IF EXISTS users_fts')
@@ -0,0 +1,124 @@
+"""Stats counters table maintained by triggers
+
+Revision ID: 010
+Revises: 009
+Create Date: 2026-10-18 15:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '010'
+down_revision = '009'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'stats',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('total_users', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('active_users', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('debt_users', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('blocked_users', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('ghost_users', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('total_balance', sa.Float(), nullable=False, server_default='0'),
+        sa.Column('updated_at', sa.DateTime(), server_default=sa.text('CURRENT_TIMESTAMP')),
+        sa.PrimaryKeyConstraint('id')
+    )
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute(
+            "CREATE OR REPLACE FUNCTION stats_users_trigger() RETURNS trigger AS $$ BEGIN "
+            "IF TG_OP = 'INSERT' THEN "
+            "UPDATE stats SET total_users = total_users + (1), "
+            "active_users = active_users + (CASE WHEN NEW.status = 'active' THEN 1 ELSE 0 END), "
+            "debt_users = debt_users + (CASE WHEN NEW.status = 'debt' THEN 1 ELSE 0 END), "
+            "blocked_users = blocked_users + (CASE WHEN NEW.status = 'blocked' THEN 1 ELSE 0 END), "
+            "ghost_users = ghost_users + (CASE WHEN NEW.is_ghost THEN 1 ELSE 0 END), "
+            "total_balance = total_balance + (COALESCE(NEW.balance, 0)), "
+            "updated_at = CURRENT_TIMESTAMP WHERE id = 1; "
+            "ELSIF TG_OP = 'DELETE' THEN "
+            "UPDATE stats SET total_users = total_users - (1), "
+            "active_users = active_users - (CASE WHEN OLD.status = 'active' THEN 1 ELSE 0 END), "
+            "debt_users = debt_users - (CASE WHEN OLD.status = 'debt' THEN 1 ELSE 0 END), "
+            "blocked_users = blocked_users - (CASE WHEN OLD.status = 'blocked' THEN 1 ELSE 0 END), "
+            "ghost_users = ghost_users - (CASE WHEN OLD.is_ghost THEN 1 ELSE 0 END), "
+            "total_balance = total_balance - (COALESCE(OLD.balance, 0)), "
+            "updated_at = CURRENT_TIMESTAMP WHERE id = 1; "
+            "ELSE "
+            "UPDATE stats SET "
+            "active_users = active_users + (CASE WHEN NEW.status = 'active' THEN 1 ELSE 0 END) "
+            "- (CASE WHEN OLD.status = 'active' THEN 1 ELSE 0 END), "
+            "debt_users = debt_users + (CASE WHEN NEW.status = 'debt' THEN 1 ELSE 0 END) "
+            "- (CASE WHEN OLD.status = 'debt' THEN 1 ELSE 0 END), "
+            "blocked_users = blocked_users + (CASE WHEN NEW.status = 'blocked' THEN 1 ELSE 0 END) "
+            "- (CASE WHEN OLD.status = 'blocked' THEN 1 ELSE 0 END), "
+            "ghost_users = ghost_users + (CASE WHEN NEW.is_ghost THEN 1 ELSE 0 END) "
+            "- (CASE WHEN OLD.is_ghost THEN 1 ELSE 0 END), "
+            "total_balance = total_balance + (COALESCE(NEW.balance, 0)) - (COALESCE(OLD.balance, 0)), "
+            "updated_at = CURRENT_TIMESTAMP WHERE id = 1; "
+            "END IF; RETURN NULL; END; $$ LANGUAGE plpgsql"
+        )
+        op.execute('DROP TRIGGER IF EXISTS stats_users ON users')
+        op.execute(
+            "CREATE TRIGGER stats_users AFTER INSERT OR DELETE OR UPDATE OF status, is_ghost, balance "
+            "ON users FOR EACH ROW EXECUTE FUNCTION stats_users_trigger()"
+        )
+    else:
+        op.execute(
+            "CREATE TRIGGER IF NOT EXISTS stats_users_ai AFTER INSERT ON users BEGIN "
+            "UPDATE stats SET total_users = total_users + (1), "
+            "active_users = active_users + (CASE WHEN new.status = 'active' THEN 1 ELSE 0 END), "
+            "debt_users = debt_users + (CASE WHEN new.status = 'debt' THEN 1 ELSE 0 END), "
+            "blocked_users = blocked_users + (CASE WHEN new.status = 'blocked' THEN 1 ELSE 0 END), "
+            "ghost_users = ghost_users + (CASE WHEN new.is_ghost THEN 1 ELSE 0 END), "
+            "total_balance = total_balance + (COALESCE(new.balance, 0)), "
+            "updated_at = CURRENT_TIMESTAMP WHERE id = 1; END"
+        )
+        op.execute(
+            "CREATE TRIGGER IF NOT EXISTS stats_users_ad AFTER DELETE ON users BEGIN "
+            "UPDATE stats SET total_users = total_users - (1), "
+            "active_users = active_users - (CASE WHEN old.status = 'active' THEN 1 ELSE 0 END), "
+            "debt_users = debt_users - (CASE WHEN old.status = 'debt' THEN 1 ELSE 0 END), "
+            "blocked_users = blocked_users - (CASE WHEN old.status = 'blocked' THEN 1 ELSE 0 END), "
+            "ghost_users = ghost_users - (CASE WHEN old.is_ghost THEN 1 ELSE 0 END), "
+            "total_balance = total_balance - (COALESCE(old.balance, 0)), "
+            "updated_at = CURRENT_TIMESTAMP WHERE id = 1; END"
+        )
+        op.execute(
+            "CREATE TRIGGER IF NOT EXISTS stats_users_au AFTER UPDATE OF status, is_ghost, balance ON users BEGIN "
+            "UPDATE stats SET "
+            "active_users = active_users + (CASE WHEN new.status = 'active' THEN 1 ELSE 0 END) "
+            "- (CASE WHEN old.status = 'active' THEN 1 ELSE 0 END), "
+            "debt_users = debt_users + (CASE WHEN new.status = 'debt' THEN 1 ELSE 0 END) "
+            "- (CASE WHEN old.status = 'debt' THEN 1 ELSE 0 END), "
+            "blocked_users = blocked_users + (CASE WHEN new.status = 'blocked' THEN 1 ELSE 0 END) "
+            "- (CASE WHEN old.status = 'blocked' THEN 1 ELSE 0 END), "
+            "ghost_users = ghost_users + (CASE WHEN new.is_ghost THEN 1 ELSE 0 END) "
+            "- (CASE WHEN old.is_ghost THEN 1 ELSE 0 END), "
+            "total_balance = total_balance + (COALESCE(new.balance, 0)) - (COALESCE(old.balance, 0)), "
+            "updated_at = CURRENT_TIMESTAMP WHERE id = 1; END"
+        )
+    # Начальные значения одним проходом по users
+    op.execute(
+        "INSERT INTO stats (id, total_users, active_users, debt_users, blocked_users, ghost_users, total_balance) "
+        "SELECT 1, COUNT(id), "
+        "COALESCE(SUM(CASE WHEN status = 'active' THEN 1 ELSE 0 END), 0), "
+        "COALESCE(SUM(CASE WHEN status = 'debt' THEN 1 ELSE 0 END), 0), "
+        "COALESCE(SUM(CASE WHEN status = 'blocked' THEN 1 ELSE 0 END), 0), "
+        "COALESCE(SUM(CASE WHEN is_ghost THEN 1 ELSE 0 END), 0), "
+        "COALESCE(SUM(balance), 0) FROM users"
+    )
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute('DROP TRIGGER IF EXISTS stats_users ON users')
+        op.execute('DROP FUNCTION IF EXISTS stats_users_trigger()')
+    else:
+        op.execute('DROP TRIGGER IF EXISTS stats_users_au')
+        op.execute('DROP TRIGGER IF EXISTS stats_users_ad')
+        op.execute('DROP TRIGGER IF EXISTS stats_users_ai')
+    op.drop_table('stats')
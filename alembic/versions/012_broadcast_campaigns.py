@@ -0,0 +1,43 @@
+"""Broadcast campaigns
+
+Revision ID: 012
+Revises: 011
+Create Date: 2026-10-18 17:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '012'
+down_revision = '011'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'campaigns',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('message', sa.Text(), nullable=False),
+        sa.Column('segment', sa.String(length=20), nullable=False),
+        sa.Column('segment_value', sa.String(length=100), nullable=True),
+        sa.Column('total_recipients', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('created_by', sa.Integer(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), server_default=sa.text('CURRENT_TIMESTAMP'), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_campaigns_id'), 'campaigns', ['id'], unique=False)
+    with op.batch_alter_table('notifications') as batch_op:
+        batch_op.add_column(sa.Column('campaign_id', sa.Integer(), nullable=True))
+        batch_op.create_foreign_key('fk_notifications_campaign_id', 'campaigns', ['campaign_id'], ['id'])
+    op.create_index('ix_notifications_campaign', 'notifications', ['campaign_id', 'status'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_notifications_campaign', table_name='notifications')
+    with op.batch_alter_table('notifications') as batch_op:
+        batch_op.drop_constraint('fk_notifications_campaign_id', type_='foreignkey')
+        batch_op.drop_column('campaign_id')
+    op.drop_index(op.f('ix_campaigns_id'), table_name='campaigns')
+    op.drop_table('campaigns')
@@ -0,0 +1,22 @@
+"""Index for the debtors list
+
+Revision ID: 013
+Revises: 012
+Create Date: 2026-10-18 18:00:00.000000
+
+"""
+from alembic import op
+
+
+revision = '013'
+down_revision = '012'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_users_debtors', 'users', ['is_ghost', 'balance', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_users_debtors', table_name='users')
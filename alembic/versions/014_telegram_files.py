@@ -0,0 +1,36 @@
+"""Cache of Telegram file_ids for uploaded files
+
+Revision ID: 014
+Revises: 013
+Create Date: 2026-10-18 19:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '014'
+down_revision = '013'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'telegram_files',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('kind', sa.String(length=20), nullable=False),
+        sa.Column('owner', sa.String(length=255), nullable=False),
+        sa.Column('fingerprint', sa.String(length=64), nullable=False),
+        sa.Column('file_id', sa.String(length=255), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), server_default=sa.text('CURRENT_TIMESTAMP'), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_telegram_files_id'), 'telegram_files', ['id'], unique=False)
+    op.create_index('ix_telegram_files_owner', 'telegram_files', ['kind', 'owner'], unique=True)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_telegram_files_owner', table_name='telegram_files')
+    op.drop_index(op.f('ix_telegram_files_id'), table_name='telegram_files')
+    op.drop_table('telegram_files')
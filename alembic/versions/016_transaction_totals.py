@@ -0,0 +1,81 @@
+"""Per-user transaction totals maintained by triggers
+
+Revision ID: 016
+Revises: 015
+Create Date: 2026-10-18 21:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '016'
+down_revision = '015'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'transaction_totals',
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('transaction_type', sa.String(length=50), nullable=False),
+        sa.Column('total', sa.Float(), nullable=False, server_default='0'),
+        sa.PrimaryKeyConstraint('user_id', 'transaction_type')
+    )
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute(
+            "CREATE OR REPLACE FUNCTION transaction_totals_trigger() RETURNS trigger AS $$ BEGIN "
+            "IF TG_OP IN ('DELETE', 'UPDATE') THEN "
+            "UPDATE transaction_totals SET total = total - OLD.amount "
+            "WHERE user_id = OLD.user_id AND transaction_type = OLD.transaction_type; END IF; "
+            "IF TG_OP IN ('INSERT', 'UPDATE') THEN "
+            "INSERT INTO transaction_totals (user_id, transaction_type, total) "
+            "VALUES (NEW.user_id, NEW.transaction_type, NEW.amount) "
+            "ON CONFLICT (user_id, transaction_type) DO UPDATE SET total = transaction_totals.total + excluded.total; "
+            "END IF; RETURN NULL; END; $$ LANGUAGE plpgsql"
+        )
+        op.execute('DROP TRIGGER IF EXISTS transaction_totals ON transactions')
+        op.execute(
+            "CREATE TRIGGER transaction_totals AFTER INSERT OR DELETE OR UPDATE OF user_id, amount, transaction_type "
+            "ON transactions FOR EACH ROW EXECUTE FUNCTION transaction_totals_trigger()"
+        )
+    else:
+        op.execute(
+            "CREATE TRIGGER IF NOT EXISTS transaction_totals_ai AFTER INSERT ON transactions BEGIN "
+            "INSERT INTO transaction_totals (user_id, transaction_type, total) "
+            "VALUES (new.user_id, new.transaction_type, new.amount) "
+            "ON CONFLICT (user_id, transaction_type) DO UPDATE SET total = transaction_totals.total + excluded.total; "
+            "END"
+        )
+        op.execute(
+            "CREATE TRIGGER IF NOT EXISTS transaction_totals_ad AFTER DELETE ON transactions BEGIN "
+            "UPDATE transaction_totals SET total = total - old.amount "
+            "WHERE user_id = old.user_id AND transaction_type = old.transaction_type; END"
+        )
+        op.execute(
+            "CREATE TRIGGER IF NOT EXISTS transaction_totals_au "
+            "AFTER UPDATE OF user_id, amount, transaction_type ON transactions BEGIN "
+            "UPDATE transaction_totals SET total = total - old.amount "
+            "WHERE user_id = old.user_id AND transaction_type = old.transaction_type; "
+            "INSERT INTO transaction_totals (user_id, transaction_type, total) "
+            "VALUES (new.user_id, new.transaction_type, new.amount) "
+            "ON CONFLICT (user_id, transaction_type) DO UPDATE SET total = transaction_totals.total + excluded.total; "
+            "END"
+        )
+    # Начальные значения одним проходом по transactions
+    op.execute(
+        "INSERT INTO transaction_totals (user_id, transaction_type, total) "
+        "SELECT user_id, transaction_type, SUM(amount) FROM transactions GROUP BY user_id, transaction_type"
+    )
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute('DROP TRIGGER IF EXISTS transaction_totals ON transactions')
+        op.execute('DROP FUNCTION IF EXISTS transaction_totals_trigger()')
+    else:
+        op.execute('DROP TRIGGER IF EXISTS transaction_totals_au')
+        op.execute('DROP TRIGGER IF EXISTS transaction_totals_ad')
+        op.execute('DROP TRIGGER IF EXISTS transaction_totals_ai')
+    op.drop_table('transaction_totals')
@@ -0,0 +1,46 @@
+"""Reminder date index falls back to 2 days for empty lead time
+
+Revision ID: 017
+Revises: 016
+Create Date: 2026-10-18 22:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '017'
+down_revision = '016'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Выражения совпадают с app.models.REMINDER_DATE_SQL: 0 и NULL - напоминание за 2 дня
+    if op.get_bind().dialect.name == 'postgresql':
+        op.drop_index('ix_users_reminder_date', table_name='users')
+        op.create_index(
+            'ix_users_reminder_date', 'users',
+            [sa.text('(next_billing_date - COALESCE(NULLIF(notify_before_billing_days, 0), 2))')]
+        )
+    else:
+        op.drop_index('ix_users_reminder_date_sqlite', table_name='users')
+        op.create_index(
+            'ix_users_reminder_date_sqlite', 'users',
+            [sa.text("date(next_billing_date, '-' || COALESCE(NULLIF(notify_before_billing_days, 0), 2) || ' days')")]
+        )
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name == 'postgresql':
+        op.drop_index('ix_users_reminder_date', table_name='users')
+        op.create_index(
+            'ix_users_reminder_date', 'users',
+            [sa.text('(next_billing_date - notify_before_billing_days)')]
+        )
+    else:
+        op.drop_index('ix_users_reminder_date_sqlite', table_name='users')
+        op.create_index(
+            'ix_users_reminder_date_sqlite', 'users',
+            [sa.text("date(next_billing_date, '-' || notify_before_billing_days || ' days')")]
+        )
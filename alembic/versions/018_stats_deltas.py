@@ -0,0 +1,136 @@
+"""Stats deltas appended by statement-level triggers on PostgreSQL
+
+Revision ID: 018
+Revises: 017
+Create Date: 2026-10-18 23:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '018'
+down_revision = '017'
+branch_labels = None
+depends_on = None
+
+
+def _statement_delta(source: str) -> str:
+    """INSERT в stats_deltas суммы изменений строк source (без нулевых изменений)"""
+    return (
+        "INSERT INTO stats_deltas (total_users, active_users, debt_users, blocked_users, ghost_users, total_balance) "
+        "SELECT * FROM (SELECT COALESCE(SUM(total_users), 0) AS total_users, "
+        "COALESCE(SUM(active_users), 0) AS active_users, COALESCE(SUM(debt_users), 0) AS debt_users, "
+        "COALESCE(SUM(blocked_users), 0) AS blocked_users, COALESCE(SUM(ghost_users), 0) AS ghost_users, "
+        "COALESCE(SUM(total_balance), 0) AS total_balance "
+        f"FROM ({source}) changes) delta "
+        "WHERE total_users <> 0 OR active_users <> 0 OR debt_users <> 0 OR blocked_users <> 0 "
+        "OR ghost_users <> 0 OR total_balance <> 0"
+    )
+
+
+def _rows(sign: str, total: str, table: str) -> str:
+    """Вклад строк таблицы переходов в счетчики"""
+    return (
+        f"SELECT {sign}({total}) AS total_users, "
+        f"{sign}(CASE WHEN r.status = 'active' THEN 1 ELSE 0 END) AS active_users, "
+        f"{sign}(CASE WHEN r.status = 'debt' THEN 1 ELSE 0 END) AS debt_users, "
+        f"{sign}(CASE WHEN r.status = 'blocked' THEN 1 ELSE 0 END) AS blocked_users, "
+        f"{sign}(CASE WHEN r.is_ghost THEN 1 ELSE 0 END) AS ghost_users, "
+        f"{sign}(COALESCE(r.balance, 0)) AS total_balance FROM {table} r"
+    )
+
+
+def upgrade() -> None:
+    op.create_table(
+        'stats_deltas',
+        sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column('total_users', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('active_users', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('debt_users', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('blocked_users', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('ghost_users', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('total_balance', sa.Float(), nullable=False, server_default='0'),
+        sa.PrimaryKeyConstraint('id')
+    )
+    # SQLite сериализует запись, поэтому его строковые триггеры из 010 остаются
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    # Выражения совпадают с app.models.STATS_TRIGGERS_DDL["postgresql"]
+    op.execute('DROP TRIGGER IF EXISTS stats_users ON users')
+    op.execute(
+        "CREATE OR REPLACE FUNCTION stats_users_trigger() RETURNS trigger AS $$ BEGIN "
+        "IF TG_OP = 'INSERT' THEN " + _statement_delta(_rows("+", "1", "new_rows")) + "; "
+        "ELSIF TG_OP = 'DELETE' THEN " + _statement_delta(_rows("-", "1", "old_rows")) + "; "
+        "ELSE " + _statement_delta(_rows("+", "0", "new_rows") + " UNION ALL " + _rows("-", "0", "old_rows")) + "; "
+        "END IF; RETURN NULL; END; $$ LANGUAGE plpgsql"
+    )
+    op.execute(
+        "CREATE TRIGGER stats_users_insert AFTER INSERT ON users REFERENCING NEW TABLE AS new_rows "
+        "FOR EACH STATEMENT EXECUTE FUNCTION stats_users_trigger()"
+    )
+    op.execute(
+        "CREATE TRIGGER stats_users_delete AFTER DELETE ON users REFERENCING OLD TABLE AS old_rows "
+        "FOR EACH STATEMENT EXECUTE FUNCTION stats_users_trigger()"
+    )
+    op.execute(
+        "CREATE TRIGGER stats_users_update AFTER UPDATE ON users "
+        "REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows "
+        "FOR EACH STATEMENT EXECUTE FUNCTION stats_users_trigger()"
+    )
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute('DROP TRIGGER IF EXISTS stats_users_update ON users')
+        op.execute('DROP TRIGGER IF EXISTS stats_users_delete ON users')
+        op.execute('DROP TRIGGER IF EXISTS stats_users_insert ON users')
+        # Несвернутые изменения переносятся в stats до удаления таблицы
+        op.execute(
+            "UPDATE stats SET total_users = total_users + d.total_users, "
+            "active_users = active_users + d.active_users, debt_users = debt_users + d.debt_users, "
+            "blocked_users = blocked_users + d.blocked_users, ghost_users = ghost_users + d.ghost_users, "
+            "total_balance = total_balance + d.total_balance "
+            "FROM (SELECT COALESCE(SUM(total_users), 0) AS total_users, "
+            "COALESCE(SUM(active_users), 0) AS active_users, COALESCE(SUM(debt_users), 0) AS debt_users, "
+            "COALESCE(SUM(blocked_users), 0) AS blocked_users, COALESCE(SUM(ghost_users), 0) AS ghost_users, "
+            "COALESCE(SUM(total_balance), 0) AS total_balance FROM stats_deltas) d WHERE stats.id = 1"
+        )
+        # Строковый триггер из 010
+        op.execute(
+            "CREATE OR REPLACE FUNCTION stats_users_trigger() RETURNS trigger AS $$ BEGIN "
+            "IF TG_OP = 'INSERT' THEN "
+            "UPDATE stats SET total_users = total_users + (1), "
+            "active_users = active_users + (CASE WHEN NEW.status = 'active' THEN 1 ELSE 0 END), "
+            "debt_users = debt_users + (CASE WHEN NEW.status = 'debt' THEN 1 ELSE 0 END), "
+            "blocked_users = blocked_users + (CASE WHEN NEW.status = 'blocked' THEN 1 ELSE 0 END), "
+            "ghost_users = ghost_users + (CASE WHEN NEW.is_ghost THEN 1 ELSE 0 END), "
+            "total_balance = total_balance + (COALESCE(NEW.balance, 0)), "
+            "updated_at = CURRENT_TIMESTAMP WHERE id = 1; "
+            "ELSIF TG_OP = 'DELETE' THEN "
+            "UPDATE stats SET total_users = total_users - (1), "
+            "active_users = active_users - (CASE WHEN OLD.status = 'active' THEN 1 ELSE 0 END), "
+            "debt_users = debt_users - (CASE WHEN OLD.status = 'debt' THEN 1 ELSE 0 END), "
+            "blocked_users = blocked_users - (CASE WHEN OLD.status = 'blocked' THEN 1 ELSE 0 END), "
+            "ghost_users = ghost_users - (CASE WHEN OLD.is_ghost THEN 1 ELSE 0 END), "
+            "total_balance = total_balance - (COALESCE(OLD.balance, 0)), "
+            "updated_at = CURRENT_TIMESTAMP WHERE id = 1; "
+            "ELSE "
+            "UPDATE stats SET "
+            "active_users = active_users + (CASE WHEN NEW.status = 'active' THEN 1 ELSE 0 END) "
+            "- (CASE WHEN OLD.status = 'active' THEN 1 ELSE 0 END), "
+            "debt_users = debt_users + (CASE WHEN NEW.status = 'debt' THEN 1 ELSE 0 END) "
+            "- (CASE WHEN OLD.status = 'debt' THEN 1 ELSE 0 END), "
+            "blocked_users = blocked_users + (CASE WHEN NEW.status = 'blocked' THEN 1 ELSE 0 END) "
+            "- (CASE WHEN OLD.status = 'blocked' THEN 1 ELSE 0 END), "
+            "ghost_users = ghost_users + (CASE WHEN NEW.is_ghost THEN 1 ELSE 0 END) "
+            "- (CASE WHEN OLD.is_ghost THEN 1 ELSE 0 END), "
+            "total_balance = total_balance + (COALESCE(NEW.balance, 0)) - (COALESCE(OLD.balance, 0)), "
+            "updated_at = CURRENT_TIMESTAMP WHERE id = 1; "
+            "END IF; RETURN NULL; END; $$ LANGUAGE plpgsql"
+        )
+        op.execute(
+            "CREATE TRIGGER stats_users AFTER INSERT OR DELETE OR UPDATE OF status, is_ghost, balance "
+            "ON users FOR EACH ROW EXECUTE FUNCTION stats_users_trigger()"
+        )
+    op.drop_table('stats_deltas')
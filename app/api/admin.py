@@ -1,31 +1,48 @@
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, UploadFile, File, Form, Query
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
-from app.database import get_db
-from app.models import User, Transaction, SystemSettings, Server
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.database import get_db, get_async_db
+from app.models import User, Transaction, Server, Notification, Campaign
 from app.schemas import (
     UserResponse, BalanceAdjustment, KeyUpdate, UserMapping,
-    CSVImportResponse, SettingsUpdate, SBPInfoUpdate, UserUpdate,
-    SendNotificationRequest, ServerCreate, ServerUpdate, ServerResponse
+    ImportJobResponse, SettingsUpdate, SBPInfoUpdate, UserUpdate,
+    SendNotificationRequest, ServerCreate, ServerUpdate, ServerResponse,
+    NotificationResponse, UserPage, UserListItem, UserSearchResult,
+    StatisticsResponse, BulkOperationRequest, BulkOperationResponse, BulkItemResult,
+    BroadcastCreate, CampaignResponse, DebtorsPage
 )
-from app.services.csv_import import import_csv
+from app.services.csv_import import create_import_job, get_import_job, run_import_job
 from app.services.billing import get_subscription_price, set_subscription_price
+from app.services.user_queries import UserFilters, list_users, count_users
+from app.services.search import search_users
+from app.services.statistics import get_statistics
+from app.services.bulk_operations import apply_bulk_operation
+from app.services.broadcasts import (
+    create_campaign, cancel_campaign, campaign_progress, list_campaigns, count_recipients
+)
+from app.services.export import export_users_csv, export_transactions_csv, gzip_stream
 from app.config import settings
-from typing import List
+from datetime import date
+from typing import Iterator, List, Optional
 import aiofiles
+import os
+import tempfile
 
 router = APIRouter(prefix="/api/admin", tags=["admin"])
 
+CSV_UPLOAD_CHUNK = 1024 * 1024
+
 
 def verify_admin(telegram_id: int) -> bool:
-    admin_ids = settings.admin_ids_list
-    return telegram_id in admin_ids
+    return telegram_id in settings.admin_ids
 
 
-@router.post("/import-csv", response_model=CSVImportResponse)
+@router.post("/import-csv", response_model=ImportJobResponse, status_code=202)
 async def import_csv_file(
+    background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
-    telegram_id: int = Form(...),
-    db: Session = Depends(get_db)
+    telegram_id: int = Form(...)
 ):
     if not verify_admin(telegram_id):
         raise HTTPException(status_code=403, detail="Access denied")
@@ -33,28 +50,152 @@ async def import_csv_file(
     if not file.filename.endswith('.csv'):
         raise HTTPException(status_code=400, detail="File must be CSV")
     
-    content = await file.read()
-    csv_content = content.decode('utf-8-sig')  # Обрабатываем BOM
+    # Копируем загрузку во временный файл по частям: импорт идет в фоне после ответа
+    fd, path = tempfile.mkstemp(suffix=".csv")
+    os.close(fd)
+    async with aiofiles.open(path, 'wb') as f:
+        while chunk := await file.read(CSV_UPLOAD_CHUNK):
+            await f.write(chunk)
     
-    imported, errors, ghost_users = import_csv(db, csv_content)
+    job = create_import_job(file.filename)
+    background_tasks.add_task(run_import_job, job, path)
+    return job
+
+
+@router.get("/import-csv/{job_id}", response_model=ImportJobResponse)
+def get_import_status(job_id: str, telegram_id: int):
+    if not verify_admin(telegram_id):
+        raise HTTPException(status_code=403, detail="Access denied")
     
-    return CSVImportResponse(
-        imported=imported,
-        errors=errors,
-        ghost_users=ghost_users
-    )
+    job = get_import_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Import job not found")
+    return job
 
 
-@router.get("/users", response_model=List[UserResponse])
+@router.get("/users", response_model=UserPage)
 def get_all_users(
     telegram_id: int,
+    status: Optional[str] = None,
+    server_name: Optional[str] = None,
+    is_ghost: Optional[bool] = None,
+    min_balance: Optional[float] = None,
+    max_balance: Optional[float] = None,
+    q: Optional[str] = None,
+    sort: str = Query("id", pattern="^(id|name|balance|next_billing_date)$"),
+    order: str = Query("asc", pattern="^(asc|desc)$"),
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=500),
     db: Session = Depends(get_db)
 ):
     if not verify_admin(telegram_id):
         raise HTTPException(status_code=403, detail="Access denied")
     
-    users = db.query(User).all()
-    return users
+    filters = UserFilters(
+        status=status,
+        server_name=server_name,
+        is_ghost=is_ghost,
+        min_balance=min_balance,
+        max_balance=max_balance,
+        q=q
+    )
+    try:
+        users, next_cursor = list_users(db, filters, sort, order == "desc", cursor, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    # Итоги считаются только для первой страницы, дальше клиент их переиспользует
+    summary = count_users(db, filters) if not cursor else {}
+    return UserPage(items=users, next_cursor=next_cursor, **summary)
+
+
+@router.get("/users/search", response_model=List[UserSearchResult])
+def search_users_endpoint(
+    telegram_id: int,
+    q: str = Query(..., min_length=1, max_length=100),
+    limit: int = Query(20, ge=1, le=100),
+    db: Session = Depends(get_db)
+):
+    if not verify_admin(telegram_id):
+        raise HTTPException(status_code=403, detail="Access denied")
+    
+    results = search_users(db, q, limit)
+    return [
+        UserSearchResult(
+            **UserListItem.model_validate(result.user).model_dump(),
+            match=result.match,
+            score=round(result.score, 3)
+        )
+        for result in results
+    ]
+
+
+def _csv_response(chunks: Iterator[bytes], name: str, gzip: bool) -> StreamingResponse:
+    """Потоковый ответ с CSV-файлом (при gzip=True сжимается на лету)"""
+    filename = f"{name}_{date.today().isoformat()}.csv"
+    if gzip:
+        chunks = gzip_stream(chunks)
+        filename += ".gz"
+    return StreamingResponse(
+        chunks,
+        media_type="application/gzip" if gzip else "text/csv; charset=utf-8",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+
+@router.get("/export/users")
+def export_users(
+    telegram_id: int,
+    status: Optional[str] = None,
+    server_name: Optional[str] = None,
+    is_ghost: Optional[bool] = None,
+    min_balance: Optional[float] = None,
+    max_balance: Optional[float] = None,
+    q: Optional[str] = None,
+    gzip: bool = False
+):
+    if not verify_admin(telegram_id):
+        raise HTTPException(status_code=403, detail="Access denied")
+    
+    filters = UserFilters(
+        status=status,
+        server_name=server_name,
+        is_ghost=is_ghost,
+        min_balance=min_balance,
+        max_balance=max_balance,
+        q=q
+    )
+    return _csv_response(export_users_csv(filters), "users", gzip)
+
+
+@router.get("/export/transactions")
+def export_transactions(
+    telegram_id: int,
+    status: Optional[str] = None,
+    server_name: Optional[str] = None,
+    is_ghost: Optional[bool] = None,
+    min_balance: Optional[float] = None,
+    max_balance: Optional[float] = None,
+    q: Optional[str] = None,
+    user_id: Optional[int] = None,
+    transaction_type: Optional[str] = None,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    gzip: bool = False
+):
+    if not verify_admin(telegram_id):
+        raise HTTPException(status_code=403, detail="Access denied")
+    
+    filters = UserFilters(
+        status=status,
+        server_name=server_name,
+        is_ghost=is_ghost,
+        min_balance=min_balance,
+        max_balance=max_balance,
+        q=q
+    )
+    chunks = export_transactions_csv(filters, user_id, transaction_type, date_from, date_to)
+    return _csv_response(chunks, "transactions", gzip)
 
 
 @router.get("/ghost-users", response_model=List[UserResponse])
@@ -69,6 +210,42 @@ def get_ghost_users(
     return users
 
 
+@router.post("/users/bulk", response_model=BulkOperationResponse)
+def bulk_update_users(
+    operation: BulkOperationRequest,
+    telegram_id: int,
+    db: Session = Depends(get_db)
+):
+    if not verify_admin(telegram_id):
+        raise HTTPException(status_code=403, detail="Access denied")
+    
+    if not operation.user_ids and operation.filters is None and not operation.mappings:
+        raise HTTPException(status_code=400, detail="Specify user_ids, filters or mappings")
+    
+    filters = UserFilters(**operation.filters.model_dump()) if operation.filters else None
+    mappings = {m.ghost_user_id: m.telegram_id for m in operation.mappings or []}
+    try:
+        results = apply_bulk_operation(
+            db,
+            user_ids=operation.user_ids,
+            filters=filters,
+            status=operation.status,
+            balance_delta=operation.balance_delta,
+            description=operation.description,
+            server_name=operation.server_name,
+            mappings=mappings
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    failed = sum(1 for result in results if not result.success)
+    return BulkOperationResponse(
+        updated=len(results) - failed,
+        failed=failed,
+        results=[BulkItemResult.model_validate(result) for result in results]
+    )
+
+
 @router.post("/map-user")
 def map_user(
     mapping: UserMapping,
@@ -200,17 +377,35 @@ def update_user(
     return {"success": True, "user": UserResponse.model_validate(user)}
 
 
-@router.get("/debtors", response_model=List[UserResponse])
+@router.get("/debtors", response_model=DebtorsPage)
 def get_debtors(
     telegram_id: int,
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=500),
     db: Session = Depends(get_db)
 ):
     if not verify_admin(telegram_id):
         raise HTTPException(status_code=403, detail="Access denied")
     
-    from app.services.billing import get_debtors
-    debtors = get_debtors(db)
-    return debtors
+    from app.services.billing import get_debtors, get_debtors_summary
+    try:
+        debtors, next_cursor = get_debtors(db, limit, cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    summary = get_debtors_summary(db) if not cursor else {}
+    return DebtorsPage(items=debtors, next_cursor=next_cursor, **summary)
+
+
+@router.get("/statistics", response_model=StatisticsResponse)
+def get_statistics_endpoint(
+    telegram_id: int,
+    db: Session = Depends(get_db)
+):
+    if not verify_admin(telegram_id):
+        raise HTTPException(status_code=403, detail="Access denied")
+    
+    stats = get_statistics(db)
+    return StatisticsResponse(subscription_price=get_subscription_price(db), **stats)
 
 
 @router.get("/settings")
@@ -254,7 +449,7 @@ def get_sbp_info(
 async def update_sbp_info(
     sbp_info: SBPInfoUpdate,
     telegram_id: int,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     if not verify_admin(telegram_id):
         raise HTTPException(status_code=403, detail="Access denied")
@@ -274,8 +469,8 @@ async def update_sbp_info(
             qr_code_path = f"static/uploads/{qr_code_path}"
             os.makedirs("static/uploads", exist_ok=True)
     
-    set_sbp_info(
-        db,
+    await db.run_sync(
+        set_sbp_info,
         phone=sbp_info.phone,
         account=sbp_info.account,
         qr_code_path=qr_code_path
@@ -288,7 +483,7 @@ async def update_sbp_info(
 async def upload_qr_code(
     file: UploadFile = File(...),
     telegram_id: int = Form(...),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     if not verify_admin(telegram_id):
         raise HTTPException(status_code=403, detail="Access denied")
@@ -310,7 +505,7 @@ async def upload_qr_code(
         await f.write(content)
     
     from app.services.billing import set_sbp_info
-    set_sbp_info(db, qr_code_path=file_path)
+    await db.run_sync(set_sbp_info, qr_code_path=file_path)
     
     return {"success": True, "file_path": file_path}
 
@@ -342,6 +537,139 @@ def send_notification_to_user(
     return {"success": True, "message": "Уведомление создано и будет отправлено в ближайшее время"}
 
 
+def _campaign_response(campaign: Campaign, progress: dict) -> CampaignResponse:
+    pending = progress.get("pending", 0)
+    return CampaignResponse(
+        id=campaign.id,
+        message=campaign.message,
+        segment=campaign.segment,
+        segment_value=campaign.segment_value,
+        total_recipients=campaign.total_recipients,
+        created_at=campaign.created_at,
+        status="sending" if pending else "done",
+        sent=progress.get("sent", 0),
+        pending=pending,
+        failed=progress.get("dead", 0),
+        cancelled=progress.get("cancelled", 0)
+    )
+
+
+@router.get("/broadcasts/preview")
+def preview_broadcast(
+    telegram_id: int,
+    segment: str = "all",
+    segment_value: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
+    if not verify_admin(telegram_id):
+        raise HTTPException(status_code=403, detail="Access denied")
+    
+    try:
+        return {"recipients": count_recipients(db, segment, segment_value)}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.post("/broadcasts", response_model=CampaignResponse)
+def create_broadcast(
+    broadcast: BroadcastCreate,
+    telegram_id: int,
+    db: Session = Depends(get_db)
+):
+    if not verify_admin(telegram_id):
+        raise HTTPException(status_code=403, detail="Access denied")
+    
+    try:
+        campaign = create_campaign(
+            db,
+            broadcast.message,
+            broadcast.segment,
+            broadcast.segment_value,
+            created_by=telegram_id
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    return _campaign_response(campaign, campaign_progress(db, [campaign.id])[campaign.id])
+
+
+@router.get("/broadcasts", response_model=List[CampaignResponse])
+def get_broadcasts(
+    telegram_id: int,
+    limit: int = Query(20, ge=1, le=100),
+    db: Session = Depends(get_db)
+):
+    if not verify_admin(telegram_id):
+        raise HTTPException(status_code=403, detail="Access denied")
+    
+    campaigns = list_campaigns(db, limit)
+    progress = campaign_progress(db, [campaign.id for campaign in campaigns])
+    return [_campaign_response(campaign, progress[campaign.id]) for campaign in campaigns]
+
+
+@router.get("/broadcasts/{campaign_id}", response_model=CampaignResponse)
+def get_broadcast(
+    campaign_id: int,
+    telegram_id: int,
+    db: Session = Depends(get_db)
+):
+    if not verify_admin(telegram_id):
+        raise HTTPException(status_code=403, detail="Access denied")
+    
+    campaign = db.get(Campaign, campaign_id)
+    if not campaign:
+        raise HTTPException(status_code=404, detail="Broadcast not found")
+    return _campaign_response(campaign, campaign_progress(db, [campaign.id])[campaign.id])
+
+
+@router.post("/broadcasts/{campaign_id}/cancel", response_model=CampaignResponse)
+def cancel_broadcast(
+    campaign_id: int,
+    telegram_id: int,
+    db: Session = Depends(get_db)
+):
+    if not verify_admin(telegram_id):
+        raise HTTPException(status_code=403, detail="Access denied")
+    
+    campaign = db.get(Campaign, campaign_id)
+    if not campaign:
+        raise HTTPException(status_code=404, detail="Broadcast not found")
+    cancel_campaign(db, campaign.id)
+    return _campaign_response(campaign, campaign_progress(db, [campaign.id])[campaign.id])
+
+
+@router.get("/notifications", response_model=List[NotificationResponse])
+def get_notifications(
+    telegram_id: int,
+    status: str = "dead",
+    limit: int = 100,
+    db: Session = Depends(get_db)
+):
+    if not verify_admin(telegram_id):
+        raise HTTPException(status_code=403, detail="Access denied")
+    
+    notifications = db.query(Notification).filter(
+        Notification.status == status
+    ).order_by(Notification.id.desc()).limit(min(limit, 1000)).all()
+    return notifications
+
+
+@router.post("/notifications/{notification_id}/retry")
+def retry_notification(
+    notification_id: int,
+    telegram_id: int,
+    db: Session = Depends(get_db)
+):
+    if not verify_admin(telegram_id):
+        raise HTTPException(status_code=403, detail="Access denied")
+    
+    from app.services.notifications import requeue_notification
+    if not requeue_notification(db, notification_id):
+        raise HTTPException(status_code=404, detail="Dead notification not found")
+    
+    return {"success": True}
+
+
 @router.post("/servers", response_model=ServerResponse)
 def create_server(
     server: ServerCreate,
@@ -0,0 +1,22 @@
+import hmac
+from fastapi import APIRouter, Header, HTTPException, Request
+from app.bot.webhook import WEBHOOK_ROUTE_PREFIX, get_webhook_bot, webhook_path_secret, webhook_secret_token
+from typing import Optional
+
+router = APIRouter(prefix=WEBHOOK_ROUTE_PREFIX, tags=["telegram"])
+
+
+@router.post("/{path_secret}", include_in_schema=False)
+async def telegram_webhook(
+    path_secret: str,
+    request: Request,
+    x_telegram_bot_api_secret_token: Optional[str] = Header(None)
+):
+    """Обновления Telegram в webhook-режиме бота"""
+    webhook_bot = get_webhook_bot()
+    if webhook_bot is None or not hmac.compare_digest(path_secret, webhook_path_secret()):
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not hmac.compare_digest(x_telegram_bot_api_secret_token or "", webhook_secret_token()):
+        raise HTTPException(status_code=403, detail="Invalid secret token")
+    webhook_bot.feed(await request.json())
+    return {"ok": True}
@@ -1,9 +1,11 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
 from app.database import get_db
-from app.models import User, Transaction
-from app.schemas import UserResponse, TransactionResponse
-from typing import List
+from app.models import User
+from app.schemas import UserResponse, TransactionResponse, TransactionHistoryItem, TransactionPage
+from app.services.transactions import get_transaction_page
+from datetime import date
+from typing import Optional
 
 router = APIRouter(prefix="/api/users", tags=["users"])
 
@@ -21,7 +23,7 @@ def get_my_profile(telegram_id: int, db: Session = Depends(get_db)):
 def check_is_admin(telegram_id: int):
     """Проверяет, является ли пользователь администратором"""
     from app.config import settings
-    return {"is_admin": telegram_id in settings.admin_ids_list}
+    return {"is_admin": telegram_id in settings.admin_ids}
 
 
 @router.get("/{user_id}", response_model=UserResponse)
@@ -33,18 +35,39 @@ def get_user(user_id: int, db: Session = Depends(get_db)):
     return user
 
 
-@router.get("/{user_id}/transactions", response_model=List[TransactionResponse])
-def get_user_transactions(user_id: int, db: Session = Depends(get_db)):
-    """Получает транзакции пользователя"""
+@router.get("/{user_id}/transactions", response_model=TransactionPage)
+def get_user_transactions(
+    user_id: int,
+    transaction_type: Optional[str] = None,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=500),
+    db: Session = Depends(get_db)
+):
+    """Получает историю транзакций пользователя постранично"""
     user = db.query(User).filter(User.id == user_id).first()
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
-    transactions = db.query(Transaction).filter(
-        Transaction.user_id == user_id
-    ).order_by(Transaction.created_at.desc()).limit(50).all()
+    try:
+        items, next_cursor, total_amount = get_transaction_page(
+            db, user_id, transaction_type, date_from, date_to, cursor, limit
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     
-    return transactions
+    return TransactionPage(
+        items=[
+            TransactionHistoryItem(
+                **TransactionResponse.model_validate(transaction).model_dump(),
+                running_total=running_total
+            )
+            for transaction, running_total in items
+        ],
+        next_cursor=next_cursor,
+        total_amount=total_amount
+    )
 
 
 @router.get("/sbp-info")
@@ -0,0 +1,26 @@
+from aiogram import Bot, Dispatcher
+from aiogram.enums import ParseMode
+from app.config import settings
+from app.bot import handlers
+from app.bot.middlewares import setup_middlewares
+from app.bot.storage import create_fsm_storage
+
+
+def create_bot() -> Bot:
+    """Экземпляр бота с настройками проекта"""
+    return Bot(
+        token=settings.bot_token,
+        parse_mode=ParseMode.HTML
+    )
+
+
+def create_dispatcher() -> Dispatcher:
+    """
+    Диспетчер с FSM-хранилищем, middleware и роутерами бота.
+    Общий для polling (app.bot.main) и webhook (app.main); роутер подключается
+    к одному диспетчеру, поэтому вызывается один раз на процесс
+    """
+    dp = Dispatcher(storage=create_fsm_storage())
+    setup_middlewares(dp)
+    dp.include_router(handlers.router)
+    return dp
@@ -1,52 +1,122 @@
-from aiogram import Router, F, Bot
-from aiogram.types import Message, CallbackQuery
+from aiogram import Router, F
+from aiogram.types import Message, InputFile, FSInputFile, BufferedInputFile
+from aiogram.exceptions import TelegramBadRequest
 from aiogram.filters import Command
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
-from sqlalchemy.orm import Session
-from sqlalchemy import func
-from app.database import SessionLocal
-from app.models import User, Transaction
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.models import User
 from app.services.billing import get_subscription_price
-from app.services.notifications import create_notification
+from app.services.delivery import get_delivery_pool
+from app.services.search import search_users
+from app.services.statistics import get_statistics
+from app.services.csv_import import create_import_job, run_import_job
+from app.services.user_cache import UserSnapshot, load_user_snapshot
+from app.services.telegram_files import (
+    KIND_SBP_QR, KIND_VPN_KEY, file_fingerprint, content_fingerprint, get_file_id, save_file_id
+)
 from app.config import settings
 from app.bot.keyboards import get_main_menu, get_admin_menu, get_instruction_button
 from datetime import date
+from typing import Callable, List, Optional
+import asyncio
+import html
+import os
+import tempfile
 import logging
 
 logger = logging.getLogger(__name__)
 
 router = Router()
 
+# Ограничение Telegram на длину текста сообщения
+MESSAGE_LIMIT = 4096
+
 
 class PaymentStates(StatesGroup):
     waiting_for_screenshot = State()
     waiting_csv_file = State()
 
 
+def split_message(header: str, lines: List[str], limit: int = MESSAGE_LIMIT) -> List[str]:
+    """Собирает строки в сообщения не длиннее limit; строки не разрываются"""
+    messages = []
+    current = header
+    for line in lines:
+        if current and len(current) + len(line) > limit:
+            messages.append(current)
+            current = ""
+        current += line
+    if current:
+        messages.append(current)
+    return messages
+
+
+def resolve_qr_path(qr_path: str) -> str:
+    """Абсолютный путь к QR-коду из настройки sbp_qr_code_path"""
+    if os.path.isabs(qr_path):
+        return qr_path
+    # Если это только имя файла (без директории), добавляем static/uploads/
+    if '/' not in qr_path and '\\' not in qr_path:
+        return os.path.join(os.getcwd(), "static", "uploads", qr_path)
+    return os.path.join(os.getcwd(), qr_path)
+
+
+async def answer_cached_file(
+    message: Message,
+    db: AsyncSession,
+    kind: str,
+    owner: str,
+    fingerprint: str,
+    make_file: Callable[[], InputFile],
+    as_photo: bool = False,
+    **kwargs
+) -> Message:
+    """
+    Отправляет файл по сохраненному file_id. Файл загружается в Telegram только
+    при первой отправке, после изменения содержимого или если file_id отклонен
+    """
+    send = message.answer_photo if as_photo else message.answer_document
+    file_id = await db.run_sync(get_file_id, kind, owner, fingerprint)
+    if file_id:
+        try:
+            return await send(file_id, **kwargs)
+        except TelegramBadRequest as e:
+            logger.warning(f"Telegram отклонил file_id {kind}/{owner}, загружаем файл заново: {e}")
+    sent = await send(make_file(), **kwargs)
+    uploaded = sent.photo[-1] if as_photo else sent.document
+    await db.run_sync(save_file_id, kind, owner, fingerprint, uploaded.file_id)
+    return sent
+
+
 @router.message(Command("start"))
-async def cmd_start(message: Message, state: FSMContext):
+async def cmd_start(message: Message, state: FSMContext, db: AsyncSession, user: Optional[UserSnapshot], is_admin_user: bool):
     """Обработчик команды /start"""
-    db = SessionLocal()
-    try:
-        user = db.query(User).filter(User.telegram_id == message.from_user.id).first()
-        is_admin_user = is_admin(message.from_user.id)
-        
-        if not user:
-            user_name = message.from_user.first_name or "Пользователь"
-            user = User(
-                telegram_id=message.from_user.id,
-                name=user_name,
-                balance=0.0,
-                start_date=date.today(),
-                next_billing_date=date.today(),
-                status="active",
-                is_ghost=False,
-                certificates_count=1
-            )
-            db.add(user)
-            db.commit()
-            db.refresh(user)
+    
+    # Отсутствие профиля не кэшируется, поэтому user=None - результат запроса этого апдейта
+    if not user:
+        user_name = message.from_user.first_name or "Пользователь"
+        new_user = User(
+            telegram_id=message.from_user.id,
+            name=user_name,
+            balance=0.0,
+            start_date=date.today(),
+            next_billing_date=date.today(),
+            status="active",
+            is_ghost=False,
+            certificates_count=1
+        )
+        db.add(new_user)
+        try:
+            await db.commit()
+        except IntegrityError:
+            # telegram_id занят параллельной записью - продолжаем как с существующим профилем
+            await db.rollback()
+            user = await db.run_sync(load_user_snapshot, message.from_user.id)
+        else:
+            await db.refresh(new_user)
             
             welcome_text = "👋 Добро пожаловать! Вы зарегистрированы в системе.\n\n"
             if is_admin_user:
@@ -57,246 +127,196 @@ async def cmd_start(message: Message, state: FSMContext):
                 reply_markup=get_main_menu(is_admin_user=is_admin_user)
             )
             
-            bot = message.bot
+            # Уведомления админам уходят через пул доставки, не задерживая ответ
+            pool = get_delivery_pool(message.bot)
             admin_ids = settings.admin_ids_list
             for admin_id in admin_ids:
-                try:
-                    await bot.send_message(
-                        admin_id,
-                        f"🆕 <b>Новый пользователь зарегистрирован</b>\n\n"
-                        f"ID: {user.id}\n"
-                        f"Имя: {user_name}\n"
-                        f"Telegram ID: {message.from_user.id}\n"
-                        f"Дата регистрации: {date.today().strftime('%d.%m.%Y')}",
-                        parse_mode="HTML"
-                    )
-                except Exception as e:
-                    logger.error(f"Ошибка отправки уведомления админу {admin_id}: {e}")
-        else:
-            if user.is_ghost:
-                await message.answer(
-                    "⚠️ Ваш профиль еще не активирован администратором. "
-                    "Ожидайте подтверждения.",
-                    reply_markup=get_main_menu(is_admin_user=is_admin_user)
+                await pool.send_message(
+                    admin_id,
+                    f"🆕 <b>Новый пользователь зарегистрирован</b>\n\n"
+                    f"ID: {new_user.id}\n"
+                    f"Имя: {user_name}\n"
+                    f"Telegram ID: {message.from_user.id}\n"
+                    f"Дата регистрации: {date.today().strftime('%d.%m.%Y')}",
+                    urgent=True,
+                    parse_mode="HTML"
                 )
-            else:
-                welcome_text = "👋 С возвращением!"
-                if is_admin_user:
-                    welcome_text += "\n🔑 Вы администратор. Доступны дополнительные функции."
-                await message.answer(
-                    welcome_text + "\nИспользуйте меню для навигации.",
-                    reply_markup=get_main_menu(is_admin_user=is_admin_user)
-                )
-    finally:
-        db.close()
+            return
+    
+    if user.is_ghost:
+        await message.answer(
+            "⚠️ Ваш профиль еще не активирован администратором. "
+            "Ожидайте подтверждения.",
+            reply_markup=get_main_menu(is_admin_user=is_admin_user)
+        )
+    else:
+        welcome_text = "👋 С возвращением!"
+        if is_admin_user:
+            welcome_text += "\n🔑 Вы администратор. Доступны дополнительные функции."
+        await message.answer(
+            welcome_text + "\nИспользуйте меню для навигации.",
+            reply_markup=get_main_menu(is_admin_user=is_admin_user)
+        )
 
 
 @router.message(F.text == "👤 Мой профиль")
-async def show_profile(message: Message):
-    """Показывает профиль пользователя"""
-    db = SessionLocal()
-    try:
-        user = db.query(User).filter(User.telegram_id == message.from_user.id).first()
-        if not user:
-            await message.answer("❌ Пользователь не найден. Используйте /start")
-            return
-        
-        price = get_subscription_price(db)
-        status_emoji = "✅" if user.status == "active" else "❌"
-        status_text = "Активен" if user.status == "active" else "Заблокирован" if user.status == "blocked" else "Задолженность"
-        
-        text = (
-            f"👤 <b>Мой профиль</b>\n\n"
-            f"Имя: {user.name}\n"
-            f"Баланс: {user.balance:.2f} ₽\n"
-            f"Тариф: {price:.2f} ₽/мес\n"
-            f"Следующее списание: {user.next_billing_date.strftime('%d.%m.%Y')}\n"
-            f"Сертификатов: {user.certificates_count}\n"
-            f"Сервер: {user.server_name or 'не назначен'}\n"
-            f"Статус: {status_emoji} {status_text}"
-        )
-        
-        is_admin_user = is_admin(message.from_user.id)
-        await message.answer(text, parse_mode="HTML", reply_markup=get_main_menu(is_admin_user=is_admin_user))
-    finally:
-        db.close()
+async def show_profile(message: Message, db: AsyncSession, is_admin_user: bool):
+    """Показывает профиль пользователя (баланс - из БД, не из кэша)"""
+    user = await db.run_sync(load_user_snapshot, message.from_user.id)
+    if not user:
+        await message.answer("❌ Пользователь не найден. Используйте /start")
+        return
+    
+    price = await db.run_sync(get_subscription_price)
+    status_emoji = "✅" if user.status == "active" else "❌"
+    status_text = "Активен" if user.status == "active" else "Заблокирован" if user.status == "blocked" else "Задолженность"
+    
+    text = (
+        f"👤 <b>Мой профиль</b>\n\n"
+        f"Имя: {user.name}\n"
+        f"Баланс: {user.balance:.2f} ₽\n"
+        f"Тариф: {price:.2f} ₽/мес\n"
+        f"Следующее списание: {user.next_billing_date.strftime('%d.%m.%Y')}\n"
+        f"Сертификатов: {user.certificates_count}\n"
+        f"Сервер: {user.server_name or 'не назначен'}\n"
+        f"Статус: {status_emoji} {status_text}"
+    )
+    await message.answer(text, parse_mode="HTML", reply_markup=get_main_menu(is_admin_user=is_admin_user))
 
 
 @router.message(F.text == "🔑 Получить ключ")
-async def get_key(message: Message):
-    """Выдает VPN ключ пользователю"""
-    db = SessionLocal()
-    try:
-        user = db.query(User).filter(User.telegram_id == message.from_user.id).first()
-        if not user:
-            await message.answer("❌ Пользователь не найден")
-            return
-        
-        if not user.key_data:
-            is_admin_user = is_admin(message.from_user.id)
-            await message.answer(
-                "❌ Ключ еще не загружен администратором. "
-                "Ожидайте получения ключа.",
-                reply_markup=get_main_menu(is_admin_user=is_admin_user)
-            )
-            return
-        
-        # Отправляем ключ как файл
-        from aiogram.types import BufferedInputFile
-        key_bytes = user.key_data.encode('utf-8')
-        key_file = BufferedInputFile(key_bytes, filename="vpn_config.vpn")
-        
-        await message.answer_document(
-            document=key_file,
-            caption="🔑 Ваш VPN ключ доступа"
-        )
-        
-        # Также отправляем текстовый вариант
+async def get_key(message: Message, db: AsyncSession, is_admin_user: bool):
+    """Выдает VPN ключ пользователю (ключ читается из БД: его меняет админка в процессе API)"""
+    user = await db.run_sync(load_user_snapshot, message.from_user.id)
+    if not user:
+        await message.answer("❌ Пользователь не найден")
+        return
+    
+    if not user.key_data:
         await message.answer(
-            f"📋 Текстовый ключ:\n<code>{user.key_data}</code>",
-            parse_mode="HTML"
+            "❌ Ключ еще не загружен администратором. "
+            "Ожидайте получения ключа.",
+            reply_markup=get_main_menu(is_admin_user=is_admin_user)
         )
-    finally:
-        db.close()
+        return
+    
+    # Отправляем ключ как файл (повторно - по file_id, без загрузки)
+    await answer_cached_file(
+        message, db, KIND_VPN_KEY, str(user.id), content_fingerprint(user.key_data),
+        lambda: BufferedInputFile(user.key_data.encode('utf-8'), filename="vpn_config.vpn"),
+        caption="🔑 Ваш VPN ключ доступа"
+    )
+    
+    # Также отправляем текстовый вариант
+    await message.answer(
+        f"📋 Текстовый ключ:\n<code>{user.key_data}</code>",
+        parse_mode="HTML"
+    )
 
 
 @router.message(F.text == "💰 Пополнить баланс")
-async def show_payment_info(message: Message, state: FSMContext):
+async def show_payment_info(message: Message, state: FSMContext, db: AsyncSession):
     """Показывает реквизиты для пополнения через СБП"""
-    db = SessionLocal()
-    try:
-        from app.services.billing import get_sbp_info
-        
-        sbp_info = get_sbp_info(db)
-        
-        payment_info = (
-            "💰 <b>Пополнение баланса</b>\n\n"
-            "💳 <b>Оплата через СБП:</b>\n"
-        )
-        
-        if sbp_info.get('phone'):
-            payment_info += f"📱 Телефон: <code>{sbp_info['phone']}</code>\n"
-        
-        if sbp_info.get('account'):
-            payment_info += f"🏦 Счет: <code>{sbp_info['account']}</code>\n"
-        
-        payment_info += (
-            "\n📝 <b>Как оплатить:</b>\n"
-            "1. Откройте приложение вашего банка\n"
-            "2. Выберите 'Оплата по QR-коду' или 'Перевод по номеру телефона'\n"
-            "3. Отсканируйте QR-код или введите номер телефона\n"
-            "4. Укажите сумму пополнения\n"
-            "5. После оплаты отправьте скриншот чека\n\n"
-            "💡 <i>Или используйте автоплатеж для автоматического пополнения</i>"
-        )
-        
-        await message.answer(payment_info, parse_mode="HTML")
-        
-        # Отправляем QR-код если есть
-        if sbp_info.get('qr_code_path'):
-            try:
-                from aiogram.types import FSInputFile
-                import os
-                qr_path = sbp_info['qr_code_path']
-                
-                # Обрабатываем путь
-                if not os.path.isabs(qr_path):
-                    # Если это только имя файла (без директории), добавляем static/uploads/
-                    if '/' not in qr_path and '\\' not in qr_path:
-                        qr_path = os.path.join(os.getcwd(), "static", "uploads", qr_path)
-                    else:
-                        qr_path = os.path.join(os.getcwd(), qr_path)
-                
-                # Проверяем существование файла
-                if os.path.exists(qr_path):
-                    qr_file = FSInputFile(qr_path)
-                    await message.answer_photo(
-                        photo=qr_file,
-                        caption="📱 QR-код для оплаты через СБП"
-                    )
-                else:
-                    logger.warning(f"QR-код не найден по пути: {qr_path}")
-            except Exception as e:
-                logger.error(f"Ошибка отправки QR-кода: {e}")
-        
-        await state.set_state(PaymentStates.waiting_for_screenshot)
-    finally:
-        db.close()
+    from app.services.billing import get_sbp_info
+    
+    sbp_info = await db.run_sync(get_sbp_info)
+    
+    payment_info = (
+        "💰 <b>Пополнение баланса</b>\n\n"
+        "💳 <b>Оплата через СБП:</b>\n"
+    )
+    
+    if sbp_info.get('phone'):
+        payment_info += f"📱 Телефон: <code>{sbp_info['phone']}</code>\n"
+    
+    if sbp_info.get('account'):
+        payment_info += f"🏦 Счет: <code>{sbp_info['account']}</code>\n"
+    
+    payment_info += (
+        "\n📝 <b>Как оплатить:</b>\n"
+        "1. Откройте приложение вашего банка\n"
+        "2. Выберите 'Оплата по QR-коду' или 'Перевод по номеру телефона'\n"
+        "3. Отсканируйте QR-код или введите номер телефона\n"
+        "4. Укажите сумму пополнения\n"
+        "5. После оплаты отправьте скриншот чека\n\n"
+        "💡 <i>Или используйте автоплатеж для автоматического пополнения</i>"
+    )
+    
+    await message.answer(payment_info, parse_mode="HTML")
+    
+    # Отправляем QR-код если есть
+    if sbp_info.get('qr_code_path'):
+        try:
+            qr_path = resolve_qr_path(sbp_info['qr_code_path'])
+            
+            # Проверяем существование файла
+            if os.path.exists(qr_path):
+                await answer_cached_file(
+                    message, db, KIND_SBP_QR, qr_path, file_fingerprint(qr_path),
+                    lambda: FSInputFile(qr_path), as_photo=True,
+                    caption="📱 QR-код для оплаты через СБП"
+                )
+            else:
+                logger.warning(f"QR-код не найден по пути: {qr_path}")
+        except Exception as e:
+            logger.error(f"Ошибка отправки QR-кода: {e}")
+    
+    await state.set_state(PaymentStates.waiting_for_screenshot)
+
+
+async def notify_admins_about_receipt(message: Message, admin_message: str):
+    """
+    Пересылает чек и сводку всем админам через срочную очередь пула доставки:
+    обработчик не ждет ни отправки, ни массовых рассылок после биллинга.
+    Интервал между сообщениями в один чат сохраняет порядок: чек, затем сводка
+    """
+    pool = get_delivery_pool(message.bot)
+    for admin_id in settings.admin_ids_list:
+        await pool.forward_message(admin_id, message.chat.id, message.message_id, urgent=True)
+        await pool.send_message(admin_id, admin_message, urgent=True, parse_mode="HTML")
 
 
 @router.message(PaymentStates.waiting_for_screenshot, F.photo)
-async def process_payment_screenshot(message: Message, state: FSMContext):
-    bot = message.bot
-    is_admin_user = is_admin(message.from_user.id)
+async def process_payment_screenshot(message: Message, state: FSMContext, db: AsyncSession, is_admin_user: bool):
     await message.answer(
         "✅ Чек получен. Администратор проверит оплату и пополнит ваш баланс.\n"
         "Обычно это занимает несколько часов.",
         reply_markup=get_main_menu(is_admin_user=is_admin_user)
     )
     await state.clear()
-    
-    db = SessionLocal()
-    try:
-        user = db.query(User).filter(User.telegram_id == message.from_user.id).first()
-        if user:
-            admin_message = (
-                f"📸 <b>Новый чек об оплате</b>\n\n"
-                f"Пользователь: {user.name}\n"
-                f"ID: {user.id}\n"
-                f"Telegram ID: {user.telegram_id}\n"
-                f"Текущий баланс: {user.balance:.2f} ₽"
-            )
-            
-            for admin_id in settings.admin_ids_list:
-                try:
-                    await bot.forward_message(
-                        chat_id=admin_id,
-                        from_chat_id=message.chat.id,
-                        message_id=message.message_id
-                    )
-                    await bot.send_message(admin_id, admin_message, parse_mode="HTML")
-                except Exception as e:
-                    logger.error(f"Ошибка отправки уведомления админу {admin_id}: {e}")
-    finally:
-        db.close()
+    user = await db.run_sync(load_user_snapshot, message.from_user.id)
+    if user:
+        admin_message = (
+            f"📸 <b>Новый чек об оплате</b>\n\n"
+            f"Пользователь: {user.name}\n"
+            f"ID: {user.id}\n"
+            f"Telegram ID: {user.telegram_id}\n"
+            f"Текущий баланс: {user.balance:.2f} ₽"
+        )
+        
+        await notify_admins_about_receipt(message, admin_message)
 
 
 @router.message(PaymentStates.waiting_for_screenshot, F.document)
-async def process_payment_document(message: Message, state: FSMContext):
-    bot = message.bot
-    is_admin_user = is_admin(message.from_user.id)
+async def process_payment_document(message: Message, state: FSMContext, db: AsyncSession, is_admin_user: bool):
     await message.answer(
         "✅ Документ получен. Администратор проверит оплату и пополнит ваш баланс.\n"
         "Обычно это занимает несколько часов.",
         reply_markup=get_main_menu(is_admin_user=is_admin_user)
     )
     await state.clear()
-    
-    db = SessionLocal()
-    try:
-        user = db.query(User).filter(User.telegram_id == message.from_user.id).first()
-        if user:
-            admin_message = (
-                f"📄 <b>Новый документ об оплате</b>\n\n"
-                f"Пользователь: {user.name}\n"
-                f"ID: {user.id}\n"
-                f"Telegram ID: {user.telegram_id}\n"
-                f"Текущий баланс: {user.balance:.2f} ₽\n"
-                f"Файл: {message.document.file_name}"
-            )
-            
-            for admin_id in settings.admin_ids_list:
-                try:
-                    await bot.forward_message(
-                        chat_id=admin_id,
-                        from_chat_id=message.chat.id,
-                        message_id=message.message_id
-                    )
-                    await bot.send_message(admin_id, admin_message, parse_mode="HTML")
-                except Exception as e:
-                    logger.error(f"Ошибка отправки уведомления админу {admin_id}: {e}")
-    finally:
-        db.close()
+    user = await db.run_sync(load_user_snapshot, message.from_user.id)
+    if user:
+        admin_message = (
+            f"📄 <b>Новый документ об оплате</b>\n\n"
+            f"Пользователь: {user.name}\n"
+            f"ID: {user.id}\n"
+            f"Telegram ID: {user.telegram_id}\n"
+            f"Текущий баланс: {user.balance:.2f} ₽\n"
+            f"Файл: {message.document.file_name}"
+        )
+        
+        await notify_admins_about_receipt(message, admin_message)
 
 
 @router.message(F.text == "📄 Инструкция")
@@ -323,20 +343,16 @@ async def show_instruction(message: Message):
 
 
 # Админские команды
-def is_admin(telegram_id: int) -> bool:
-    """Проверяет, является ли пользователь админом"""
-    return telegram_id in settings.admin_ids_list
-
-
 @router.message(Command("admin"))
-async def admin_panel(message: Message):
+async def admin_panel(message: Message, is_admin_user: bool):
     """Открывает админ-панель"""
-    if not is_admin(message.from_user.id):
+    if not is_admin_user:
         await message.answer("❌ Доступ запрещен")
         return
     
     await message.answer(
         "⚙️ <b>Админ-панель</b>\n\n"
+        "Поиск пользователя: /find имя или ID\n\n"
         "Выберите действие:",
         parse_mode="HTML",
         reply_markup=get_admin_menu()
@@ -344,158 +360,168 @@ async def admin_panel(message: Message):
 
 
 @router.message(F.text == "👥 Все пользователи")
-async def show_all_users(message: Message):
+async def show_all_users(message: Message, db: AsyncSession, is_admin_user: bool):
     """Показывает всех пользователей"""
-    if not is_admin(message.from_user.id):
+    if not is_admin_user:
         return
     
-    db = SessionLocal()
-    try:
-        users = db.query(User).limit(20).all()
-        total_count = db.query(User).count()
-        
-        if not users:
-            await message.answer("📭 Пользователей нет")
-            return
-        
-        text = f"👥 <b>Все пользователи</b> (показано {len(users)} из {total_count}):\n\n"
-        for user in users:
-            status_emoji = "✅" if user.status == "active" else "⚠️" if user.status == "debt" else "❌"
-            text += f"{status_emoji} {user.name}\n"
-            text += f"   ID: {user.telegram_id or 'нет'}, Баланс: {user.balance:.2f} ₽\n\n"
-        
-        if total_count > 20:
-            text += f"\n💡 Показано только первые 20. Всего: {total_count}"
-        
-        await message.answer(text, parse_mode="HTML")
-    finally:
-        db.close()
+    users = (await db.execute(select(User).limit(20))).scalars().all()
+    total_count = (await db.run_sync(get_statistics))["total_users"]
+    
+    if not users:
+        await message.answer("📭 Пользователей нет")
+        return
+    
+    text = f"👥 <b>Все пользователи</b> (показано {len(users)} из {total_count}):\n\n"
+    for user in users:
+        status_emoji = "✅" if user.status == "active" else "⚠️" if user.status == "debt" else "❌"
+        text += f"{status_emoji} {user.name}\n"
+        text += f"   ID: {user.telegram_id or 'нет'}, Баланс: {user.balance:.2f} ₽\n\n"
+    
+    if total_count > 20:
+        text += f"\n💡 Показано только первые 20. Всего: {total_count}"
+    
+    await message.answer(text, parse_mode="HTML")
+
+
+@router.message(Command("find"))
+async def find_users(message: Message, db: AsyncSession, is_admin_user: bool):
+    """Поиск пользователей по имени, Telegram ID или ID в системе"""
+    if not is_admin_user:
+        return
+    
+    query = (message.text or "").split(maxsplit=1)[1:]
+    if not query:
+        await message.answer("🔎 Использование: /find имя, Telegram ID или ID в системе")
+        return
+    
+    results = await db.run_sync(search_users, query[0], 10)
+    
+    if not results:
+        await message.answer("📭 Никого не найдено")
+        return
+    
+    text = f"🔎 <b>Найдено:</b> {len(results)}\n\n"
+    for result in results:
+        user = result.user
+        status_emoji = "✅" if user.status == "active" else "⚠️" if user.status == "debt" else "❌"
+        text += f"{status_emoji} {html.escape(user.name)}\n"
+        text += f"   ID: {user.id}, Telegram: {user.telegram_id or 'нет'}, Баланс: {user.balance:.2f} ₽\n\n"
+    
+    await message.answer(text, parse_mode="HTML")
 
 
 @router.message(F.text == "👻 Спящие профили")
-async def show_ghost_users(message: Message):
+async def show_ghost_users(message: Message, db: AsyncSession, is_admin_user: bool):
     """Показывает спящие профили"""
-    if not is_admin(message.from_user.id):
+    if not is_admin_user:
         return
     
-    db = SessionLocal()
-    try:
-        ghost_users = db.query(User).filter(User.is_ghost == True).all()
-        
-        if not ghost_users:
-            await message.answer("✅ Спящих профилей нет")
-            return
-        
-        text = f"👻 <b>Спящие профили</b> ({len(ghost_users)}):\n\n"
-        for user in ghost_users[:10]:  # Показываем первые 10
-            text += f"• {user.name}\n"
-            text += f"  Баланс: {user.balance:.2f} ₽\n"
-            text += f"  ID в системе: {user.id}\n\n"
-        
-        if len(ghost_users) > 10:
-            text += f"\n💡 Показано 10 из {len(ghost_users)}. Используйте веб-админку для полного списка."
-        else:
-            text += "\n💡 Используйте веб-админку для привязки к Telegram ID"
-        
-        await message.answer(text, parse_mode="HTML")
-    finally:
-        db.close()
+    ghost_users = (await db.execute(select(User).where(User.is_ghost == True))).scalars().all()
+    
+    if not ghost_users:
+        await message.answer("✅ Спящих профилей нет")
+        return
+    
+    text = f"👻 <b>Спящие профили</b> ({len(ghost_users)}):\n\n"
+    for user in ghost_users[:10]:  # Показываем первые 10
+        text += f"• {user.name}\n"
+        text += f"  Баланс: {user.balance:.2f} ₽\n"
+        text += f"  ID в системе: {user.id}\n\n"
+    
+    if len(ghost_users) > 10:
+        text += f"\n💡 Показано 10 из {len(ghost_users)}. Используйте веб-админку для полного списка."
+    else:
+        text += "\n💡 Используйте веб-админку для привязки к Telegram ID"
+    
+    await message.answer(text, parse_mode="HTML")
 
 
 @router.message(F.text == "⚠️ Должники")
-async def show_debtors(message: Message):
-    """Показывает список должников"""
-    if not is_admin(message.from_user.id):
+async def show_debtors(message: Message, db: AsyncSession, is_admin_user: bool):
+    """Показывает список должников (несколькими сообщениями, если он длинный)"""
+    if not is_admin_user:
         return
     
-    db = SessionLocal()
-    try:
-        from app.services.billing import get_debtors
-        debtors = get_debtors(db)
-        
-        if not debtors:
-            await message.answer("✅ Должников нет")
-            return
-        
-        text = "⚠️ <b>Список должников:</b>\n\n"
-        for user in debtors:
-            text += f"• {user.name} (@{user.telegram_id})\n"
-            text += f"  Баланс: {user.balance:.2f} ₽\n\n"
-        
+    from app.services.billing import get_debtors, get_debtors_summary
+    summary = await db.run_sync(get_debtors_summary)
+    if not summary["count"]:
+        await message.answer("✅ Должников нет")
+        return
+    
+    debtors, _ = await db.run_sync(get_debtors, settings.bot_debtors_list_limit)
+    
+    header = (
+        f"⚠️ <b>Должники</b> ({summary['count']}), "
+        f"не хватает до оплаты: {summary['total_debt']:.2f} ₽\n\n"
+    )
+    lines = [
+        f"• {html.escape(user.name)} (@{user.telegram_id})\n  Баланс: {user.balance:.2f} ₽\n\n"
+        for user in debtors
+    ]
+    if summary["count"] > len(debtors):
+        lines.append(f"💡 Показано {len(debtors)} из {summary['count']}. Полный список - в веб-админке.")
+    
+    for text in split_message(header, lines):
         await message.answer(text, parse_mode="HTML")
-    finally:
-        db.close()
 
 
 @router.message(F.text == "💳 СБП настройки")
-async def sbp_settings(message: Message):
+async def sbp_settings(message: Message, db: AsyncSession, is_admin_user: bool):
     """Настройки СБП"""
-    if not is_admin(message.from_user.id):
+    if not is_admin_user:
         return
     
-    db = SessionLocal()
-    try:
-        from app.services.billing import get_sbp_info
-        sbp_info = get_sbp_info(db)
-        
-        text = "💳 <b>Настройки СБП</b>\n\n"
-        
-        if sbp_info.get('phone'):
-            text += f"📱 Телефон: <code>{sbp_info['phone']}</code>\n"
-        else:
-            text += "📱 Телефон: <i>не настроен</i>\n"
-        
-        if sbp_info.get('account'):
-            text += f"🏦 Счет: <code>{sbp_info['account']}</code>\n"
-        else:
-            text += "🏦 Счет: <i>не настроен</i>\n"
-        
-        if sbp_info.get('qr_code_path'):
-            text += "✅ QR-код загружен\n"
-        else:
-            text += "❌ QR-код не загружен\n"
-        
-        text += "\n💡 Для изменения настроек используйте веб-админ-панель:\n"
-        text += "http://ваш_сервер:8080/admin"
-        
-        await message.answer(text, parse_mode="HTML")
-        
-        # Отправляем QR-код если есть
-        if sbp_info.get('qr_code_path'):
-            try:
-                from aiogram.types import FSInputFile
-                import os
-                qr_path = sbp_info['qr_code_path']
-                
-                # Обрабатываем путь
-                if not os.path.isabs(qr_path):
-                    # Если это только имя файла (без директории), добавляем static/uploads/
-                    if '/' not in qr_path and '\\' not in qr_path:
-                        qr_path = os.path.join(os.getcwd(), "static", "uploads", qr_path)
-                    else:
-                        qr_path = os.path.join(os.getcwd(), qr_path)
-                
-                if os.path.exists(qr_path):
-                    qr_file = FSInputFile(qr_path)
-                    await message.answer_photo(
-                        photo=qr_file,
-                        caption="📱 QR-код для оплаты через СБП"
-                    )
-            except Exception as e:
-                logger.error(f"Ошибка отправки QR-кода: {e}")
-    finally:
-        db.close()
+    from app.services.billing import get_sbp_info
+    sbp_info = await db.run_sync(get_sbp_info)
+    
+    text = "💳 <b>Настройки СБП</b>\n\n"
+    
+    if sbp_info.get('phone'):
+        text += f"📱 Телефон: <code>{sbp_info['phone']}</code>\n"
+    else:
+        text += "📱 Телефон: <i>не настроен</i>\n"
+    
+    if sbp_info.get('account'):
+        text += f"🏦 Счет: <code>{sbp_info['account']}</code>\n"
+    else:
+        text += "🏦 Счет: <i>не настроен</i>\n"
+    
+    if sbp_info.get('qr_code_path'):
+        text += "✅ QR-код загружен\n"
+    else:
+        text += "❌ QR-код не загружен\n"
+    
+    text += "\n💡 Для изменения настроек используйте веб-админ-панель:\n"
+    text += "http://ваш_сервер:8080/admin"
+    
+    await message.answer(text, parse_mode="HTML")
+    
+    # Отправляем QR-код если есть
+    if sbp_info.get('qr_code_path'):
+        try:
+            qr_path = resolve_qr_path(sbp_info['qr_code_path'])
+            
+            if os.path.exists(qr_path):
+                await answer_cached_file(
+                    message, db, KIND_SBP_QR, qr_path, file_fingerprint(qr_path),
+                    lambda: FSInputFile(qr_path), as_photo=True,
+                    caption="📱 QR-код для оплаты через СБП"
+                )
+        except Exception as e:
+            logger.error(f"Ошибка отправки QR-кода: {e}")
 
 
 @router.message(F.text == "⚙️ Админ-панель")
-async def admin_panel_button(message: Message):
+async def admin_panel_button(message: Message, is_admin_user: bool):
     """Открывает админ-панель по кнопке"""
-    if not is_admin(message.from_user.id):
+    if not is_admin_user:
         await message.answer("❌ Доступ запрещен")
         return
     
     await message.answer(
         "⚙️ <b>Админ-панель</b>\n\n"
+        "Поиск пользователя: /find имя или ID\n\n"
         "Выберите действие:",
         parse_mode="HTML",
         reply_markup=get_admin_menu()
@@ -503,42 +529,31 @@ async def admin_panel_button(message: Message):
 
 
 @router.message(F.text == "📊 Статистика")
-async def show_statistics(message: Message):
+async def show_statistics(message: Message, db: AsyncSession, is_admin_user: bool):
     """Показывает статистику"""
-    if not is_admin(message.from_user.id):
+    if not is_admin_user:
         return
     
-    db = SessionLocal()
-    try:
-        from app.services.billing import get_subscription_price
-        
-        total_users = db.query(User).count()
-        active_users = db.query(User).filter(User.status == "active").count()
-        debtors_count = db.query(User).filter(User.status == "debt").count()
-        ghost_count = db.query(User).filter(User.is_ghost == True).count()
-        
-        total_balance = db.query(func.sum(User.balance)).scalar() or 0.0
-        price = get_subscription_price(db)
-        
-        text = (
-            f"📊 <b>Статистика системы</b>\n\n"
-            f"👥 Всего пользователей: {total_users}\n"
-            f"✅ Активных: {active_users}\n"
-            f"⚠️ Должников: {debtors_count}\n"
-            f"👻 Спящих профилей: {ghost_count}\n\n"
-            f"💰 Общий баланс: {total_balance:.2f} ₽\n"
-            f"💵 Тариф: {price:.2f} ₽/мес"
-        )
-        
-        await message.answer(text, parse_mode="HTML")
-    finally:
-        db.close()
+    stats = await db.run_sync(get_statistics)
+    price = await db.run_sync(get_subscription_price)
+    
+    text = (
+        f"📊 <b>Статистика системы</b>\n\n"
+        f"👥 Всего пользователей: {stats['total_users']}\n"
+        f"✅ Активных: {stats['active_users']}\n"
+        f"⚠️ Должников: {stats['debt_users']}\n"
+        f"👻 Спящих профилей: {stats['ghost_users']}\n\n"
+        f"💰 Общий баланс: {stats['total_balance']:.2f} ₽\n"
+        f"💵 Тариф: {price:.2f} ₽/мес"
+    )
+    
+    await message.answer(text, parse_mode="HTML")
 
 
 @router.message(F.text == "📥 Импорт CSV")
-async def import_csv_handler(message: Message, state: FSMContext):
+async def import_csv_handler(message: Message, state: FSMContext, is_admin_user: bool):
     """Обработчик импорта CSV"""
-    if not is_admin(message.from_user.id):
+    if not is_admin_user:
         return
     
     await message.answer(
@@ -555,9 +570,9 @@ async def import_csv_handler(message: Message, state: FSMContext):
 
 
 @router.message(PaymentStates.waiting_csv_file, F.document)
-async def process_csv_file(message: Message, state: FSMContext):
+async def process_csv_file(message: Message, state: FSMContext, db: AsyncSession, is_admin_user: bool):
     """Обрабатывает загруженный CSV файл"""
-    if not is_admin(message.from_user.id):
+    if not is_admin_user:
         return
     
     if not message.document.file_name or not message.document.file_name.endswith('.csv'):
@@ -565,50 +580,49 @@ async def process_csv_file(message: Message, state: FSMContext):
         return
     
     try:
-        # Скачиваем файл
+        # Скачиваем файл во временный файл: импорт читает его построчно
         file = await message.bot.get_file(message.document.file_id)
-        file_path = file.file_path
-        
-        # Читаем содержимое
-        from io import BytesIO
-        file_content = await message.bot.download_file(file_path)
-        csv_content = file_content.read().decode('utf-8-sig')
-        
-        # Импортируем
-        db = SessionLocal()
-        try:
-            from app.services.csv_import import import_csv
-            imported, errors, ghost_users = import_csv(db, csv_content)
-            
-            result_text = (
-                f"✅ <b>Импорт завершен!</b>\n\n"
-                f"📊 Импортировано: {imported}\n"
-                f"👻 Спящих профилей: {ghost_users}\n"
-                f"❌ Ошибок: {len(errors)}"
-            )
-            
-            if errors:
-                result_text += "\n\n⚠️ <b>Ошибки:</b>\n"
-                for error in errors[:5]:  # Показываем первые 5 ошибок
-                    result_text += f"Строка {error['row']}: {error['error']}\n"
-                if len(errors) > 5:
-                    result_text += f"... и еще {len(errors) - 5} ошибок"
-            
-            await message.answer(result_text, parse_mode="HTML")
-        finally:
-            db.close()
-        
-        await state.clear()
+        fd, path = tempfile.mkstemp(suffix=".csv")
+        os.close(fd)
+        await message.bot.download_file(file.file_path, destination=path)
     except Exception as e:
-        logger.error(f"Ошибка импорта CSV: {e}")
+        logger.error(f"Ошибка загрузки CSV: {e}")
         await message.answer(f"❌ Ошибка импорта: {str(e)}")
         await state.clear()
+        return
+    
+    await state.clear()
+    await message.answer("⏳ Импорт запущен, по завершении придет отчет")
+    
+    # Разбор и вставка выполняются в потоке со своей сессией: event loop бота
+    # (обновления, outbox, пул доставки) не блокируется на время импорта
+    job = create_import_job(message.document.file_name)
+    await asyncio.to_thread(run_import_job, job, path)
+    
+    if job.status == "done":
+        result_text = "✅ <b>Импорт завершен!</b>\n\n"
+    else:
+        result_text = "❌ <b>Импорт прерван</b>\n\n"
+    result_text += (
+        f"📊 Импортировано: {job.imported}\n"
+        f"👻 Спящих профилей: {job.ghost_users}\n"
+        f"❌ Ошибок: {job.error_count}"
+    )
+    
+    if job.errors:
+        result_text += "\n\n⚠️ <b>Ошибки:</b>\n"
+        for error in job.errors[:5]:  # Показываем первые 5 ошибок
+            result_text += f"Строка {error['row']}: {html.escape(error['error'])}\n"
+        if job.error_count > 5:
+            result_text += f"... и еще {job.error_count - 5} ошибок"
+    
+    await message.answer(result_text, parse_mode="HTML")
 
 
 @router.message(F.text == "🌐 Веб-админка")
-async def web_admin_link(message: Message):
+async def web_admin_link(message: Message, is_admin_user: bool):
     """Отправляет ссылку на веб-админку"""
-    if not is_admin(message.from_user.id):
+    if not is_admin_user:
         return
     
     await message.answer(
@@ -621,8 +635,7 @@ async def web_admin_link(message: Message):
 
 
 @router.message(F.text == "🔙 Главное меню")
-async def back_to_main(message: Message):
+async def back_to_main(message: Message, is_admin_user: bool):
     """Возврат в главное меню"""
-    is_admin_user = is_admin(message.from_user.id)
     await message.answer("Главное меню", reply_markup=get_main_menu(is_admin_user=is_admin_user))
 
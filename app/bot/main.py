@@ -1,9 +1,8 @@
 import asyncio
 import logging
-from aiogram import Bot, Dispatcher
-from aiogram.enums import ParseMode
 from app.config import settings
-from app.bot import handlers
+from app.database import log_engine_profile
+from app.bot.dispatcher import create_bot, create_dispatcher
 from app.scheduler import start_scheduler
 
 # Настройка логирования
@@ -15,20 +14,26 @@ logger = logging.getLogger(__name__)
 
 
 async def main():
-    """Главная функция запуска бота"""
+    """Главная функция запуска бота (polling)"""
+    if settings.bot_mode == "webhook":
+        logger.error("BOT_MODE=webhook: обновления принимает app.main, запуск polling пропущен")
+        return
+    
+    log_engine_profile()
+    
     # Инициализация бота и диспетчера
-    bot = Bot(
-        token=settings.bot_token,
-        parse_mode=ParseMode.HTML
-    )
-    dp = Dispatcher()
+    bot = create_bot()
+    dp = create_dispatcher()
     
-    # Регистрация роутеров
-    dp.include_router(handlers.router)
+    # Запуск планировщика (только в одном процессе бота)
+    if settings.run_scheduler:
+        start_scheduler(bot)
+        logger.info("Планировщик задач запущен")
+    else:
+        logger.info("RUN_SCHEDULER=false: планировщик и outbox работают в другом процессе")
     
-    # Запуск планировщика
-    start_scheduler(bot)
-    logger.info("Планировщик задач запущен")
+    # Webhook, оставшийся от webhook-режима, не дает получать обновления через getUpdates
+    await bot.delete_webhook()
     
     # Запуск бота
     logger.info("Бот запущен")
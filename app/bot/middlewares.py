@@ -0,0 +1,107 @@
+import time
+from contextvars import ContextVar
+from dataclasses import dataclass, field, replace
+from aiogram import BaseMiddleware, Dispatcher
+from aiogram.types import TelegramObject
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.database import AsyncSessionLocal
+from app.services.notifications import restore_recipient
+from app.services.user_cache import get_user_snapshot
+from app.config import settings
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+Handler = Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]]
+
+
+@dataclass
+class UpdateScope:
+    """Ресурсы обработки одного апдейта: сессия и прочитанные записи FSM"""
+    db: AsyncSession
+    fsm_records: Dict[str, Tuple[Optional[str], Dict[str, Any]]] = field(default_factory=dict)
+
+
+# Текущий апдейт; DatabaseStorage берет из него сессию вместо открытия своей
+update_scope: ContextVar[Optional[UpdateScope]] = ContextVar("update_scope", default=None)
+
+
+class DbSessionMiddleware(BaseMiddleware):
+    """
+    Outer-middleware апдейтов: одна AsyncSession на апдейт, снимок профиля
+    отправителя и признак админа. Обработчики получают их аргументами
+    db, user и is_admin_user; сессия закрывается после обработки
+    """
+
+    async def __call__(self, handler: Handler, event: TelegramObject, data: Dict[str, Any]) -> Any:
+        from_user = data.get("event_from_user")
+        async with AsyncSessionLocal() as db:
+            token = update_scope.set(UpdateScope(db))
+            try:
+                data["db"] = db
+                data["is_admin_user"] = from_user is not None and from_user.id in settings.admin_ids
+                user = await db.run_sync(get_user_snapshot, from_user.id) if from_user else None
+                # Пользователь снова пишет боту (любой апдейт) - снимаем подавление рассылок
+                if user is not None and user.bot_blocked:
+                    await db.run_sync(restore_recipient, user.id)
+                    user = replace(user, bot_blocked=False)
+                data["user"] = user
+                return await handler(event, data)
+            finally:
+                update_scope.reset(token)
+
+
+@dataclass
+class HandlerStats:
+    count: int = 0
+    total: float = 0.0
+    max: float = 0.0
+
+    @property
+    def average(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+
+class HandlerTimingMiddleware(BaseMiddleware):
+    """
+    Inner-middleware: время выполнения каждого обработчика.
+    Накопленная статистика - в stats, медленные вызовы пишутся в лог
+    """
+
+    def __init__(self):
+        self.stats: Dict[str, HandlerStats] = {}
+
+    async def __call__(self, handler: Handler, event: TelegramObject, data: Dict[str, Any]) -> Any:
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        finally:
+            handler_object = data.get("handler")
+            name = handler_object.callback.__name__ if handler_object else type(event).__name__
+            self.record(name, time.perf_counter() - started)
+
+    def record(self, name: str, elapsed: float):
+        stats = self.stats.setdefault(name, HandlerStats())
+        stats.count += 1
+        stats.total += elapsed
+        stats.max = max(stats.max, elapsed)
+        if elapsed * 1000 >= settings.bot_slow_handler_ms:
+            logger.warning(f"Медленный обработчик {name}: {elapsed * 1000:.0f} мс")
+        else:
+            logger.debug(f"Обработчик {name}: {elapsed * 1000:.1f} мс")
+
+
+def setup_middlewares(dp: Dispatcher) -> HandlerTimingMiddleware:
+    """Подключает middleware к диспетчеру; возвращает сборщик времени обработчиков"""
+    # Сессия апдейта открывается до FSM-middleware, чтобы состояние читалось через нее
+    fsm_enabled = dp.fsm in dp.update.outer_middleware
+    if fsm_enabled:
+        dp.update.outer_middleware.unregister(dp.fsm)
+    dp.update.outer_middleware(DbSessionMiddleware())
+    if fsm_enabled:
+        dp.update.outer_middleware(dp.fsm)
+    timing = HandlerTimingMiddleware()
+    dp.message.middleware(timing)
+    dp.callback_query.middleware(timing)
+    return timing
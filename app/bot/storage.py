@@ -0,0 +1,103 @@
+import json
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+from app.database import AsyncSessionLocal
+from app.services.fsm_states import get_fsm_record, save_fsm_record
+from app.bot.middlewares import update_scope
+from app.config import settings
+from typing import Any, Callable, Dict, Optional, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Бэкенды FSM: database - таблица fsm_states (общая для всех процессов бота),
+# redis - любой сервер с протоколом Redis (нужен пакет redis), memory - только один процесс
+FSM_STORAGES = ("database", "redis", "memory")
+
+# Состояние и данные ключа
+FsmRecord = Tuple[Optional[str], Dict[str, Any]]
+
+
+def build_storage_key(key: StorageKey) -> str:
+    """Строковый ключ записи: бот, чат, пользователь, тема и назначение"""
+    parts = [str(key.bot_id), str(key.chat_id), str(key.user_id)]
+    if key.thread_id:
+        parts.append(str(key.thread_id))
+    parts.append(key.destiny)
+    return ":".join(parts)
+
+
+class DatabaseStorage(BaseStorage):
+    """
+    FSM-хранилище в основной БД. Каждая запись живет ttl секунд с последнего
+    изменения; незавершенные диалоги переживают перезапуск и видны всем процессам бота.
+    Внутри апдейта чтение идет через его сессию (UpdateScope), а запись ключа читается
+    один раз - состояние и данные вместе. Запись коммитится в отдельной короткой
+    сессии, чтобы не зафиксировать заодно незавершенные изменения обработчика.
+    На SQLite обработчик коммитит свои изменения до смены состояния: иначе запись
+    FSM ждет его блокировку до busy_timeout
+    """
+
+    def __init__(self, ttl: Optional[int] = None):
+        self.ttl = ttl if ttl is not None else settings.fsm_state_ttl
+
+    async def _read(self, key: StorageKey) -> FsmRecord:
+        storage_key = build_storage_key(key)
+        scope = update_scope.get()
+        if scope is None:
+            async with AsyncSessionLocal() as db:
+                return await db.run_sync(get_fsm_record, storage_key)
+        if storage_key not in scope.fsm_records:
+            scope.fsm_records[storage_key] = await scope.db.run_sync(get_fsm_record, storage_key)
+        return scope.fsm_records[storage_key]
+
+    async def _write(self, key: StorageKey, field: str, value: Optional[str], apply: Callable[[FsmRecord], FsmRecord]):
+        """Записывает одно поле; apply пересчитывает закэшированную в апдейте запись"""
+        storage_key = build_storage_key(key)
+        scope = update_scope.get()
+        cached = scope.fsm_records.get(storage_key) if scope is not None else None
+        # Очистка поля у отсутствующей записи ничего не меняет (второй шаг FSMContext.clear)
+        if value is None and cached == (None, {}):
+            return
+        async with AsyncSessionLocal() as db:
+            await db.run_sync(save_fsm_record, storage_key, self.ttl, field, value)
+        if cached is not None:
+            scope.fsm_records[storage_key] = apply(cached)
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        value = state.state if isinstance(state, State) else state
+        await self._write(key, "state", value, lambda record: (value, record[1]))
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        state, _ = await self._read(key)
+        return state
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        data = dict(data)
+        value = json.dumps(data, ensure_ascii=False) if data else None
+        await self._write(key, "data", value, lambda record: (record[0], data))
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        _, data = await self._read(key)
+        return dict(data)
+
+    async def close(self) -> None:
+        # Движок БД общий для процесса и закрывается вместе с ним
+        pass
+
+
+def create_fsm_storage() -> BaseStorage:
+    """FSM-хранилище по настройке fsm_storage"""
+    backend = settings.fsm_storage
+    ttl = settings.fsm_state_ttl or None
+    if backend == "database":
+        return DatabaseStorage(ttl)
+    if backend == "redis":
+        # Импорт здесь: пакет redis нужен только для этого бэкенда
+        from aiogram.fsm.storage.redis import RedisStorage
+        return RedisStorage.from_url(settings.fsm_redis_url, state_ttl=ttl, data_ttl=ttl)
+    if backend == "memory":
+        logger.warning("FSM хранится в памяти: состояния теряются при перезапуске, запускайте один процесс бота")
+        return MemoryStorage()
+    raise ValueError(f"Неизвестное FSM-хранилище: {backend}, допустимо: {', '.join(FSM_STORAGES)}")
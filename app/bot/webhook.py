@@ -0,0 +1,130 @@
+import asyncio
+import hashlib
+import hmac
+import logging
+import os
+import sys
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+from app.config import settings
+from app.bot.dispatcher import create_bot, create_dispatcher
+from app.scheduler import start_scheduler, stop_scheduler
+from app.services.delivery import get_delivery_pool
+from typing import Any, Dict, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+WEBHOOK_ROUTE_PREFIX = "/telegram/webhook"
+
+
+def _derive_secret(purpose: str) -> str:
+    """Секрет из SECRET_KEY и токена бота: стабилен между перезапусками и не угадывается"""
+    message = f"{purpose}:{settings.bot_token}".encode("utf-8")
+    return hmac.new(settings.secret_key.encode("utf-8"), message, hashlib.sha256).hexdigest()
+
+
+def webhook_path_secret() -> str:
+    return settings.webhook_path_secret or _derive_secret("webhook-path")
+
+
+def webhook_secret_token() -> str:
+    return settings.webhook_secret_token or _derive_secret("webhook-token")
+
+
+def webhook_url() -> str:
+    return f"{settings.webhook_base_url.rstrip('/')}{WEBHOOK_ROUTE_PREFIX}/{webhook_path_secret()}"
+
+
+class WebhookBot:
+    """
+    Бот в webhook-режиме внутри процесса API: движок БД, кэши и пул доставки
+    общие с API. Обновления обрабатываются фоновыми задачами, не больше
+    webhook_max_concurrency одновременно; Telegram получает ответ сразу
+    """
+
+    def __init__(self, bot: Bot, dp: Dispatcher):
+        self.bot = bot
+        self.dp = dp
+        self._semaphore = asyncio.Semaphore(settings.webhook_max_concurrency)
+        self._tasks: Set[asyncio.Task] = set()
+
+    async def start(self):
+        await self.bot.set_webhook(
+            webhook_url(),
+            secret_token=webhook_secret_token(),
+            allowed_updates=self.dp.resolve_used_update_types()
+        )
+        await self.dp.emit_startup(bot=self.bot)
+        if settings.run_scheduler:
+            start_scheduler(self.bot)
+        logger.info(f"Webhook бота установлен: {settings.webhook_base_url.rstrip('/')}{WEBHOOK_ROUTE_PREFIX}/***")
+
+    async def stop(self):
+        """
+        Останавливает планировщик, дожидается начатых обработчиков и закрывает пул
+        доставки до сессии бота; webhook не снимается, Telegram придержит обновления
+        """
+        if settings.run_scheduler:
+            await stop_scheduler(self.bot)
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        await self.dp.emit_shutdown(bot=self.bot)
+        await get_delivery_pool(self.bot).close()
+        await self.bot.session.close()
+
+    def feed(self, payload: Dict[str, Any]):
+        """Принимает обновление от Telegram и запускает его обработку в фоне"""
+        update = Update.model_validate(payload, context={"bot": self.bot})
+        task = asyncio.create_task(self._process(update))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _process(self, update: Update):
+        async with self._semaphore:
+            try:
+                await self.dp.feed_update(self.bot, update)
+            except Exception as e:
+                logger.error(f"Ошибка обработки обновления {update.update_id}: {e}")
+
+
+_webhook_bot: Optional[WebhookBot] = None
+
+
+def get_webhook_bot() -> Optional[WebhookBot]:
+    """Бот webhook-режима; None, если бот работает через polling"""
+    return _webhook_bot
+
+
+def _server_workers() -> int:
+    """Число процессов API: --workers/-w uvicorn или gunicorn, иначе WEB_CONCURRENCY"""
+    args = sys.argv
+    for index, arg in enumerate(args):
+        if arg in ("--workers", "-w") and index + 1 < len(args):
+            value = args[index + 1]
+        elif arg.startswith("--workers="):
+            value = arg.split("=", 1)[1]
+        else:
+            continue
+        return int(value) if value.isdigit() else 1
+    value = os.environ.get("WEB_CONCURRENCY", "")
+    return int(value) if value.isdigit() else 1
+
+
+async def start_webhook_bot():
+    """Запускает бота в webhook-режиме (из startup API)"""
+    global _webhook_bot
+    if not settings.webhook_base_url:
+        raise ValueError("Для BOT_MODE=webhook нужен WEBHOOK_BASE_URL - публичный https-адрес API")
+    # Каждый воркер перерегистрировал бы webhook и запускал свой планировщик
+    workers = _server_workers()
+    if workers > 1:
+        raise ValueError(f"BOT_MODE=webhook поддерживает только один процесс API, запущено воркеров: {workers}")
+    _webhook_bot = WebhookBot(create_bot(), create_dispatcher())
+    await _webhook_bot.start()
+
+
+async def stop_webhook_bot():
+    global _webhook_bot
+    if _webhook_bot is not None:
+        await _webhook_bot.stop()
+        _webhook_bot = None
@@ -1,26 +1,103 @@
+from functools import cached_property
 from pydantic_settings import BaseSettings
-from typing import List
+from typing import FrozenSet, List
 
 
 class Settings(BaseSettings):
     database_url: str = "sqlite:///./vpn_billing.db"
+    
+    # Профиль движка БД: auto, sqlite_wal, sqlite_default, postgres_pool, default
+    db_engine_profile: str = "auto"
+    sqlite_synchronous: str = "NORMAL"
+    sqlite_busy_timeout_ms: int = 5000
+    sqlite_mmap_size: int = 256 * 1024 * 1024
+    db_pool_size: int = 10
+    db_max_overflow: int = 20
+    db_pool_timeout: int = 30
+    db_pool_pre_ping: bool = True
+    db_pool_recycle: int = 1800
+    db_statement_timeout_ms: int = 30000
+    
     bot_token: str
     admin_telegram_ids: str = ""
     telegram_bot_name: str = ""
     secret_key: str = "change-me-in-production"
     debug: bool = True
     default_subscription_price: float = 100.0
+    billing_chunk_size: int = 500
+    system_settings_cache_ttl: float = 30.0
+    debtors_summary_cache_ttl: float = 60.0
+    
+    # Кэш профилей пользователей в боте (по telegram_id)
+    user_cache_ttl: float = 30.0
+    user_cache_size: int = 10000
+    
+    # Обработчики бота дольше этого порога (мс) пишутся в лог как медленные
+    bot_slow_handler_ms: int = 1000
+    
+    # FSM-состояния бота: database (общие для всех процессов), redis или memory; срок жизни в секундах
+    fsm_storage: str = "database"
+    fsm_state_ttl: int = 24 * 60 * 60
+    fsm_redis_url: str = "redis://localhost:6379/0"
+    
+    # Планировщик (биллинг, напоминания, очистка FSM) и outbox-диспетчер в этом процессе.
+    # При нескольких процессах бота включается ровно в одном, иначе задачи выполняются N раз
+    run_scheduler: bool = True
+    
+    # Режим бота: polling (отдельный процесс app.bot.main) или webhook (обновления принимает app.main).
+    # В webhook-режиме планировщик работает в процессе API, поэтому API запускается одним процессом.
+    # Пустые секреты пути и заголовка выводятся из SECRET_KEY и токена бота
+    bot_mode: str = "polling"
+    webhook_base_url: str = ""
+    webhook_path_secret: str = ""
+    webhook_secret_token: str = ""
+    webhook_max_concurrency: int = 100
+    
+    # Пул доставки сообщений в Telegram
+    delivery_workers: int = 16
+    delivery_rate_limit: float = 30.0
+    delivery_chat_interval: float = 1.0
+    delivery_queue_size: int = 1000
+    delivery_max_retries: int = 3
+    # Отдельная очередь ответов админам и пользователям: идет раньше массовых рассылок
+    delivery_urgent_queue_size: int = 100
+    
+    # Outbox уведомлений
+    outbox_batch_size: int = 100
+    outbox_poll_interval: float = 60.0
+    # На SQLite нет NOTIFY: уведомления из процесса API замечаются только опросом
+    outbox_poll_interval_sqlite: float = 5.0
+    notification_max_attempts: int = 5
+    notification_retry_base: int = 60
+    notification_retry_max: int = 6 * 60 * 60
+    
+    # Сводка биллинга для админов вместо сообщения на каждого должника, список должников в боте
+    admin_billing_digest: bool = True
+    admin_digest_list_limit: int = 20
+    bot_debtors_list_limit: int = 200
+    
+    # Импорт CSV: размер пачки вставки и сколько ошибок хранить в отчете
+    csv_import_chunk_size: int = 1000
+    csv_import_max_errors: int = 1000
+    
+    # Массовые операции админки: максимум пользователей за один запрос
+    bulk_operation_max_users: int = 10000
     
     class Config:
         env_file = ".env"
         case_sensitive = False
     
-    @property
+    @cached_property
     def admin_ids_list(self) -> List[int]:
-        """Преобразует строку ID админов в список"""
+        """Преобразует строку ID админов в список (один раз за процесс)"""
         if not self.admin_telegram_ids:
             return []
         return [int(id.strip()) for id in self.admin_telegram_ids.split(",") if id.strip()]
+    
+    @cached_property
+    def admin_ids(self) -> FrozenSet[int]:
+        """Множество ID админов для проверки прав"""
+        return frozenset(self.admin_ids_list)
 
 
 settings = Settings()
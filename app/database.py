@@ -1,19 +1,174 @@
-from sqlalchemy import create_engine
+import logging
+from dataclasses import dataclass, field
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from app.config import settings
+from typing import AsyncIterator, Callable, Dict
 
-if settings.database_url.startswith("sqlite"):
-    engine = create_engine(
-        settings.database_url,
-        connect_args={"check_same_thread": False}
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class EngineProfile:
+    """Набор параметров движка БД для одного режима развертывания"""
+    name: str
+    engine_kwargs: dict = field(default_factory=dict)
+    async_engine_kwargs: dict = field(default_factory=dict)
+    pragmas: Dict[str, object] = field(default_factory=dict)
+    effective: Dict[str, object] = field(default_factory=dict)
+
+
+def _sqlite_wal_profile() -> EngineProfile:
+    """SQLite в режиме WAL: чтение API не блокируется записью биллинга бота"""
+    pragmas = {
+        "journal_mode": "WAL",
+        "synchronous": settings.sqlite_synchronous,
+        "busy_timeout": settings.sqlite_busy_timeout_ms,
+        "mmap_size": settings.sqlite_mmap_size,
+    }
+    return EngineProfile(
+        name="sqlite_wal",
+        engine_kwargs={"connect_args": {"check_same_thread": False}},
+        async_engine_kwargs={},
+        pragmas=pragmas,
+        effective=dict(pragmas)
+    )
+
+
+def _sqlite_default_profile() -> EngineProfile:
+    """SQLite с настройками по умолчанию (журнал отката)"""
+    return EngineProfile(
+        name="sqlite_default",
+        engine_kwargs={"connect_args": {"check_same_thread": False}},
+        effective={"journal_mode": "DELETE"}
+    )
+
+
+def _postgres_pool_profile() -> EngineProfile:
+    """PostgreSQL с настраиваемым пулом соединений и statement_timeout"""
+    pool_kwargs = {
+        "pool_size": settings.db_pool_size,
+        "max_overflow": settings.db_max_overflow,
+        "pool_pre_ping": settings.db_pool_pre_ping,
+        "pool_recycle": settings.db_pool_recycle,
+        "pool_timeout": settings.db_pool_timeout,
+    }
+    timeout = settings.db_statement_timeout_ms
+    engine_kwargs = dict(pool_kwargs)
+    async_engine_kwargs = dict(pool_kwargs)
+    if timeout:
+        engine_kwargs["connect_args"] = {"options": f"-c statement_timeout={timeout}"}
+        async_engine_kwargs["connect_args"] = {"server_settings": {"statement_timeout": str(timeout)}}
+    return EngineProfile(
+        name="postgres_pool",
+        engine_kwargs=engine_kwargs,
+        async_engine_kwargs=async_engine_kwargs,
+        effective={**pool_kwargs, "statement_timeout_ms": timeout}
     )
-else:
-    engine = create_engine(settings.database_url)
+
+
+def _default_profile() -> EngineProfile:
+    """Параметры SQLAlchemy по умолчанию"""
+    return EngineProfile(name="default")
+
+
+ENGINE_PROFILES: Dict[str, Callable[[], EngineProfile]] = {
+    "sqlite_wal": _sqlite_wal_profile,
+    "sqlite_default": _sqlite_default_profile,
+    "postgres_pool": _postgres_pool_profile,
+    "default": _default_profile,
+}
+
+
+def get_engine_profile(database_url: str, name: str = "auto") -> EngineProfile:
+    """Выбирает профиль движка; auto - по типу БД из DATABASE_URL"""
+    if name == "auto":
+        backend = make_url(database_url).get_backend_name()
+        name = {"sqlite": "sqlite_wal", "postgresql": "postgres_pool"}.get(backend, "default")
+    if name not in ENGINE_PROFILES:
+        raise ValueError(f"Неизвестный профиль БД: {name}. Доступны: {', '.join(ENGINE_PROFILES)}")
+    return ENGINE_PROFILES[name]()
+
+
+# PRAGMA, фактические значения которых читаются с первого соединения: SQLite молча
+# оставляет прежний режим, если запрошенный недоступен (например, WAL на сетевом диске)
+READBACK_PRAGMAS = ("journal_mode", "synchronous")
+SYNCHRONOUS_NAMES = {0: "OFF", 1: "NORMAL", 2: "FULL", 3: "EXTRA"}
+
+
+def _apply_pragmas(target: Engine, profile: EngineProfile):
+    """
+    Выполняет PRAGMA профиля на каждом новом соединении SQLite и записывает
+    в profile.effective значения, которые SQLite применил на первом соединении
+    """
+    if target.dialect.name != "sqlite":
+        return
+    readback = list(dict.fromkeys([*READBACK_PRAGMAS, *profile.pragmas]))
+    first = [True]
+
+    @event.listens_for(target, "connect")
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for pragma, value in profile.pragmas.items():
+            cursor.execute(f"PRAGMA {pragma}={value}")
+        if first[0]:
+            first[0] = False
+            for pragma in readback:
+                cursor.execute(f"PRAGMA {pragma}")
+                row = cursor.fetchone()
+                value = row[0] if row else None
+                if pragma == "journal_mode" and value:
+                    value = value.upper()
+                elif pragma == "synchronous":
+                    value = SYNCHRONOUS_NAMES.get(value, value)
+                profile.effective[pragma] = value
+            requested = str(profile.pragmas.get("journal_mode", "")).upper()
+            if requested and profile.effective["journal_mode"] != requested:
+                logger.warning(f"SQLite не включил journal_mode={requested}, действует {profile.effective['journal_mode']}")
+        cursor.close()
+
+
+def get_async_database_url(database_url: str) -> str:
+    """Подставляет асинхронный драйвер: aiosqlite для SQLite, asyncpg для PostgreSQL"""
+    url = make_url(database_url)
+    if url.get_backend_name() == "sqlite":
+        url = url.set(drivername="sqlite+aiosqlite")
+    elif url.get_backend_name() == "postgresql":
+        url = url.set(drivername="postgresql+asyncpg")
+    return url.render_as_string(hide_password=False)
+
+
+engine_profile = get_engine_profile(settings.database_url, settings.db_engine_profile)
+
+engine = create_engine(settings.database_url, **engine_profile.engine_kwargs)
+_apply_pragmas(engine, engine_profile)
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
+# Асинхронный движок для бота и async-эндпоинтов API: запросы не блокируют event loop.
+# Синхронные сервисы из app.services вызываются через AsyncSession.run_sync
+async_engine = create_async_engine(
+    get_async_database_url(settings.database_url),
+    **engine_profile.async_engine_kwargs
+)
+_apply_pragmas(async_engine.sync_engine, engine_profile)
+
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+
+def log_engine_profile():
+    """
+    Пишет в лог выбранный профиль БД и его параметры (вызывается при старте).
+    Соединение открывается заранее, чтобы для SQLite в лог попали фактические PRAGMA
+    """
+    with engine.connect():
+        pass
+    logger.info(f"Профиль БД: {engine_profile.name}, параметры: {engine_profile.effective}")
+
 
 def get_db():
     db = SessionLocal()
@@ -22,3 +177,7 @@ def get_db():
     finally:
         db.close()
 
+
+async def get_async_db() -> AsyncIterator[AsyncSession]:
+    async with AsyncSessionLocal() as db:
+        yield db
@@ -2,8 +2,9 @@ from fastapi import FastAPI, Request
 from fastapi.staticfiles import StaticFiles
 from fastapi.responses import HTMLResponse
 from fastapi.templating import Jinja2Templates
-from app.database import engine, Base
-from app.api import users, admin, auth
+from app.database import engine, Base, log_engine_profile
+from app.api import users, admin, auth, telegram
+from app.bot.webhook import start_webhook_bot, stop_webhook_bot
 from app.config import settings
 import os
 
@@ -18,6 +19,7 @@ app = FastAPI(
 app.include_router(users.router)
 app.include_router(admin.router)
 app.include_router(auth.router)
+app.include_router(telegram.router)
 
 if not os.path.exists("static"):
     os.makedirs("static")
@@ -28,6 +30,18 @@ app.mount("/static", StaticFiles(directory="static"), name="static")
 templates = Jinja2Templates(directory="templates")
 
 
+@app.on_event("startup")
+async def on_startup():
+    log_engine_profile()
+    if settings.bot_mode == "webhook":
+        await start_webhook_bot()
+
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    await stop_webhook_bot()
+
+
 @app.get("/", response_class=HTMLResponse)
 async def root(request: Request):
     return templates.TemplateResponse("index.html", {"request": request})
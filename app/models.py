@@ -1,10 +1,36 @@
-from sqlalchemy import Column, Integer, String, Float, Date, DateTime, Boolean, Text, ForeignKey
+from sqlalchemy import Column, Integer, String, Float, Date, DateTime, Boolean, Text, ForeignKey, Index, text, event, DDL
+from sqlalchemy.dialects import sqlite
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from datetime import datetime, date
 from app.database import Base
 
 
+# За сколько дней напоминать о списании: 0 и NULL означают значение по умолчанию (2 дня)
+REMINDER_DAYS_SQL = "COALESCE(NULLIF(notify_before_billing_days, 0), 2)"
+
+# Дата напоминания о списании (next_billing_date - REMINDER_DAYS_SQL).
+# Выражение должно совпадать с индексом ix_users_reminder_date, чтобы планировщик БД его использовал
+REMINDER_DATE_SQL = {
+    "postgresql": f"(next_billing_date - {REMINDER_DAYS_SQL})",
+    "sqlite": f"date(next_billing_date, '-' || {REMINDER_DAYS_SQL} || ' days')",
+}
+
+# Поиск по имени: на SQLite - FTS5-таблица с триграммным токенизатором поверх users,
+# синхронизируемая триггерами; на PostgreSQL - GIN-индекс pg_trgm (см. app.services.search)
+USERS_FTS_SQLITE_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS users_fts USING fts5("
+    "name, content='users', content_rowid='id', tokenize='trigram')",
+    "CREATE TRIGGER IF NOT EXISTS users_fts_ai AFTER INSERT ON users BEGIN "
+    "INSERT INTO users_fts(rowid, name) VALUES (new.id, new.name); END",
+    "CREATE TRIGGER IF NOT EXISTS users_fts_ad AFTER DELETE ON users BEGIN "
+    "INSERT INTO users_fts(users_fts, rowid, name) VALUES ('delete', old.id, old.name); END",
+    "CREATE TRIGGER IF NOT EXISTS users_fts_au AFTER UPDATE OF name ON users BEGIN "
+    "INSERT INTO users_fts(users_fts, rowid, name) VALUES ('delete', old.id, old.name); "
+    "INSERT INTO users_fts(rowid, name) VALUES (new.id, new.name); END",
+]
+
+
 class User(Base):
     __tablename__ = "users"
     
@@ -22,11 +48,32 @@ class User(Base):
     enable_billing_notifications = Column(Boolean, default=True)
     notify_before_billing_days = Column(Integer, default=2)
     enable_negative_balance_notifications = Column(Boolean, default=True)
+    bot_blocked = Column(Boolean, default=False)
     created_at = Column(DateTime, server_default=func.now())
     updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now())
     
     transactions = relationship("Transaction", back_populates="user", cascade="all, delete-orphan")
     notifications = relationship("Notification", back_populates="user", cascade="all, delete-orphan")
+    
+    __table_args__ = (
+        # Выбор пользователей для списания: next_billing_date <= сегодня, по возрастанию даты
+        Index("ix_users_billing", "next_billing_date", "status", "id"),
+        # Должники: is_ghost = false AND balance < цены, по возрастанию баланса
+        Index("ix_users_debtors", "is_ghost", "balance", "id"),
+        Index("ix_users_reminder_date", text(REMINDER_DATE_SQL["postgresql"])).ddl_if(dialect="postgresql"),
+        Index("ix_users_reminder_date_sqlite", text(REMINDER_DATE_SQL["sqlite"])).ddl_if(dialect="sqlite"),
+        Index(
+            "ix_users_name_trgm", text("lower(name) gin_trgm_ops"), postgresql_using="gin"
+        ).ddl_if(dialect="postgresql"),
+    )
+
+
+event.listen(
+    User.__table__, "before_create",
+    DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm").execute_if(dialect="postgresql")
+)
+for _statement in USERS_FTS_SQLITE_DDL:
+    event.listen(User.__table__, "after_create", DDL(_statement).execute_if(dialect="sqlite"))
 
 
 class Transaction(Base):
@@ -37,9 +84,36 @@ class Transaction(Base):
     amount = Column(Float, nullable=False)
     transaction_type = Column(String(50), nullable=False)
     description = Column(Text, nullable=True)
-    created_at = Column(DateTime, server_default=func.now())
+    # SQLite хранит CURRENT_TIMESTAMP без микросекунд - параметры сравнения в том же формате
+    created_at = Column(
+        DateTime().with_variant(sqlite.DATETIME(truncate_microseconds=True), "sqlite"),
+        server_default=func.now()
+    )
     
     user = relationship("User", back_populates="transactions")
+    
+    __table_args__ = (
+        # История пользователя от новых к старым с keyset-пагинацией
+        Index("ix_transactions_user_created", "user_id", created_at.desc(), id.desc()),
+    )
+
+
+class Campaign(Base):
+    """
+    Рассылка по сегменту пользователей. Получатели материализуются строками
+    notifications (campaign_id) и доставляются общим outbox-диспетчером
+    """
+    __tablename__ = "campaigns"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    message = Column(Text, nullable=False)
+    segment = Column(String(20), nullable=False)
+    segment_value = Column(String(100), nullable=True)
+    total_recipients = Column(Integer, nullable=False, default=0)
+    created_by = Column(Integer, nullable=True)
+    created_at = Column(DateTime, server_default=func.now())
+    
+    notifications = relationship("Notification", back_populates="campaign")
 
 
 class Notification(Base):
@@ -50,9 +124,205 @@ class Notification(Base):
     message = Column(Text, nullable=False)
     notification_type = Column(String(50), nullable=False)
     sent = Column(Boolean, default=False)
+    status = Column(String(20), default="pending")
+    attempts = Column(Integer, default=0)
+    last_error = Column(Text, nullable=True)
+    next_attempt_at = Column(DateTime, nullable=True)
+    claimed_by = Column(String(32), nullable=True)
+    claimed_until = Column(DateTime, nullable=True)
+    sent_at = Column(DateTime, nullable=True)
+    campaign_id = Column(Integer, ForeignKey("campaigns.id", name="fk_notifications_campaign_id"), nullable=True)
     created_at = Column(DateTime, server_default=func.now())
     
     user = relationship("User", back_populates="notifications")
+    campaign = relationship("Campaign", back_populates="notifications")
+    
+    __table_args__ = (
+        Index("ix_notifications_delivery", "status", "next_attempt_at", "id"),
+        # Прогресс рассылки: число уведомлений по статусам
+        Index("ix_notifications_campaign", "campaign_id", "status"),
+    )
+
+
+class Stats(Base):
+    """
+    Счетчики пользователей одной строкой (id=1).
+    Поддерживаются триггерами БД на users (см. STATS_TRIGGERS_DDL), поэтому учитывают
+    и ORM, и массовые UPDATE биллинга; в PostgreSQL к строке добавляются
+    несвернутые StatsDelta. Пересчитываются app.services.statistics
+    """
+    __tablename__ = "stats"
+    
+    id = Column(Integer, primary_key=True)
+    total_users = Column(Integer, nullable=False, default=0)
+    active_users = Column(Integer, nullable=False, default=0)
+    debt_users = Column(Integer, nullable=False, default=0)
+    blocked_users = Column(Integer, nullable=False, default=0)
+    ghost_users = Column(Integer, nullable=False, default=0)
+    total_balance = Column(Float, nullable=False, default=0.0)
+    updated_at = Column(DateTime, server_default=func.now())
+
+
+class StatsDelta(Base):
+    """
+    Изменения счетчиков stats, еще не свернутые в строку id=1 (PostgreSQL).
+    Триггер уровня оператора добавляет одну строку на оператор над users,
+    app.services.statistics суммирует их при чтении и сворачивает по расписанию
+    """
+    __tablename__ = "stats_deltas"
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    total_users = Column(Integer, nullable=False, default=0)
+    active_users = Column(Integer, nullable=False, default=0)
+    debt_users = Column(Integer, nullable=False, default=0)
+    blocked_users = Column(Integer, nullable=False, default=0)
+    ghost_users = Column(Integer, nullable=False, default=0)
+    total_balance = Column(Float, nullable=False, default=0.0)
+
+
+# Вклад одной строки users (new/old) в каждый счетчик
+_STATS_COUNTERS = {
+    "total_users": "1",
+    "active_users": "CASE WHEN {row}.status = 'active' THEN 1 ELSE 0 END",
+    "debt_users": "CASE WHEN {row}.status = 'debt' THEN 1 ELSE 0 END",
+    "blocked_users": "CASE WHEN {row}.status = 'blocked' THEN 1 ELSE 0 END",
+    "ghost_users": "CASE WHEN {row}.is_ghost THEN 1 ELSE 0 END",
+    "total_balance": "COALESCE({row}.balance, 0)",
+}
+
+
+def _stats_delta(rows) -> str:
+    """SET-часть UPDATE stats: rows - пары (знак, new/old) изменяемых строк users"""
+    assignments = []
+    for column, expression in _STATS_COUNTERS.items():
+        if len(rows) > 1 and "{row}" not in expression:
+            continue
+        terms = "".join(f" {sign} ({expression.format(row=row)})" for sign, row in rows)
+        assignments.append(f"{column} = {column}{terms}")
+    assignments.append("updated_at = CURRENT_TIMESTAMP")
+    return "UPDATE stats SET " + ", ".join(assignments) + " WHERE id = 1"
+
+
+def _stats_statement_delta(tables) -> str:
+    """
+    INSERT в stats_deltas суммарного изменения за оператор: tables - пары
+    (знак, new_rows/old_rows) таблиц переходов. Нулевое изменение не пишется
+    """
+    parts = []
+    for sign, table in tables:
+        columns = []
+        for column, expression in _STATS_COUNTERS.items():
+            if len(tables) > 1 and "{row}" not in expression:
+                expression = "0"
+            columns.append(f"{sign}({expression.format(row='r')}) AS {column}")
+        parts.append(f"SELECT {', '.join(columns)} FROM {table} r")
+    sums = ", ".join(f"COALESCE(SUM({column}), 0) AS {column}" for column in _STATS_COUNTERS)
+    changed = " OR ".join(f"{column} <> 0" for column in _STATS_COUNTERS)
+    return (
+        f"INSERT INTO stats_deltas ({', '.join(_STATS_COUNTERS)}) "
+        f"SELECT * FROM (SELECT {sums} FROM ({' UNION ALL '.join(parts)}) changes) delta WHERE {changed}"
+    )
+
+
+# SQLite сериализует запись, поэтому строковые триггеры обновляют stats напрямую.
+# В PostgreSQL UPDATE одной строки stats из каждого писателя users выстраивал бы
+# их в очередь за ее блокировкой: триггеры уровня оператора лишь добавляют
+# строку в stats_deltas и ничьих блокировок не ждут
+STATS_TRIGGERS_DDL = {
+    "sqlite": [
+        "CREATE TRIGGER IF NOT EXISTS stats_users_ai AFTER INSERT ON users BEGIN "
+        + _stats_delta([("+", "new")]) + "; END",
+        "CREATE TRIGGER IF NOT EXISTS stats_users_ad AFTER DELETE ON users BEGIN "
+        + _stats_delta([("-", "old")]) + "; END",
+        "CREATE TRIGGER IF NOT EXISTS stats_users_au AFTER UPDATE OF status, is_ghost, balance ON users BEGIN "
+        + _stats_delta([("+", "new"), ("-", "old")]) + "; END",
+    ],
+    "postgresql": [
+        "CREATE OR REPLACE FUNCTION stats_users_trigger() RETURNS trigger AS $$ BEGIN "
+        "IF TG_OP = 'INSERT' THEN " + _stats_statement_delta([("+", "new_rows")]) + "; "
+        "ELSIF TG_OP = 'DELETE' THEN " + _stats_statement_delta([("-", "old_rows")]) + "; "
+        "ELSE " + _stats_statement_delta([("+", "new_rows"), ("-", "old_rows")]) + "; "
+        "END IF; RETURN NULL; END; $$ LANGUAGE plpgsql",
+        "DROP TRIGGER IF EXISTS stats_users ON users",
+        "DROP TRIGGER IF EXISTS stats_users_insert ON users",
+        "DROP TRIGGER IF EXISTS stats_users_delete ON users",
+        "DROP TRIGGER IF EXISTS stats_users_update ON users",
+        # Таблицы переходов не сочетаются с несколькими событиями и UPDATE OF
+        "CREATE TRIGGER stats_users_insert AFTER INSERT ON users REFERENCING NEW TABLE AS new_rows "
+        "FOR EACH STATEMENT EXECUTE FUNCTION stats_users_trigger()",
+        "CREATE TRIGGER stats_users_delete AFTER DELETE ON users REFERENCING OLD TABLE AS old_rows "
+        "FOR EACH STATEMENT EXECUTE FUNCTION stats_users_trigger()",
+        "CREATE TRIGGER stats_users_update AFTER UPDATE ON users "
+        "REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows "
+        "FOR EACH STATEMENT EXECUTE FUNCTION stats_users_trigger()",
+    ],
+}
+
+@event.listens_for(Base.metadata, "after_create")
+def _create_stats_triggers(target, connection, tables=(), **kw):
+    """Триггеры ссылаются на users, stats и stats_deltas, поэтому создаются после всех таблиц"""
+    if Stats.__table__ in tables:
+        for statement in STATS_TRIGGERS_DDL.get(connection.dialect.name, []):
+            connection.execute(DDL(statement))
+
+
+class TransactionTotal(Base):
+    """
+    Сумма транзакций пользователя по типу - якорь нарастающего итога истории.
+    Поддерживается триггерами БД на transactions (см. TRANSACTION_TOTALS_TRIGGERS_DDL)
+    """
+    __tablename__ = "transaction_totals"
+    
+    user_id = Column(Integer, primary_key=True)
+    transaction_type = Column(String(50), primary_key=True)
+    total = Column(Float, nullable=False, default=0.0)
+
+
+def _transaction_totals_add(row: str) -> str:
+    """Прибавляет amount строки transactions (new/old) к ее итогу"""
+    return (
+        "INSERT INTO transaction_totals (user_id, transaction_type, total) "
+        f"VALUES ({row}.user_id, {row}.transaction_type, {row}.amount) "
+        "ON CONFLICT (user_id, transaction_type) DO UPDATE SET total = transaction_totals.total + excluded.total"
+    )
+
+
+def _transaction_totals_subtract(row: str) -> str:
+    """Вычитает amount строки transactions (new/old) из ее итога"""
+    return (
+        f"UPDATE transaction_totals SET total = total - {row}.amount "
+        f"WHERE user_id = {row}.user_id AND transaction_type = {row}.transaction_type"
+    )
+
+
+TRANSACTION_TOTALS_TRIGGERS_DDL = {
+    "sqlite": [
+        "CREATE TRIGGER IF NOT EXISTS transaction_totals_ai AFTER INSERT ON transactions BEGIN "
+        + _transaction_totals_add("new") + "; END",
+        "CREATE TRIGGER IF NOT EXISTS transaction_totals_ad AFTER DELETE ON transactions BEGIN "
+        + _transaction_totals_subtract("old") + "; END",
+        "CREATE TRIGGER IF NOT EXISTS transaction_totals_au "
+        "AFTER UPDATE OF user_id, amount, transaction_type ON transactions BEGIN "
+        + _transaction_totals_subtract("old") + "; " + _transaction_totals_add("new") + "; END",
+    ],
+    "postgresql": [
+        "CREATE OR REPLACE FUNCTION transaction_totals_trigger() RETURNS trigger AS $$ BEGIN "
+        "IF TG_OP IN ('DELETE', 'UPDATE') THEN " + _transaction_totals_subtract("OLD") + "; END IF; "
+        "IF TG_OP IN ('INSERT', 'UPDATE') THEN " + _transaction_totals_add("NEW") + "; END IF; "
+        "RETURN NULL; END; $$ LANGUAGE plpgsql",
+        "DROP TRIGGER IF EXISTS transaction_totals ON transactions",
+        "CREATE TRIGGER transaction_totals AFTER INSERT OR DELETE OR UPDATE OF user_id, amount, transaction_type "
+        "ON transactions FOR EACH ROW EXECUTE FUNCTION transaction_totals_trigger()",
+    ],
+}
+
+
+@event.listens_for(Base.metadata, "after_create")
+def _create_transaction_totals_triggers(target, connection, tables=(), **kw):
+    """Триггеры ссылаются на transactions и transaction_totals"""
+    if TransactionTotal.__table__ in tables:
+        for statement in TRANSACTION_TOTALS_TRIGGERS_DDL.get(connection.dialect.name, []):
+            connection.execute(DDL(statement))
 
 
 class SystemSettings(Base):
@@ -64,6 +334,46 @@ class SystemSettings(Base):
     updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now())
 
 
+class TelegramFile(Base):
+    """
+    file_id, выданный Telegram после первой загрузки файла ботом.
+    Одна запись на файл (kind + owner); fingerprint - версия содержимого,
+    при ее изменении файл загружается заново
+    """
+    __tablename__ = "telegram_files"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    kind = Column(String(20), nullable=False)
+    owner = Column(String(255), nullable=False)
+    fingerprint = Column(String(64), nullable=False)
+    file_id = Column(String(255), nullable=False)
+    updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now())
+    
+    __table_args__ = (
+        Index("ix_telegram_files_owner", "kind", "owner", unique=True),
+    )
+
+
+class FsmState(Base):
+    """
+    Состояние FSM бота (aiogram) для ключа бот/чат/пользователь.
+    Общая таблица позволяет нескольким процессам бота вести один диалог;
+    записи с истекшим expires_at считаются отсутствующими и удаляются планировщиком
+    """
+    __tablename__ = "fsm_states"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    key = Column(String(255), nullable=False, unique=True)
+    state = Column(String(255), nullable=True)
+    data = Column(Text, nullable=True)
+    expires_at = Column(DateTime, nullable=True)
+    updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now())
+    
+    __table_args__ = (
+        Index("ix_fsm_states_expires_at", "expires_at"),
+    )
+
+
 class Server(Base):
     __tablename__ = "servers"
     
@@ -1,111 +1,157 @@
+import asyncio
 import logging
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.cron import CronTrigger
-from datetime import date, timedelta
-from sqlalchemy.orm import Session
-from app.database import SessionLocal
-from app.models import User, Notification
+from datetime import date
+from app.database import AsyncSessionLocal, engine
 from app.services.billing import (
-    get_users_for_billing,
-    process_billing,
-    check_upcoming_billing,
+    process_billing_bulk,
+    get_billing_reminders,
     get_subscription_price
 )
-from app.services.notifications import create_notification, mark_notification_sent
+from app.services.notifications import suppress_recipients
+from app.services.outbox import get_outbox_dispatcher
+from app.services.delivery import get_delivery_pool, wait_deliveries, is_unreachable_error
+from app.services.digest import build_billing_digest
+from app.services.statistics import recompute_statistics, fold_stats_deltas
+from app.services.fsm_states import delete_expired_fsm_states
 from app.config import settings
 from aiogram import Bot
-from typing import Optional
+from aiogram.methods import SendDocument
+from aiogram.types import BufferedInputFile
+from typing import List, Tuple
 
 logger = logging.getLogger(__name__)
 scheduler = AsyncIOScheduler()
 
 
-async def send_notification(bot: Bot, telegram_id: int, message: str):
-    """Отправляет уведомление пользователю"""
-    try:
-        await bot.send_message(telegram_id, message)
-        logger.info(f"Уведомление отправлено пользователю {telegram_id}")
-    except Exception as e:
-        logger.error(f"Ошибка отправки уведомления пользователю {telegram_id}: {e}")
+async def send_notification(bot: Bot, telegram_id: int, message: str) -> asyncio.Future:
+    """Ставит уведомление пользователю в очередь пула доставки"""
+    return await get_delivery_pool(bot).send_message(telegram_id, message)
+
+
+async def finish_deliveries(deliveries: List[Tuple[int, asyncio.Future]]) -> list:
+    """
+    Ждет отправки пачки сообщений и подавляет получателей,
+    которые заблокировали бота или не существуют
+    """
+    results = await wait_deliveries(future for _, future in deliveries)
+    unreachable = {
+        telegram_id
+        for (telegram_id, _), result in zip(deliveries, results)
+        if isinstance(result, Exception) and is_unreachable_error(result)
+    }
+    if unreachable:
+        async with AsyncSessionLocal() as db:
+            await db.run_sync(suppress_recipients, unreachable)
+            await db.commit()
+        logger.info(f"Подавлено недоступных получателей: {len(unreachable)}")
+    return results
+
+
+async def send_billing_digest(bot: Bot, outcomes: list, billing_date: date) -> List[Tuple[int, asyncio.Future]]:
+    """Ставит в очередь сводку биллинга (и CSV должников) каждому админу"""
+    text, debtors_csv = build_billing_digest(outcomes, billing_date)
+    pool = get_delivery_pool(bot)
+    deliveries = []
+    for admin_id in settings.admin_ids_list:
+        deliveries.append((admin_id, await pool.send_message(admin_id, text, parse_mode="HTML")))
+        if debtors_csv:
+            document = BufferedInputFile(debtors_csv, filename=f"debtors_{billing_date.isoformat()}.csv")
+            deliveries.append((admin_id, await pool.submit(SendDocument(chat_id=admin_id, document=document))))
+    return deliveries
 
 
 async def daily_billing(bot: Bot):
     """Ежедневное списание средств"""
     logger.info("Запуск ежедневного биллинга")
-    db = SessionLocal()
-    try:
-        today = date.today()
-        users = get_users_for_billing(db, today)
+    today = date.today()
+    async with AsyncSessionLocal() as db:
+        outcomes = await db.run_sync(process_billing_bulk, today)
+        # Сверяем счетчики stats с таблицей (накопленная погрешность суммы балансов)
+        await db.run_sync(recompute_statistics)
+    
+    logger.info(f"Обработано {len(outcomes)} пользователей для списания")
+    
+    deliveries = []
+    for outcome in outcomes:
+        # Должникам, которые уже получили уведомление в прошлые дни, повторно не пишем
+        if not outcome.success and outcome.already_in_debt:
+            continue
+        
+        # Пользователям, заблокировавшим бота, не пишем
+        reachable = outcome.telegram_id and not outcome.bot_blocked
         
-        logger.info(f"Найдено {len(users)} пользователей для списания")
+        # Отправляем уведомление пользователю
+        if reachable:
+            deliveries.append((outcome.telegram_id, await send_notification(bot, outcome.telegram_id, outcome.message)))
         
-        for user in users:
-            success, message = process_billing(db, user)
-            
-            # Отправляем уведомление пользователю
-            if user.telegram_id:
-                await send_notification(bot, user.telegram_id, message)
-            
-            # Уведомляем пользователя об отрицательном балансе, если настройка включена
-            if not success and user.telegram_id and user.enable_negative_balance_notifications:
-                negative_balance_message = (
-                    f"⚠️ Ваш баланс отрицательный или недостаточен для оплаты подписки. "
-                    f"Текущий баланс: {user.balance:.2f} ₽. "
-                    f"Пожалуйста, пополните баланс для продолжения работы VPN."
-                )
-                await send_notification(bot, user.telegram_id, negative_balance_message)
-            
-            # Уведомляем админов о должниках
-            if not success and user.telegram_id:
-                admin_message = (
-                    f"⚠️ Должник: @{user.telegram_id} ({user.name}). "
-                    f"Оплата не прошла. Необходимо отключить ключ вручную!"
-                )
-                for admin_id in settings.admin_ids_list:
-                    await send_notification(bot, admin_id, admin_message)
-    finally:
-        db.close()
+        # Уведомляем пользователя об отрицательном балансе, если настройка включена
+        if not outcome.success and reachable and outcome.enable_negative_balance_notifications:
+            negative_balance_message = (
+                f"⚠️ Ваш баланс отрицательный или недостаточен для оплаты подписки. "
+                f"Текущий баланс: {outcome.balance:.2f} ₽. "
+                f"Пожалуйста, пополните баланс для продолжения работы VPN."
+            )
+            deliveries.append((outcome.telegram_id, await send_notification(bot, outcome.telegram_id, negative_balance_message)))
+        
+        # Уведомляем админов о должниках (если сводка отключена)
+        if not outcome.success and outcome.telegram_id and not settings.admin_billing_digest:
+            admin_message = (
+                f"⚠️ Должник: @{outcome.telegram_id} ({outcome.name}). "
+                f"Оплата не прошла. Необходимо отключить ключ вручную!"
+            )
+            for admin_id in settings.admin_ids_list:
+                deliveries.append((admin_id, await send_notification(bot, admin_id, admin_message)))
+    
+    # Одна сводка на админа вместо сообщения на каждого должника
+    if settings.admin_billing_digest and outcomes:
+        deliveries.extend(await send_billing_digest(bot, outcomes, today))
+    
+    await finish_deliveries(deliveries)
+    logger.info(f"Уведомления биллинга отправлены: {get_delivery_pool(bot).stats()}")
 
 
 async def check_upcoming_billings(bot: Bot):
-    """Проверка предстоящих списаний (за 2 дня)"""
+    """Проверка предстоящих списаний (за notify_before_billing_days дней для каждого пользователя)"""
     logger.info("Проверка предстоящих списаний")
-    db = SessionLocal()
-    try:
-        price = get_subscription_price(db)
-        users = check_upcoming_billing(db, days_before=2)
-        
-        for user in users:
-            # Проверяем настройку уведомлений пользователя
-            if user.telegram_id and user.enable_billing_notifications:
-                # Используем настройку пользователя для количества дней
-                days_before = user.notify_before_billing_days if user.notify_before_billing_days else 2
-                message = (
-                    f"⏰ Напоминание: через {days_before} дн. списание {price:.2f} ₽, "
-                    f"на счету не хватает средств. Текущий баланс: {user.balance:.2f} ₽"
-                )
-                await send_notification(bot, user.telegram_id, message)
-    finally:
-        db.close()
+    async with AsyncSessionLocal() as db:
+        price = await db.run_sync(get_subscription_price)
+        reminders = await db.run_sync(get_billing_reminders, date.today())
+    logger.info(f"Найдено {len(reminders)} пользователей для напоминания")
+    
+    deliveries = []
+    for reminder in reminders:
+        message = (
+            f"⏰ Напоминание: через {reminder.notify_before_billing_days} дн. списание {price:.2f} ₽, "
+            f"на счету не хватает средств. Текущий баланс: {reminder.balance:.2f} ₽"
+        )
+        deliveries.append((reminder.telegram_id, await send_notification(bot, reminder.telegram_id, message)))
+    
+    await finish_deliveries(deliveries)
 
 
 async def send_pending_notifications(bot: Bot):
-    """Отправка неотправленных уведомлений"""
-    db = SessionLocal()
-    try:
-        from app.services.notifications import get_pending_notifications
-        notifications = get_pending_notifications(db)
-        
-        for notification in notifications:
-            user = db.query(User).filter(User.id == notification.user_id).first()
-            if user and user.telegram_id:
-                try:
-                    await send_notification(bot, user.telegram_id, notification.message)
-                    mark_notification_sent(db, notification.id)
-                except Exception as e:
-                    logger.error(f"Ошибка отправки уведомления {notification.id}: {e}")
-    finally:
-        db.close()
+    """Отправка неотправленных уведомлений (разовый проход по outbox)"""
+    sent = await get_outbox_dispatcher(bot).drain()
+    if sent:
+        logger.info(f"Отправлено уведомлений из очереди: {sent}")
+
+
+async def cleanup_fsm_states():
+    """Удаление истекших состояний FSM бота"""
+    async with AsyncSessionLocal() as db:
+        deleted = await db.run_sync(delete_expired_fsm_states)
+    if deleted:
+        logger.info(f"Удалено истекших состояний FSM: {deleted}")
+
+
+async def fold_statistics():
+    """Свертка накопленных изменений счетчиков в строку stats"""
+    async with AsyncSessionLocal() as db:
+        folded = await db.run_sync(fold_stats_deltas)
+    if folded:
+        logger.debug(f"Свернуто изменений статистики: {folded}")
 
 
 def start_scheduler(bot: Bot):
@@ -128,15 +174,35 @@ def start_scheduler(bot: Bot):
         replace_existing=True
     )
     
-    # Отправка уведомлений каждые 5 минут
-    scheduler.add_job(
-        send_pending_notifications,
-        CronTrigger(minute="*/5"),
-        args=[bot],
-        id="send_notifications",
-        replace_existing=True
-    )
+    # Очистка истекших состояний FSM раз в час
+    if settings.fsm_storage == "database":
+        scheduler.add_job(
+            cleanup_fsm_states,
+            CronTrigger(minute=30),
+            id="cleanup_fsm_states",
+            replace_existing=True
+        )
+    
+    # Свертка изменений статистики каждые 5 минут (PostgreSQL пишет их в stats_deltas)
+    if engine.dialect.name == "postgresql":
+        scheduler.add_job(
+            fold_statistics,
+            CronTrigger(minute="*/5"),
+            id="fold_statistics",
+            replace_existing=True
+        )
+    
+    # Отправка уведомлений: диспетчер outbox просыпается при создании уведомления,
+    # а периодический опрос остается запасным вариантом
+    get_outbox_dispatcher(bot).start()
     
     scheduler.start()
     logger.info("Планировщик задач настроен и запущен")
 
+
+async def stop_scheduler(bot: Bot):
+    """Останавливает планировщик и диспетчер outbox, запущенные start_scheduler"""
+    if scheduler.running:
+        scheduler.shutdown(wait=False)
+    await get_outbox_dispatcher(bot).stop()
+    logger.info("Планировщик задач остановлен")
@@ -1,5 +1,5 @@
-from pydantic import BaseModel, EmailStr
-from typing import Optional
+from pydantic import BaseModel, EmailStr, field_validator
+from typing import Dict, List, Optional
 from datetime import date, datetime
 
 
@@ -51,6 +51,53 @@ class UserResponse(UserBase):
         from_attributes = True
 
 
+class UserListItem(BaseModel):
+    """Строка списка пользователей в админке (без key_data)"""
+    id: int
+    name: str
+    telegram_id: Optional[int] = None
+    balance: float
+    next_billing_date: date
+    status: str
+    server_name: Optional[str] = None
+    certificates_count: int = 1
+    is_ghost: bool
+    enable_billing_notifications: bool
+    notify_before_billing_days: int
+    created_at: datetime
+    
+    @field_validator("balance", mode="before")
+    @classmethod
+    def balance_or_zero(cls, value):
+        """NULL-баланс отображается как 0 - так же, как сортируется список"""
+        return 0.0 if value is None else value
+    
+    class Config:
+        from_attributes = True
+
+
+class UserSearchResult(UserListItem):
+    match: str
+    score: float
+
+
+class UserPage(BaseModel):
+    items: List[UserListItem]
+    next_cursor: Optional[str] = None
+    # Итоги по фильтру заполняются только для первой страницы (без cursor)
+    total: Optional[int] = None
+    counts: Optional[Dict[str, int]] = None
+    total_balance: Optional[float] = None
+
+
+class DebtorsPage(BaseModel):
+    items: List[UserListItem]
+    next_cursor: Optional[str] = None
+    # Число должников и сумма, которой не хватает до оплаты (кэш, только на первой странице)
+    count: Optional[int] = None
+    total_debt: Optional[float] = None
+
+
 # Transaction Schemas
 class TransactionCreate(BaseModel):
     user_id: int
@@ -71,11 +118,33 @@ class TransactionResponse(BaseModel):
         from_attributes = True
 
 
+class TransactionHistoryItem(TransactionResponse):
+    running_total: float
+
+
+class TransactionPage(BaseModel):
+    items: List[TransactionHistoryItem]
+    next_cursor: Optional[str] = None
+    # Сумма по фильтру заполняется только для первой страницы (без cursor)
+    total_amount: Optional[float] = None
+
+
 # CSV Import Schema
-class CSVImportResponse(BaseModel):
+class ImportJobResponse(BaseModel):
+    id: str
+    filename: Optional[str] = None
+    status: str
+    total_rows: Optional[int] = None
+    processed_rows: int
     imported: int
-    errors: list
     ghost_users: int
+    error_count: int
+    errors: list
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    
+    class Config:
+        from_attributes = True
 
 
 # Admin Schemas
@@ -96,6 +165,46 @@ class UserMapping(BaseModel):
     telegram_id: int
 
 
+class BulkUserFilters(BaseModel):
+    status: Optional[str] = None
+    server_name: Optional[str] = None
+    is_ghost: Optional[bool] = None
+    min_balance: Optional[float] = None
+    max_balance: Optional[float] = None
+    q: Optional[str] = None
+
+
+class BulkOperationRequest(BaseModel):
+    # Пользователи: список ID или фильтр как у списка /users
+    user_ids: Optional[List[int]] = None
+    filters: Optional[BulkUserFilters] = None
+    status: Optional[str] = None
+    balance_delta: Optional[float] = None
+    description: Optional[str] = None
+    # Пустая строка снимает сервер
+    server_name: Optional[str] = None
+    mappings: Optional[List[UserMapping]] = None
+
+
+class BulkItemResult(BaseModel):
+    user_id: int
+    success: bool
+    error: Optional[str] = None
+    telegram_id: Optional[int] = None
+    status: Optional[str] = None
+    balance: Optional[float] = None
+    server_name: Optional[str] = None
+    
+    class Config:
+        from_attributes = True
+
+
+class BulkOperationResponse(BaseModel):
+    updated: int
+    failed: int
+    results: List[BulkItemResult]
+
+
 # Settings
 class SettingsUpdate(BaseModel):
     subscription_price: float
@@ -112,6 +221,55 @@ class SendNotificationRequest(BaseModel):
     message: str
 
 
+class BroadcastCreate(BaseModel):
+    message: str
+    # all, debtors, server или status; для server и status - значение в segment_value
+    segment: str = "all"
+    segment_value: Optional[str] = None
+
+
+class CampaignResponse(BaseModel):
+    id: int
+    message: str
+    segment: str
+    segment_value: Optional[str]
+    total_recipients: int
+    created_at: Optional[datetime]
+    # sending, пока остались неотправленные уведомления, затем done
+    status: str
+    sent: int = 0
+    pending: int = 0
+    failed: int = 0
+    cancelled: int = 0
+
+
+class NotificationResponse(BaseModel):
+    id: int
+    user_id: int
+    message: str
+    notification_type: str
+    status: str
+    attempts: int
+    last_error: Optional[str]
+    next_attempt_at: Optional[datetime]
+    sent_at: Optional[datetime]
+    created_at: datetime
+    
+    class Config:
+        from_attributes = True
+
+
+class StatisticsResponse(BaseModel):
+    total_users: int
+    active_users: int
+    debt_users: int
+    blocked_users: int
+    ghost_users: int
+    total_balance: float
+    subscription_price: float
+    updated_at: Optional[datetime] = None
+
+
 class ServerCreate(BaseModel):
     name: str
     ip_address: str
@@ -1,151 +1,305 @@
+from sqlalchemy import select, update, insert, literal_column, Date, Integer, func, or_, and_
 from sqlalchemy.orm import Session
-from datetime import date, timedelta
-from app.models import User, Transaction, SystemSettings
+from dataclasses import dataclass
+from datetime import date
+from app.models import User, Transaction, REMINDER_DATE_SQL, REMINDER_DAYS_SQL
+from app.services.system_settings import get_system_setting, get_system_settings, set_system_settings
+from app.services.user_queries import encode_cursor, decode_cursor
+from app.services.cache import TTLCache
 from app.config import settings
-from typing import List, Tuple
+from typing import List, Tuple, Optional
+import calendar
+
+
+# Число должников и сумма долга по цене подписки; сбрасывается после биллинга
+_debtors_summary_cache = TTLCache(ttl=settings.debtors_summary_cache_ttl, maxsize=4)
+
+
+@dataclass
+class BillingOutcome:
+    """Результат списания для одного пользователя"""
+    user_id: int
+    telegram_id: Optional[int]
+    name: str
+    success: bool
+    balance: float
+    next_billing_date: date
+    message: str
+    enable_negative_balance_notifications: bool
+    bot_blocked: bool = False
+    amount: float = 0.0
+    already_in_debt: bool = False
 
 
 def get_subscription_price(db: Session) -> float:
     """Получает цену подписки из настроек"""
-    setting = db.query(SystemSettings).filter(SystemSettings.key == "subscription_price").first()
-    if setting:
-        return float(setting.value)
+    value = get_system_setting(db, "subscription_price")
+    if value is not None:
+        return float(value)
     return settings.default_subscription_price
 
 
 def set_subscription_price(db: Session, price: float):
     """Устанавливает цену подписки"""
-    setting = db.query(SystemSettings).filter(SystemSettings.key == "subscription_price").first()
-    if setting:
-        setting.value = str(price)
-    else:
-        setting = SystemSettings(key="subscription_price", value=str(price))
-        db.add(setting)
-    db.commit()
-
-
-def get_users_for_billing(db: Session, billing_date: date) -> List[User]:
-    """Получает список пользователей, у которых сегодня день списания"""
-    return db.query(User).filter(
-        User.next_billing_date == billing_date,
-        User.status != "blocked"
-    ).all()
+    set_system_settings(db, {"subscription_price": str(price)})
+
+
+def get_user_ids_for_billing(db: Session, billing_date: date) -> List[int]:
+    """
+    Получает ID пользователей с наступившим днем списания, от самых старых дат.
+    Читает только индекс ix_users_billing
+    """
+    return list(db.execute(
+        select(User.id)
+        .where(User.next_billing_date <= billing_date, User.status != "blocked")
+        .order_by(User.next_billing_date, User.id)
+    ).scalars())
+
+
+def add_month(value: date) -> date:
+    """Сдвигает дату на месяц (для коротких месяцев берется последний день)"""
+    year = value.year + value.month // 12
+    month = value.month % 12 + 1
+    day = min(value.day, calendar.monthrange(year, month)[1])
+    return date(year, month, day)
+
 
+def _success_message(next_date: date) -> str:
+    return f"✅ Оплата VPN прошла успешно. Доступ продлен до {next_date.strftime('%d.%m.%Y')}"
 
-def process_billing(db: Session, user: User) -> Tuple[bool, str]:
+
+def _debt_message() -> str:
+    return f"❌ Недостаточно средств. Доступ будет приостановлен. Пополните баланс."
+
+
+def process_billing_bulk(
+    db: Session,
+    billing_date: date,
+    chunk_size: Optional[int] = None
+) -> List[BillingOutcome]:
     """
-    Обрабатывает списание для пользователя
-    Returns: (success, message)
+    Массовое списание: обрабатываются все пользователи с next_billing_date <= billing_date,
+    поэтому после простоя бота пропущенные дни догоняются, а не теряются.
+    Пачки идут по возрастанию даты; списание - UPDATE ... RETURNING на каждую
+    дату списания в пачке, транзакции пишутся только для строк, которые UPDATE
+    действительно изменил. Условие на прежнюю дату и баланс делает повторный
+    или параллельный запуск безопасным и без блокировок строк (SQLite)
+    Returns: список результатов по каждому пользователю
     """
     price = get_subscription_price(db)
+    chunk_size = chunk_size or settings.billing_chunk_size
+    users_table = User.__table__
+    outcomes = []
     
-    if user.balance >= price:
-        # Сценарий А: Денег хватает
-        user.balance -= price
+    user_ids = get_user_ids_for_billing(db, billing_date)
+    
+    for start in range(0, len(user_ids), chunk_size):
+        chunk_ids = user_ids[start:start + chunk_size]
         
-        # Создаем транзакцию
-        transaction = Transaction(
-            user_id=user.id,
-            amount=-price,
-            transaction_type="withdrawal",
-            description=f"Ежемесячная оплата VPN подписки"
-        )
-        db.add(transaction)
+        # Блокируем пачку (на PostgreSQL), чтобы параллельные изменения баланса не потерялись
+        rows = db.execute(
+            select(
+                User.id,
+                User.telegram_id,
+                User.name,
+                User.balance,
+                User.status,
+                User.next_billing_date,
+                User.enable_negative_balance_notifications,
+                User.bot_blocked
+            )
+            .where(
+                User.id.in_(chunk_ids),
+                User.next_billing_date <= billing_date,
+                User.status != "blocked"
+            )
+            .order_by(User.next_billing_date, User.id)
+            .with_for_update()
+        ).all()
         
-        # Сдвигаем дату следующего списания на месяц
-        next_date = user.next_billing_date
-        if next_date.month == 12:
-            next_date = date(next_date.year + 1, 1, next_date.day)
-        else:
-            next_date = date(next_date.year, next_date.month + 1, next_date.day)
+        if not rows:
+            continue
         
-        user.next_billing_date = next_date
-        user.status = "active"
+        # Сценарий А: денег хватает - списываем одним UPDATE на каждую прежнюю дату списания
+        by_date = {}
+        for row in rows:
+            if (row.balance or 0.0) >= price:
+                by_date.setdefault(row.next_billing_date, []).append(row.id)
         
-        db.commit()
+        charged = {}
+        for billing_day, ids in by_date.items():
+            next_date = add_month(billing_day)
+            for charged_id, balance in db.execute(
+                update(users_table)
+                .where(
+                    users_table.c.id.in_(ids),
+                    users_table.c.next_billing_date == billing_day,
+                    users_table.c.balance >= price,
+                    users_table.c.status != "blocked"
+                )
+                .values(balance=users_table.c.balance - price, next_billing_date=next_date, status="active")
+                .returning(users_table.c.id, users_table.c.balance)
+            ):
+                charged[charged_id] = (balance, next_date)
         
-        return True, f"✅ Оплата VPN прошла успешно. Доступ продлен до {next_date.strftime('%d.%m.%Y')}"
-    
-    else:
-        # Сценарий Б: Денег мало
-        user.status = "debt"
+        # Сценарий Б: денег мало, в том числе у тех, чей баланс изменился после чтения.
+        # Пользователи, уже списанные другим запуском (дата сдвинута), сюда не попадают
+        candidate_ids = [row.id for row in rows if row.id not in charged]
+        debtors = {}
+        if candidate_ids:
+            debtors = dict(db.execute(
+                update(users_table)
+                .where(
+                    users_table.c.id.in_(candidate_ids),
+                    users_table.c.next_billing_date <= billing_date,
+                    func.coalesce(users_table.c.balance, 0.0) < price,
+                    users_table.c.status != "blocked"
+                )
+                .values(status="debt")
+                .returning(users_table.c.id, users_table.c.balance)
+            ).all())
+        
+        if charged:
+            db.execute(insert(Transaction), [
+                {
+                    "user_id": user_id,
+                    "amount": -price,
+                    "transaction_type": "withdrawal",
+                    "description": "Ежемесячная оплата VPN подписки"
+                }
+                for user_id in charged
+            ])
         db.commit()
         
-        return False, f"❌ Недостаточно средств. Доступ будет приостановлен. Пополните баланс."
+        for row in rows:
+            if row.id in charged:
+                balance, next_date = charged[row.id]
+                outcomes.append(BillingOutcome(
+                    user_id=row.id,
+                    telegram_id=row.telegram_id,
+                    name=row.name,
+                    success=True,
+                    balance=balance,
+                    next_billing_date=next_date,
+                    message=_success_message(next_date),
+                    enable_negative_balance_notifications=bool(row.enable_negative_balance_notifications),
+                    bot_blocked=bool(row.bot_blocked),
+                    amount=price
+                ))
+            elif row.id in debtors:
+                outcomes.append(BillingOutcome(
+                    user_id=row.id,
+                    telegram_id=row.telegram_id,
+                    name=row.name,
+                    success=False,
+                    balance=debtors[row.id] or 0.0,
+                    next_billing_date=row.next_billing_date,
+                    message=_debt_message(),
+                    enable_negative_balance_notifications=bool(row.enable_negative_balance_notifications),
+                    bot_blocked=bool(row.bot_blocked),
+                    already_in_debt=row.status == "debt"
+                ))
+    
+    invalidate_debtors_summary()
+    return outcomes
 
 
-def get_debtors(db: Session) -> List[User]:
-    """Получает список должников (пользователи с отрицательным балансом или балансом меньше цены подписки)"""
+def get_debtors(
+    db: Session,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None
+) -> Tuple[List[User], Optional[str]]:
+    """
+    Должники (баланс меньше цены подписки, без спящих профилей) по возрастанию баланса.
+    Страницы по (balance, id) читаются из индекса ix_users_debtors
+    Returns: (пользователи, курсор следующей страницы или None)
+    """
     price = get_subscription_price(db)
-    return db.query(User).filter(
-        User.balance < price,
-        User.is_ghost == False  # Исключаем спящие профили
-    ).order_by(User.balance.asc()).all()  # Сортируем по балансу (от меньшего к большему)
+    query = select(User).where(User.is_ghost == False, User.balance < price)
+    if cursor:
+        balance, last_id = decode_cursor(cursor, "balance")
+        query = query.where(or_(User.balance > balance, and_(User.balance == balance, User.id > last_id)))
+    query = query.order_by(User.balance.asc(), User.id.asc())
+    if limit is None:
+        return db.execute(query).scalars().all(), None
+    
+    users = db.execute(query.limit(limit + 1)).scalars().all()
+    next_cursor = None
+    if len(users) > limit:
+        users = users[:limit]
+        next_cursor = encode_cursor(users[-1].balance, users[-1].id)
+    return users, next_cursor
 
 
-def check_upcoming_billing(db: Session, days_before: int = 2) -> List[User]:
-    """Проверяет пользователей, у которых скоро списание и недостаточно средств"""
-    today = date.today()
-    check_date = today + timedelta(days=days_before)
+def get_debtors_summary(db: Session) -> dict:
+    """
+    Число должников и сумма, которой им не хватает до оплаты подписки.
+    Кэшируется на debtors_summary_cache_ttl секунд
+    """
     price = get_subscription_price(db)
     
-    users = db.query(User).filter(
-        User.next_billing_date == check_date,
-        User.balance < price,
-        User.status != "blocked"
-    ).all()
+    def load() -> dict:
+        count, shortfall = db.execute(
+            select(func.count(User.id), func.coalesce(func.sum(price - User.balance), 0.0))
+            .where(User.is_ghost == False, User.balance < price)
+        ).one()
+        return {"count": count, "total_debt": round(float(shortfall), 2)}
     
-    return users
+    return _debtors_summary_cache.get_or_load(price, load)
+
+
+def invalidate_debtors_summary():
+    _debtors_summary_cache.clear()
+
+
+def reminder_date_expr(db: Session):
+    """Выражение next_billing_date - дни напоминания (по умолчанию 2) для текущей БД"""
+    dialect = db.get_bind().dialect.name
+    return literal_column(REMINDER_DATE_SQL.get(dialect, REMINDER_DATE_SQL["postgresql"]), type_=Date)
+
+
+def get_billing_reminders(db: Session, today: Optional[date] = None) -> list:
+    """
+    Пользователи, которым сегодня нужно напомнить о списании с учетом их
+    notify_before_billing_days (0 или NULL - за 2 дня). Вся фильтрация выполняется
+    одним запросом по индексу ix_users_reminder_date
+    Returns: строки (id, telegram_id, balance, notify_before_billing_days)
+    """
+    today = today or date.today()
+    price = get_subscription_price(db)
+    return db.execute(
+        select(
+            User.id, User.telegram_id, User.balance,
+            literal_column(REMINDER_DAYS_SQL, type_=Integer).label("notify_before_billing_days")
+        )
+        .where(
+            reminder_date_expr(db) == today,
+            User.enable_billing_notifications == True,
+            User.balance < price,
+            User.status != "blocked",
+            User.telegram_id.isnot(None),
+            User.bot_blocked.isnot(True)
+        )
+    ).all()
 
 
 def get_sbp_info(db: Session) -> dict:
     """Получает информацию о СБП для оплаты"""
-    settings = {
-        'phone': None,
-        'account': None,
-        'qr_code_path': None
+    values = get_system_settings(db)
+    return {
+        'phone': values.get("sbp_phone"),
+        'account': values.get("sbp_account"),
+        'qr_code_path': values.get("sbp_qr_code_path")
     }
-    
-    phone_setting = db.query(SystemSettings).filter(SystemSettings.key == "sbp_phone").first()
-    if phone_setting:
-        settings['phone'] = phone_setting.value
-    
-    account_setting = db.query(SystemSettings).filter(SystemSettings.key == "sbp_account").first()
-    if account_setting:
-        settings['account'] = account_setting.value
-    
-    qr_setting = db.query(SystemSettings).filter(SystemSettings.key == "sbp_qr_code_path").first()
-    if qr_setting:
-        settings['qr_code_path'] = qr_setting.value
-    
-    return settings
 
 
 def set_sbp_info(db: Session, phone: str = None, account: str = None, qr_code_path: str = None):
     """Устанавливает информацию о СБП"""
+    values = {}
     if phone:
-        setting = db.query(SystemSettings).filter(SystemSettings.key == "sbp_phone").first()
-        if setting:
-            setting.value = phone
-        else:
-            setting = SystemSettings(key="sbp_phone", value=phone)
-            db.add(setting)
-    
+        values["sbp_phone"] = phone
     if account:
-        setting = db.query(SystemSettings).filter(SystemSettings.key == "sbp_account").first()
-        if setting:
-            setting.value = account
-        else:
-            setting = SystemSettings(key="sbp_account", value=account)
-            db.add(setting)
-    
+        values["sbp_account"] = account
     if qr_code_path:
-        setting = db.query(SystemSettings).filter(SystemSettings.key == "sbp_qr_code_path").first()
-        if setting:
-            setting.value = qr_code_path
-        else:
-            setting = SystemSettings(key="sbp_qr_code_path", value=qr_code_path)
-            db.add(setting)
-    
-    db.commit()
-
+        values["sbp_qr_code_path"] = qr_code_path
+    set_system_settings(db, values)
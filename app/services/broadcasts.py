@@ -0,0 +1,114 @@
+from sqlalchemy import select, update, func
+from sqlalchemy.orm import Session
+from sqlalchemy.sql import Select
+from app.models import Campaign, Notification, User
+from app.services.bulk_operations import USER_STATUSES
+from app.services.notifications import enqueue_notifications, wake_outbox_listeners
+from typing import Dict, List, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Сегменты рассылки; для server и status значение передается в segment_value
+SEGMENTS = ("all", "debtors", "server", "status")
+
+# Ограничение Telegram на длину текста сообщения
+MAX_MESSAGE_LENGTH = 4096
+
+
+def segment_recipients(segment: str, segment_value: Optional[str] = None) -> Select:
+    """
+    select(User.id) получателей сегмента. Спящие профили, пользователи без
+    Telegram ID и заблокировавшие бота не включаются.
+    ValueError, если сегмент задан неверно
+    """
+    query = select(User.id).where(
+        User.is_ghost.isnot(True),
+        User.telegram_id.isnot(None),
+        User.bot_blocked.isnot(True)
+    )
+    if segment == "all":
+        return query
+    if segment == "debtors":
+        return query.where(User.status == "debt")
+    if segment == "server":
+        if not segment_value:
+            raise ValueError("Не указан сервер")
+        return query.where(User.server_name == segment_value)
+    if segment == "status":
+        if segment_value not in USER_STATUSES:
+            raise ValueError(f"Неизвестный статус: {segment_value}")
+        return query.where(User.status == segment_value)
+    raise ValueError(f"Неизвестный сегмент: {segment}")
+
+
+def count_recipients(db: Session, segment: str, segment_value: Optional[str] = None) -> int:
+    """Число получателей сегмента (предпросмотр перед запуском)"""
+    recipients = segment_recipients(segment, segment_value).subquery()
+    return db.scalar(select(func.count()).select_from(recipients))
+
+
+def create_campaign(
+    db: Session,
+    message: str,
+    segment: str,
+    segment_value: Optional[str] = None,
+    created_by: Optional[int] = None
+) -> Campaign:
+    """
+    Создает рассылку и ставит уведомления всем получателям одним INSERT ... SELECT.
+    Отправка идет через outbox-диспетчер с общим ограничением скорости
+    """
+    message = message.strip()
+    if not message:
+        raise ValueError("Текст рассылки пуст")
+    if len(message) > MAX_MESSAGE_LENGTH:
+        raise ValueError(f"Текст длиннее {MAX_MESSAGE_LENGTH} символов")
+    recipients = segment_recipients(segment, segment_value)
+
+    campaign = Campaign(
+        message=message,
+        segment=segment,
+        segment_value=segment_value if segment in ("server", "status") else None,
+        created_by=created_by
+    )
+    db.add(campaign)
+    db.flush()
+    campaign.total_recipients = enqueue_notifications(db, recipients, message, "broadcast", campaign.id)
+    db.commit()
+    wake_outbox_listeners()
+    logger.info(f"Рассылка {campaign.id} ({segment}): {campaign.total_recipients} получателей")
+    return campaign
+
+
+def cancel_campaign(db: Session, campaign_id: int) -> int:
+    """Отменяет еще не отправленные уведомления рассылки; возвращает их число"""
+    result = db.execute(
+        update(Notification)
+        .where(Notification.campaign_id == campaign_id, Notification.status == "pending")
+        .values(status="cancelled", claimed_by=None, claimed_until=None)
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+    return result.rowcount
+
+
+def campaign_progress(db: Session, campaign_ids: List[int]) -> Dict[int, Dict[str, int]]:
+    """Число уведомлений рассылок по статусам одним запросом (индекс ix_notifications_campaign)"""
+    progress = {campaign_id: {} for campaign_id in campaign_ids}
+    if not campaign_ids:
+        return progress
+    rows = db.execute(
+        select(Notification.campaign_id, Notification.status, func.count())
+        .where(Notification.campaign_id.in_(campaign_ids))
+        .group_by(Notification.campaign_id, Notification.status)
+    ).all()
+    for campaign_id, status, count in rows:
+        progress[campaign_id][status] = count
+    return progress
+
+
+def list_campaigns(db: Session, limit: int = 20) -> List[Campaign]:
+    return db.execute(
+        select(Campaign).order_by(Campaign.id.desc()).limit(limit)
+    ).scalars().all()
@@ -0,0 +1,199 @@
+from dataclasses import dataclass
+from sqlalchemy import select, update, insert, bindparam, func
+from sqlalchemy.orm import Session
+from app.models import User, Transaction, Server
+from app.services.user_queries import UserFilters, apply_user_filters
+from app.config import settings
+from typing import Dict, List, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+USER_STATUSES = ("active", "debt", "blocked")
+
+# Размер списка ID в одном IN (...), чтобы не упираться в лимит параметров SQLite
+IN_CHUNK_SIZE = 500
+
+
+@dataclass
+class BulkItemResult:
+    user_id: int
+    success: bool
+    error: Optional[str] = None
+    telegram_id: Optional[int] = None
+    status: Optional[str] = None
+    balance: Optional[float] = None
+    server_name: Optional[str] = None
+
+
+def _chunks(ids: List[int]):
+    for start in range(0, len(ids), IN_CHUNK_SIZE):
+        yield ids[start:start + IN_CHUNK_SIZE]
+
+
+def _resolve_targets(
+    db: Session,
+    user_ids: Optional[List[int]],
+    filters: Optional[UserFilters],
+    results: Dict[int, BulkItemResult]
+) -> List[int]:
+    """
+    ID пользователей, к которым применяется операция: явный список или фильтр.
+    Строки блокируются до конца транзакции (на PostgreSQL)
+    """
+    limit = settings.bulk_operation_max_users
+    if user_ids:
+        requested = list(dict.fromkeys(user_ids))
+        if len(requested) > limit:
+            raise ValueError(f"Слишком много пользователей: {len(requested)}, максимум {limit}")
+        found = set()
+        for chunk in _chunks(requested):
+            found.update(db.execute(
+                select(User.id).where(User.id.in_(chunk)).with_for_update()
+            ).scalars())
+        for user_id in requested:
+            if user_id not in found:
+                results[user_id] = BulkItemResult(user_id, False, "Пользователь не найден")
+        return [user_id for user_id in requested if user_id in found]
+
+    if filters is not None:
+        ids = db.execute(
+            apply_user_filters(select(User.id), filters)
+            .order_by(User.id)
+            .limit(limit + 1)
+            .with_for_update()
+        ).scalars().all()
+        if len(ids) > limit:
+            raise ValueError(f"Фильтр выбирает больше {limit} пользователей, уточните условия")
+        return list(ids)
+
+    return []
+
+
+def _apply_mappings(db: Session, mappings: Dict[int, int], results: Dict[int, BulkItemResult]) -> List[int]:
+    """
+    Привязывает спящие профили к Telegram ID одним UPDATE (executemany).
+    Обычные профили, занятые и повторяющиеся Telegram ID отклоняются по отдельности
+    """
+    ghost_ids = list(mappings)
+    found = {}
+    for chunk in _chunks(ghost_ids):
+        found.update(db.execute(
+            select(User.id, User.is_ghost).where(User.id.in_(chunk)).with_for_update()
+        ).all())
+
+    telegram_ids = list(set(mappings.values()))
+    owners = {}
+    for chunk in _chunks(telegram_ids):
+        owners.update(db.execute(
+            select(User.telegram_id, User.id).where(User.telegram_id.in_(chunk))
+        ).all())
+
+    assigned: Dict[int, int] = {}
+    for ghost_id, telegram_id in mappings.items():
+        if ghost_id not in found:
+            results[ghost_id] = BulkItemResult(ghost_id, False, "Спящий профиль не найден")
+        elif not found[ghost_id]:
+            results[ghost_id] = BulkItemResult(ghost_id, False, "Профиль не спящий, Telegram ID не изменен")
+        elif owners.get(telegram_id, ghost_id) != ghost_id:
+            results[ghost_id] = BulkItemResult(ghost_id, False, f"Telegram ID {telegram_id} уже используется")
+        elif telegram_id in assigned:
+            results[ghost_id] = BulkItemResult(
+                ghost_id, False, f"Telegram ID {telegram_id} указан также для профиля {assigned[telegram_id]}"
+            )
+        else:
+            assigned[telegram_id] = ghost_id
+
+    if assigned:
+        users_table = User.__table__
+        db.execute(
+            update(users_table)
+            .where(users_table.c.id == bindparam("b_id"), users_table.c.is_ghost.is_(True))
+            .values(telegram_id=bindparam("b_telegram_id"), is_ghost=False),
+            [{"b_id": ghost_id, "b_telegram_id": telegram_id} for telegram_id, ghost_id in assigned.items()]
+        )
+    return list(assigned.values())
+
+
+def apply_bulk_operation(
+    db: Session,
+    user_ids: Optional[List[int]] = None,
+    filters: Optional[UserFilters] = None,
+    status: Optional[str] = None,
+    balance_delta: Optional[float] = None,
+    description: Optional[str] = None,
+    server_name: Optional[str] = None,
+    mappings: Optional[Dict[int, int]] = None
+) -> List[BulkItemResult]:
+    """
+    Массовое изменение пользователей, выбранных списком ID или фильтром:
+    статус, корректировка баланса (с транзакциями), сервер и привязка спящих
+    профилей. Каждое изменение - один UPDATE/INSERT на пачку ID, все вместе -
+    одна транзакция; ошибка БД откатывает всю операцию.
+    ValueError, если параметры операции некорректны
+    Returns: результат по каждому пользователю
+    """
+    if status is not None and status not in USER_STATUSES:
+        raise ValueError(f"Неизвестный статус: {status}")
+    if server_name and db.scalar(select(Server.id).where(Server.name == server_name)) is None:
+        raise ValueError(f"Сервер {server_name} не найден")
+    if status is None and not balance_delta and server_name is None and not mappings:
+        raise ValueError("Не указано ни одного изменения")
+
+    results: Dict[int, BulkItemResult] = {}
+    try:
+        target_ids = _resolve_targets(db, user_ids, filters, results)
+
+        values = {}
+        if status is not None:
+            values["status"] = status
+        if server_name is not None:
+            values["server_name"] = server_name or None
+        if balance_delta:
+            # NULL-баланс считается нулем, иначе транзакция есть, а баланс не изменился
+            values["balance"] = func.coalesce(User.balance, 0.0) + balance_delta
+
+        if target_ids and values:
+            for chunk in _chunks(target_ids):
+                db.execute(
+                    update(User).where(User.id.in_(chunk)).values(**values),
+                    execution_options={"synchronize_session": False}
+                )
+            if balance_delta:
+                db.execute(insert(Transaction), [
+                    {
+                        "user_id": user_id,
+                        "amount": balance_delta,
+                        "transaction_type": "adjustment",
+                        "description": description or "Массовая корректировка баланса"
+                    }
+                    for user_id in target_ids
+                ])
+
+        mapped_ids = _apply_mappings(db, mappings, results) if mappings else []
+
+        changed_ids = list(dict.fromkeys(target_ids + mapped_ids))
+        for chunk in _chunks(changed_ids):
+            rows = db.execute(
+                select(User.id, User.telegram_id, User.status, User.balance, User.server_name)
+                .where(User.id.in_(chunk))
+            ).all()
+            for row in rows:
+                # Ошибка привязки профиля важнее успешного изменения остальных полей
+                if row.id in results:
+                    continue
+                results[row.id] = BulkItemResult(
+                    row.id, True,
+                    telegram_id=row.telegram_id,
+                    status=row.status,
+                    balance=row.balance,
+                    server_name=row.server_name
+                )
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+
+    failed = sum(1 for result in results.values() if not result.success)
+    logger.info(f"Массовая операция: изменено {len(results) - failed}, ошибок {failed}")
+    return sorted(results.values(), key=lambda result: result.user_id)
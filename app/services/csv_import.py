@@ -1,108 +1,206 @@
 import csv
-import io
+import os
+import threading
+import uuid
+from dataclasses import dataclass, field
 from datetime import datetime
+from functools import lru_cache
+from sqlalchemy import select, insert
 from sqlalchemy.orm import Session
 from app.models import User
-from typing import List, Dict, Tuple
+from app.config import settings
+from typing import Iterable, List, Dict, Optional, Tuple
+import logging
 
+logger = logging.getLogger(__name__)
 
+
+@lru_cache(maxsize=4096)
 def parse_date(date_str: str) -> datetime.date:
-    """Парсит дату в формате ДД.ММ.ГГГГ"""
+    """Парсит дату в формате ДД.ММ.ГГГГ (в выгрузках даты повторяются, результат кэшируется)"""
     try:
         return datetime.strptime(date_str.strip(), "%d.%m.%Y").date()
     except ValueError:
         raise ValueError(f"Неверный формат даты: {date_str}. Ожидается ДД.ММ.ГГГГ")
 
 
-def import_csv(db: Session, csv_content: str) -> Tuple[int, List[Dict], int]:
+@dataclass
+class ImportJob:
+    """Состояние импорта CSV (фоновая задача или синхронный вызов)"""
+    id: str = field(default_factory=lambda: uuid.uuid4().hex)
+    filename: Optional[str] = None
+    status: str = "pending"
+    total_rows: Optional[int] = None
+    processed_rows: int = 0
+    imported: int = 0
+    ghost_users: int = 0
+    error_count: int = 0
+    errors: List[Dict] = field(default_factory=list)
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+    def add_error(self, row: int, field_name: str, error: str):
+        self.error_count += 1
+        if len(self.errors) < settings.csv_import_max_errors:
+            self.errors.append({'row': row, 'field': field_name, 'error': error})
+
+
+def _parse_row(job: ImportJob, row_num: int, row: Dict) -> Optional[Dict]:
+    """Проверяет строку CSV; возвращает значения для вставки или None с записью ошибки"""
+    telegram_id = None
+    if (row.get('telegram_id') or '').strip():
+        try:
+            telegram_id = int(row['telegram_id'].strip())
+        except ValueError:
+            job.add_error(row_num, 'telegram_id', f"Неверный формат telegram_id: {row['telegram_id']}")
+            return None
+
+    name = (row.get('name') or '').strip()
+    if not name:
+        job.add_error(row_num, 'name', 'Имя не может быть пустым')
+        return None
+
+    try:
+        start_date = parse_date(row.get('start_date') or '')
+    except ValueError as e:
+        job.add_error(row_num, 'start_date', str(e))
+        return None
+
+    try:
+        balance = float((row.get('balance') or '0').strip().replace(',', '.'))
+    except ValueError:
+        balance = 0.0
+
+    return {
+        'telegram_id': telegram_id,
+        'name': name,
+        'balance': balance,
+        'start_date': start_date,
+        'next_billing_date': start_date,  # Первое списание в день старта
+        'status': "active",
+        'key_data': (row.get('key_data') or '').strip() or None,
+        'is_ghost': telegram_id is None
+    }
+
+
+def _flush_chunk(db: Session, job: ImportJob, chunk: List[Tuple[int, Dict]], seen: Dict[int, int]):
+    """Отсеивает существующие и повторяющиеся telegram_id и вставляет пачку одним INSERT"""
+    telegram_ids = [values['telegram_id'] for _, values in chunk if values['telegram_id']]
+    existing = set()
+    if telegram_ids:
+        existing = set(db.execute(
+            select(User.telegram_id).where(User.telegram_id.in_(telegram_ids))
+        ).scalars())
+
+    rows = []
+    for row_num, values in chunk:
+        telegram_id = values['telegram_id']
+        if telegram_id:
+            if telegram_id in seen:
+                job.add_error(row_num, 'telegram_id', f'Повтор telegram_id {telegram_id} (строка {seen[telegram_id]})')
+                continue
+            if telegram_id in existing:
+                job.add_error(row_num, 'telegram_id', f'Пользователь с telegram_id {telegram_id} уже существует')
+                continue
+            seen[telegram_id] = row_num
+        rows.append(values)
+
+    if rows:
+        # Core executemany без ORM-обработки каждой строки
+        db.execute(insert(User.__table__), rows)
+    db.commit()
+    job.imported += len(rows)
+    job.ghost_users += sum(1 for values in rows if values['is_ghost'])
+
+
+def import_csv_lines(db: Session, lines: Iterable[str], job: Optional[ImportJob] = None) -> ImportJob:
     """
-    Импортирует пользователей из CSV
-    Returns: (imported_count, errors, ghost_users_count)
+    Потоково импортирует пользователей из строк CSV (разделитель - точка с запятой).
+    Существующие telegram_id запрашиваются одним запросом на пачку, каждая пачка
+    вставляется одним INSERT и коммитится отдельно
     """
-    imported = 0
-    errors = []
-    ghost_users = 0
-    
-    # Читаем CSV с разделителем точка с запятой
-    reader = csv.DictReader(io.StringIO(csv_content), delimiter=';')
-    
+    job = job or ImportJob()
+    chunk_size = settings.csv_import_chunk_size
+    seen: Dict[int, int] = {}
+    chunk: List[Tuple[int, Dict]] = []
+
+    reader = csv.DictReader(lines, delimiter=';')
     for row_num, row in enumerate(reader, start=2):  # Начинаем с 2, т.к. первая строка - заголовок
+        job.processed_rows += 1
         try:
-            # Парсим данные
-            telegram_id = None
-            if row.get('telegram_id', '').strip():
-                try:
-                    telegram_id = int(row['telegram_id'].strip())
-                except ValueError:
-                    errors.append({
-                        'row': row_num,
-                        'field': 'telegram_id',
-                        'error': f"Неверный формат telegram_id: {row['telegram_id']}"
-                    })
-                    continue
-            
-            name = row.get('name', '').strip()
-            if not name:
-                errors.append({
-                    'row': row_num,
-                    'field': 'name',
-                    'error': 'Имя не может быть пустым'
-                })
-                continue
-            
-            try:
-                start_date = parse_date(row.get('start_date', ''))
-            except ValueError as e:
-                errors.append({
-                    'row': row_num,
-                    'field': 'start_date',
-                    'error': str(e)
-                })
-                continue
-            
-            try:
-                balance = float(row.get('balance', '0').strip().replace(',', '.'))
-            except ValueError:
-                balance = 0.0
-            
-            key_data = row.get('key_data', '').strip() or None
-            
-            # Проверяем, существует ли пользователь с таким telegram_id
-            if telegram_id:
-                existing_user = db.query(User).filter(User.telegram_id == telegram_id).first()
-                if existing_user:
-                    errors.append({
-                        'row': row_num,
-                        'field': 'telegram_id',
-                        'error': f'Пользователь с telegram_id {telegram_id} уже существует'
-                    })
-                    continue
-            
-            # Создаем пользователя
-            user = User(
-                telegram_id=telegram_id,
-                name=name,
-                balance=balance,
-                start_date=start_date,
-                next_billing_date=start_date,  # Первое списание в день старта
-                status="active",
-                key_data=key_data,
-                is_ghost=(telegram_id is None)
-            )
-            
-            db.add(user)
-            imported += 1
-            
-            if not telegram_id:
-                ghost_users += 1
-                
+            values = _parse_row(job, row_num, row)
         except Exception as e:
-            errors.append({
-                'row': row_num,
-                'field': 'general',
-                'error': f'Ошибка обработки строки: {str(e)}'
-            })
-    
-    db.commit()
-    return imported, errors, ghost_users
+            job.add_error(row_num, 'general', f'Ошибка обработки строки: {str(e)}')
+            continue
+        if values is not None:
+            chunk.append((row_num, values))
+        if len(chunk) >= chunk_size:
+            _flush_chunk(db, job, chunk, seen)
+            chunk = []
+
+    if chunk:
+        _flush_chunk(db, job, chunk, seen)
+    return job
+
+
+# Фоновые задачи импорта; завершенные хранятся, пока их не больше _JOBS_KEPT.
+# Реестр живет в памяти процесса: опрос /import-csv/{job_id} находит задачу, только
+# если попадает в тот же процесс, поэтому с несколькими воркерами API он не работает
+_jobs: Dict[str, ImportJob] = {}
+_jobs_lock = threading.Lock()
+_JOBS_KEPT = 20
+
+
+def create_import_job(filename: Optional[str] = None) -> ImportJob:
+    """Регистрирует задачу импорта для опроса прогресса"""
+    job = ImportJob(filename=filename)
+    with _jobs_lock:
+        _jobs[job.id] = job
+        finished = [j for j in _jobs.values() if j.finished_at]
+        for old in sorted(finished, key=lambda j: j.finished_at)[:max(len(_jobs) - _JOBS_KEPT, 0)]:
+            del _jobs[old.id]
+    return job
 
+
+def get_import_job(job_id: str) -> Optional[ImportJob]:
+    with _jobs_lock:
+        return _jobs.get(job_id)
+
+
+def _count_rows(path: str) -> int:
+    """Оценка числа строк данных для прогресса (без разбора CSV)"""
+    lines = 0
+    with open(path, 'rb') as f:
+        while block := f.read(1024 * 1024):
+            lines += block.count(b'\n')
+    return max(lines - 1, 0)
+
+
+def run_import_job(job: ImportJob, path: str):
+    """
+    Выполняет импорт из временного файла (вызывается в фоне, вне event loop).
+    Файл читается построчно и удаляется по завершении
+    """
+    from app.database import SessionLocal
+
+    job.status = "running"
+    job.started_at = datetime.utcnow()
+    db = SessionLocal()
+    try:
+        job.total_rows = _count_rows(path)
+        with open(path, encoding='utf-8-sig', newline='') as f:  # Обрабатываем BOM
+            import_csv_lines(db, f, job)
+        job.status = "done"
+        logger.info(f"Импорт CSV {job.id} завершен: {job.imported} из {job.processed_rows}, ошибок {job.error_count}")
+    except Exception as e:
+        db.rollback()
+        job.status = "failed"
+        job.add_error(0, 'general', f'Импорт прерван: {str(e)}')
+        logger.error(f"Ошибка импорта CSV {job.id}: {e}")
+    finally:
+        db.close()
+        job.finished_at = datetime.utcnow()
+        try:
+            os.remove(path)
+        except OSError:
+            pass
@@ -0,0 +1,267 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Iterable, List, Optional
+from aiogram import Bot
+from aiogram.exceptions import (
+    TelegramRetryAfter,
+    TelegramNetworkError,
+    TelegramServerError,
+    TelegramForbiddenError,
+    TelegramBadRequest,
+    TelegramNotFound
+)
+from aiogram.methods import SendMessage, ForwardMessage, TelegramMethod
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+# Ответы Bot API, после которых писать в чат бессмысленно
+UNREACHABLE_MARKERS = (
+    "bot was blocked",
+    "chat not found",
+    "user is deactivated",
+    "bot was kicked",
+    "bot can't initiate conversation",
+)
+
+
+def is_unreachable_error(error: BaseException) -> bool:
+    """Получатель заблокировал бота или чат не существует"""
+    if isinstance(error, (TelegramForbiddenError, TelegramNotFound)):
+        return True
+    if isinstance(error, TelegramBadRequest):
+        text = str(error).lower()
+        return any(marker in text for marker in UNREACHABLE_MARKERS)
+    return False
+
+
+def is_retryable_error(error: BaseException) -> bool:
+    """Временная ошибка: имеет смысл повторить отправку позже"""
+    if is_unreachable_error(error):
+        return False
+    return not isinstance(error, TelegramBadRequest)
+
+
+class DeliveryJob:
+    """Задача доставки одного запроса Bot API"""
+
+    __slots__ = ("chat_id", "method", "future", "attempts", "urgent")
+
+    def __init__(self, chat_id: int, method: TelegramMethod, future: asyncio.Future, urgent: bool = False):
+        self.chat_id = chat_id
+        self.method = method
+        self.future = future
+        self.attempts = 0
+        self.urgent = urgent
+
+
+def _consume_result(future: asyncio.Future):
+    """Помечает исключение прочитанным: ошибки уже залогированы пулом"""
+    if not future.cancelled():
+        future.exception()
+
+
+class DeliveryPool:
+    """
+    Пул конкурентной отправки сообщений в Telegram.
+    Ограничивает общий поток (~30 сообщений/с) и частоту сообщений в один чат,
+    выдерживает паузу при RetryAfter и ведет счетчики доставки.
+    Срочные запросы (urgent) идут через отдельную небольшую очередь: воркеры берут
+    их раньше массовых, а постановка в нее никогда не ждет
+    """
+
+    def __init__(
+        self,
+        bot: Bot,
+        workers: Optional[int] = None,
+        rate_limit: Optional[float] = None,
+        chat_interval: Optional[float] = None,
+        queue_size: Optional[int] = None,
+        max_retries: Optional[int] = None,
+        urgent_queue_size: Optional[int] = None
+    ):
+        self.bot = bot
+        self.workers = workers or settings.delivery_workers
+        self.interval = 1.0 / (rate_limit or settings.delivery_rate_limit)
+        self.chat_interval = chat_interval if chat_interval is not None else settings.delivery_chat_interval
+        self.max_retries = max_retries if max_retries is not None else settings.delivery_max_retries
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size or settings.delivery_queue_size)
+        self._urgent: asyncio.Queue = asyncio.Queue(maxsize=urgent_queue_size or settings.delivery_urgent_queue_size)
+        # Число задач в обеих очередях: воркер ждет его, а затем выбирает очередь
+        self._available = asyncio.Semaphore(0)
+        self._tasks: List[asyncio.Task] = []
+        self._next_slot = 0.0
+        self._paused_until = 0.0
+        self._chat_slots: Dict[int, float] = {}
+        self._sent_times: Deque[float] = deque()
+        self._in_flight = 0
+        self._started_at = time.monotonic()
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+        self.dropped = 0
+
+    def start(self):
+        """Запускает воркеры (требуется работающий event loop)"""
+        if self._tasks:
+            return
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        logger.info(f"Пул доставки запущен: {self.workers} воркеров, {1 / self.interval:.0f} сообщений/с")
+
+    async def close(self):
+        """Останавливает воркеры"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def submit(self, method: TelegramMethod, urgent: bool = False) -> asyncio.Future:
+        """
+        Ставит запрос Bot API в очередь; результат доступен через future.
+        Массовый запрос ждет только при переполненной очереди. Срочный не ждет никогда:
+        при переполненной срочной очереди он отбрасывается (future с QueueFull)
+        """
+        self.start()
+        future = asyncio.get_running_loop().create_future()
+        future.add_done_callback(_consume_result)
+        job = DeliveryJob(getattr(method, "chat_id", 0), method, future, urgent)
+        if urgent:
+            try:
+                self._urgent.put_nowait(job)
+            except asyncio.QueueFull as e:
+                self.dropped += 1
+                logger.warning(f"Срочная очередь доставки переполнена, сообщение в чат {job.chat_id} отброшено")
+                future.set_exception(e)
+                return future
+        else:
+            await self._queue.put(job)
+        self._available.release()
+        return future
+
+    async def send_message(self, chat_id: int, text: str, urgent: bool = False, **kwargs) -> asyncio.Future:
+        """Ставит в очередь текстовое сообщение"""
+        return await self.submit(SendMessage(chat_id=chat_id, text=text, **kwargs), urgent)
+
+    async def forward_message(self, chat_id: int, from_chat_id: int, message_id: int, urgent: bool = False) -> asyncio.Future:
+        """Ставит в очередь пересылку сообщения"""
+        return await self.submit(
+            ForwardMessage(chat_id=chat_id, from_chat_id=from_chat_id, message_id=message_id), urgent
+        )
+
+    async def join(self):
+        """Ждет, пока обе очереди опустеют"""
+        await self._urgent.join()
+        await self._queue.join()
+
+    def stats(self) -> dict:
+        """Счетчики пула доставки"""
+        now = time.monotonic()
+        self._trim_sent_times(now)
+        return {
+            "sent": self.sent,
+            "failed": self.failed,
+            "retried": self.retried,
+            "queue_depth": self._queue.qsize(),
+            "urgent_queue_depth": self._urgent.qsize(),
+            "dropped": self.dropped,
+            "in_flight": self._in_flight,
+            "workers": len(self._tasks),
+            "throughput_per_sec": len(self._sent_times) / 60.0,
+            "uptime_sec": now - self._started_at,
+        }
+
+    def _trim_sent_times(self, now: float):
+        """Оставляет отметки отправок только за последнюю минуту"""
+        while self._sent_times and self._sent_times[0] < now - 60.0:
+            self._sent_times.popleft()
+
+    def _reserve_slot(self, chat_id: int) -> float:
+        """Резервирует момент отправки с учетом общего и початового лимитов"""
+        now = time.monotonic()
+        slot = max(now, self._next_slot, self._paused_until)
+        if chat_id:
+            slot = max(slot, self._chat_slots.get(chat_id, 0.0))
+            self._chat_slots[chat_id] = slot + self.chat_interval
+            if len(self._chat_slots) > 10000:
+                self._chat_slots = {k: v for k, v in self._chat_slots.items() if v > now}
+        self._next_slot = slot + self.interval
+        return slot - now
+
+    async def _worker(self):
+        while True:
+            await self._available.acquire()
+            queue = self._urgent if not self._urgent.empty() else self._queue
+            job = queue.get_nowait()
+            self._in_flight += 1
+            try:
+                await self._deliver(job)
+            except Exception as e:
+                logger.error(f"Ошибка воркера доставки: {e}")
+                if not job.future.done():
+                    job.future.set_exception(e)
+            finally:
+                self._in_flight -= 1
+                queue.task_done()
+
+    async def _deliver(self, job: DeliveryJob):
+        while True:
+            delay = self._reserve_slot(job.chat_id)
+            if delay > 0:
+                await asyncio.sleep(delay)
+            # Пока ждали слот, другой воркер мог получить RetryAfter - резервируем заново
+            if self._paused_until > time.monotonic():
+                continue
+
+            job.attempts += 1
+            try:
+                result = await self.bot(job.method)
+            except TelegramRetryAfter as e:
+                # Flood control: приостанавливаем всю отправку на указанное время
+                self._paused_until = max(self._paused_until, time.monotonic() + e.retry_after)
+                logger.warning(f"RetryAfter {e.retry_after} с при отправке в чат {job.chat_id}")
+                if job.attempts > self.max_retries:
+                    self._fail(job, e)
+                    return
+                self.retried += 1
+            except (TelegramNetworkError, TelegramServerError) as e:
+                if job.attempts > self.max_retries:
+                    self._fail(job, e)
+                    return
+                self.retried += 1
+                await asyncio.sleep(2 ** job.attempts)
+            except Exception as e:
+                self._fail(job, e)
+                return
+            else:
+                self.sent += 1
+                now = time.monotonic()
+                self._sent_times.append(now)
+                self._trim_sent_times(now)
+                if not job.future.done():
+                    job.future.set_result(result)
+                return
+
+    def _fail(self, job: DeliveryJob, error: Exception):
+        self.failed += 1
+        logger.error(f"Ошибка отправки в чат {job.chat_id}: {error}")
+        if not job.future.done():
+            job.future.set_exception(error)
+
+
+_pool: Optional[DeliveryPool] = None
+
+
+def get_delivery_pool(bot: Bot) -> DeliveryPool:
+    """Возвращает общий пул доставки процесса"""
+    global _pool
+    if _pool is None:
+        _pool = DeliveryPool(bot)
+    return _pool
+
+
+async def wait_deliveries(futures: Iterable[asyncio.Future]) -> List[Any]:
+    """Ждет завершения отправок; ошибки возвращаются как исключения в списке"""
+    return await asyncio.gather(*futures, return_exceptions=True)
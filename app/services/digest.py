@@ -0,0 +1,57 @@
+import csv
+import html
+import io
+from datetime import date
+from typing import List, Optional, Tuple
+from app.services.billing import BillingOutcome
+from app.config import settings
+
+
+def build_billing_digest(
+    outcomes: List[BillingOutcome],
+    billing_date: date,
+    list_limit: Optional[int] = None
+) -> Tuple[str, Optional[bytes]]:
+    """
+    Собирает сводку биллинга для админов
+    Returns: (текст сообщения, CSV со всеми должниками, если список не влез в сообщение)
+    """
+    list_limit = list_limit if list_limit is not None else settings.admin_digest_list_limit
+    charged = [outcome for outcome in outcomes if outcome.success]
+    debtors = [outcome for outcome in outcomes if not outcome.success]
+    total_charged = sum(outcome.amount for outcome in charged)
+    
+    text = (
+        f"📊 <b>Биллинг за {billing_date.strftime('%d.%m.%Y')}</b>\n\n"
+        f"👥 Обработано: {len(outcomes)}\n"
+        f"✅ Списано: {len(charged)} на сумму {total_charged:.2f} ₽\n"
+        f"⚠️ Должников: {len(debtors)}, из них новых: {sum(1 for outcome in debtors if not outcome.already_in_debt)}"
+    )
+    
+    if not debtors:
+        return text, None
+    
+    text += "\n\n<b>Оплата не прошла, необходимо отключить ключи вручную:</b>\n"
+    for outcome in debtors[:list_limit]:
+        text += (
+            f"• {html.escape(outcome.name[:64])} "
+            f"(@{outcome.telegram_id or 'нет'}), баланс {outcome.balance:.2f} ₽\n"
+        )
+    if len(debtors) <= list_limit:
+        return text, None
+    text += f"\n💡 Показано {list_limit} из {len(debtors)}. Полный список - в файле."
+    
+    output = io.StringIO()
+    writer = csv.writer(output, delimiter=';')
+    writer.writerow(["id", "telegram_id", "name", "balance", "next_billing_date"])
+    for outcome in debtors:
+        writer.writerow([
+            outcome.user_id,
+            outcome.telegram_id or "",
+            outcome.name,
+            f"{outcome.balance:.2f}",
+            outcome.next_billing_date.strftime("%d.%m.%Y")
+        ])
+    
+    # BOM, чтобы Excel корректно открыл кириллицу
+    return text, output.getvalue().encode("utf-8-sig")
@@ -0,0 +1,115 @@
+import csv
+import io
+import zlib
+from datetime import date
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from sqlalchemy.sql import Select
+from app.database import SessionLocal
+from app.models import User, Transaction
+from app.services.user_queries import UserFilters, apply_user_filters
+from app.services.transactions import created_at_range
+from typing import Callable, Iterable, Iterator, Optional
+
+# Строк в одном фрагменте ответа и в одной порции серверного курсора
+EXPORT_BATCH_SIZE = 1000
+
+USER_EXPORT_COLUMNS = [
+    ("ID", User.id),
+    ("Имя", User.name),
+    ("Telegram ID", User.telegram_id),
+    ("Баланс", User.balance),
+    ("Статус", User.status),
+    ("Дата списания", User.next_billing_date),
+    ("Сервер", User.server_name),
+    ("Сертификатов", User.certificates_count),
+    ("Спящий профиль", User.is_ghost),
+]
+
+TRANSACTION_EXPORT_COLUMNS = [
+    ("ID", Transaction.id),
+    ("ID пользователя", Transaction.user_id),
+    ("Telegram ID", User.telegram_id),
+    ("Имя", User.name),
+    ("Сумма", Transaction.amount),
+    ("Тип", Transaction.transaction_type),
+    ("Описание", Transaction.description),
+    ("Дата", Transaction.created_at),
+]
+
+
+def _format(value) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, float):
+        return f"{value:.2f}"
+    return str(value)
+
+
+def _stream_csv(columns: list, build_query: Callable[[Session], Select]) -> Iterator[bytes]:
+    """
+    Выгружает запрос в CSV порциями по EXPORT_BATCH_SIZE строк.
+    yield_per включает серверный курсор, поэтому память не зависит от объема выгрузки.
+    Сессия открывается в генераторе: ответ отдается уже после выхода из эндпоинта
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, delimiter=';')
+    buffer.write("\ufeff")  # BOM для Excel
+    writer.writerow([header for header, _ in columns])
+
+    db = SessionLocal()
+    try:
+        result = db.execute(build_query(db).execution_options(yield_per=EXPORT_BATCH_SIZE))
+        for partition in result.partitions():
+            writer.writerows([_format(value) for value in row] for row in partition)
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+    finally:
+        db.close()
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf-8")
+
+
+def gzip_stream(chunks: Iterable[bytes]) -> Iterator[bytes]:
+    """Сжимает поток в gzip на лету"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def export_users_csv(filters: UserFilters) -> Iterator[bytes]:
+    """CSV пользователей по тем же фильтрам, что и список в админке (без key_data)"""
+    def build_query(db: Session) -> Select:
+        return apply_user_filters(
+            select(*[column for _, column in USER_EXPORT_COLUMNS]),
+            filters
+        ).order_by(User.id)
+
+    return _stream_csv(USER_EXPORT_COLUMNS, build_query)
+
+
+def export_transactions_csv(
+    filters: UserFilters,
+    user_id: Optional[int] = None,
+    transaction_type: Optional[str] = None,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None
+) -> Iterator[bytes]:
+    """CSV транзакций пользователей, отобранных фильтрами списка, с фильтром по типу и периоду"""
+    def build_query(db: Session) -> Select:
+        query = apply_user_filters(
+            select(*[column for _, column in TRANSACTION_EXPORT_COLUMNS])
+            .join(User, User.id == Transaction.user_id),
+            filters
+        )
+        if user_id:
+            query = query.where(Transaction.user_id == user_id)
+        if transaction_type:
+            query = query.where(Transaction.transaction_type == transaction_type)
+        return query.where(*created_at_range(date_from, date_to)).order_by(Transaction.id)
+
+    return _stream_csv(TRANSACTION_EXPORT_COLUMNS, build_query)
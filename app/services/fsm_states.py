@@ -0,0 +1,62 @@
+import json
+from datetime import datetime, timedelta
+from sqlalchemy import select, delete, case, and_
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+from app.models import FsmState
+from typing import Any, Dict, Optional, Tuple
+
+# INSERT ... ON CONFLICT для поддерживаемых СУБД: запись атомарна и не требует
+# отката сессии при одновременном создании ключа несколькими процессами бота
+UPSERT_INSERTS = {
+    "sqlite": sqlite_insert,
+    "postgresql": postgresql_insert,
+}
+
+
+def get_fsm_record(db: Session, key: str) -> Tuple[Optional[str], Dict[str, Any]]:
+    """Состояние и данные ключа одним запросом; истекшая запись считается пустой"""
+    row = db.execute(
+        select(FsmState.state, FsmState.data, FsmState.expires_at).where(FsmState.key == key)
+    ).first()
+    if row is None or (row.expires_at is not None and row.expires_at <= datetime.utcnow()):
+        return None, {}
+    return row.state, json.loads(row.data) if row.data else {}
+
+
+def save_fsm_record(db: Session, key: str, ttl: Optional[int], field: str, value: Optional[str]):
+    """
+    Записывает state или data ключа и продлевает срок жизни записи.
+    Второе поле истекшей записи не переносится; запись без состояния
+    и данных удаляется. Коммитит сессию, поэтому вызывается на отдельной
+    короткой сессии, а не на сессии обработчика
+    """
+    now = datetime.utcnow()
+    table = FsmState.__table__
+    other = "data" if field == "state" else "state"
+    insert = UPSERT_INSERTS[db.get_bind().dialect.name](table).values(
+        key=key, expires_at=now + timedelta(seconds=ttl) if ttl else None, **{field: value}
+    )
+    db.execute(insert.on_conflict_do_update(
+        index_elements=[table.c.key],
+        set_={
+            field: insert.excluded[field],
+            other: case((and_(table.c.expires_at.isnot(None), table.c.expires_at <= now), None), else_=table.c[other]),
+            "expires_at": insert.excluded.expires_at,
+            "updated_at": now,
+        }
+    ))
+    db.execute(delete(table).where(table.c.key == key, table.c.state.is_(None), table.c.data.is_(None)))
+    db.commit()
+
+
+def delete_expired_fsm_states(db: Session) -> int:
+    """Удаляет истекшие состояния FSM; возвращает их число"""
+    result = db.execute(
+        delete(FsmState)
+        .where(FsmState.expires_at <= datetime.utcnow())
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+    return result.rowcount
@@ -1,6 +1,42 @@
+from sqlalchemy import select, insert, update, or_, text, bindparam, literal, Integer
 from sqlalchemy.orm import Session
+from sqlalchemy.sql import Select
 from app.models import Notification, User
-from typing import Optional
+from app.config import settings
+from datetime import datetime, timedelta
+from typing import Callable, Iterable, List, Optional, Tuple
+import logging
+import uuid
+
+logger = logging.getLogger(__name__)
+
+# Канал PostgreSQL LISTEN/NOTIFY для пробуждения диспетчера outbox
+OUTBOX_CHANNEL = "notifications_outbox"
+
+_outbox_listeners: List[Callable[[], None]] = []
+
+
+def add_outbox_listener(callback: Callable[[], None]):
+    """Регистрирует обработчик, вызываемый после добавления уведомления в этом процессе"""
+    _outbox_listeners.append(callback)
+
+
+def signal_outbox(db: Session):
+    """
+    Сообщает диспетчеру о новых уведомлениях.
+    Вызывается до коммита: на PostgreSQL NOTIFY доставляется вместе с транзакцией
+    """
+    if db.get_bind().dialect.name == "postgresql":
+        db.execute(text(f"NOTIFY {OUTBOX_CHANNEL}"))
+
+
+def wake_outbox_listeners():
+    """Будит диспетчеры этого процесса; вызывается после коммита"""
+    for callback in _outbox_listeners:
+        try:
+            callback()
+        except Exception as e:
+            logger.error(f"Ошибка пробуждения диспетчера уведомлений: {e}")
 
 
 def create_notification(
@@ -14,26 +50,237 @@ def create_notification(
         user_id=user_id,
         message=message,
         notification_type=notification_type,
-        sent=False
+        sent=False,
+        status="pending",
+        attempts=0
     )
     db.add(notification)
+    signal_outbox(db)
     db.commit()
     db.refresh(notification)
+    wake_outbox_listeners()
     return notification
 
 
+def enqueue_notifications(
+    db: Session,
+    recipients: Select,
+    message: str,
+    notification_type: str,
+    campaign_id: Optional[int] = None
+) -> int:
+    """
+    Ставит уведомление в очередь всем пользователям из recipients (select(User.id))
+    одним INSERT ... SELECT, без загрузки получателей в процесс.
+    Коммит и wake_outbox_listeners - на вызывающей стороне
+    Returns: число созданных уведомлений
+    """
+    result = db.execute(
+        insert(Notification).from_select(
+            ["user_id", "message", "notification_type", "sent", "status", "attempts", "campaign_id"],
+            recipients.with_only_columns(
+                User.id,
+                literal(message),
+                literal(notification_type),
+                literal(False),
+                literal("pending"),
+                literal(0),
+                literal(campaign_id, Integer)
+            )
+        )
+    )
+    signal_outbox(db)
+    return result.rowcount
+
+
 def mark_notification_sent(db: Session, notification_id: int):
     """Отмечает уведомление как отправленное"""
-    notification = db.query(Notification).filter(Notification.id == notification_id).first()
-    if notification:
-        notification.sent = True
+    mark_notifications_sent(db, [notification_id])
+
+
+def mark_notifications_sent(db: Session, notification_ids: List[int], token: Optional[str] = None):
+    """
+    Отмечает пачку уведомлений отправленными одним UPDATE.
+    С token - только строки, которые все еще арендованы этим диспетчером
+    """
+    if not notification_ids:
+        return
+    conditions = [Notification.id.in_(notification_ids)]
+    if token is not None:
+        conditions.append(Notification.claimed_by == token)
+    db.execute(
+        update(Notification)
+        .where(*conditions)
+        .values(
+            sent=True,
+            status="sent",
+            sent_at=datetime.utcnow(),
+            last_error=None,
+            claimed_by=None,
+            claimed_until=None
+        )
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+
+
+def retry_delay(attempts: int) -> timedelta:
+    """Экспоненциальная задержка перед следующей попыткой"""
+    seconds = settings.notification_retry_base * (2 ** max(attempts - 1, 0))
+    return timedelta(seconds=min(seconds, settings.notification_retry_max))
+
+
+def record_delivery_failures(
+    db: Session,
+    failures: Iterable[Tuple[object, BaseException, bool, bool]],
+    token: Optional[str] = None
+):
+    """
+    Сохраняет результат неудачных отправок.
+    failures: (строка из claim_notifications, ошибка, можно ли повторить, недоступен ли получатель)
+    С token обновляются только строки, аренда которых не перешла к другому диспетчеру.
+    Повторяемые ошибки откладываются с экспоненциальной задержкой, после
+    notification_max_attempts попыток и при постоянных ошибках уведомление
+    переходит в статус dead; недоступные получатели подавляются
+    """
+    now = datetime.utcnow()
+    updates = []
+    unreachable = set()
+    for row, error, retryable, recipient_unreachable in failures:
+        attempts = (row.attempts or 0) + 1
+        if recipient_unreachable:
+            unreachable.add(row.telegram_id)
+        dead = not retryable or attempts >= settings.notification_max_attempts
+        updates.append({
+            "b_id": row.id,
+            "b_status": "dead" if dead else "pending",
+            "b_attempts": attempts,
+            "b_last_error": str(error)[:1000],
+            "b_next_attempt_at": None if dead else now + retry_delay(attempts)
+        })
+    
+    if updates:
+        table = Notification.__table__
+        conditions = [table.c.id == bindparam("b_id")]
+        if token is not None:
+            conditions.append(table.c.claimed_by == token)
+        db.execute(
+            update(table)
+            .where(*conditions)
+            .values(
+                status=bindparam("b_status"),
+                attempts=bindparam("b_attempts"),
+                last_error=bindparam("b_last_error"),
+                next_attempt_at=bindparam("b_next_attempt_at"),
+                claimed_by=None,
+                claimed_until=None
+            ),
+            updates
+        )
+    if unreachable:
+        suppress_recipients(db, unreachable)
+    db.commit()
+
+
+def suppress_recipients(db: Session, telegram_ids: Iterable[int]):
+    """
+    Помечает пользователей, заблокировавших бота, и переводит их ожидающие
+    уведомления в dead: claim_notifications таких получателей пропускает, и строки
+    копились бы в outbox. Арендованные строки завершит их диспетчер (без коммита)
+    """
+    telegram_ids = [telegram_id for telegram_id in telegram_ids if telegram_id]
+    if not telegram_ids:
+        return
+    db.execute(
+        update(User)
+        .where(User.telegram_id.in_(telegram_ids), User.bot_blocked.isnot(True))
+        .values(bot_blocked=True)
+        .execution_options(synchronize_session=False)
+    )
+    now = datetime.utcnow()
+    db.execute(
+        update(Notification)
+        .where(
+            Notification.status == "pending",
+            Notification.user_id.in_(select(User.id).where(User.telegram_id.in_(telegram_ids))),
+            or_(Notification.claimed_until.is_(None), Notification.claimed_until < now)
+        )
+        .values(status="dead", last_error="Получатель заблокировал бота", claimed_by=None, claimed_until=None)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def restore_recipient(db: Session, user_id: int):
+    """Снимает подавление, когда пользователь снова пишет боту (любой апдейт)"""
+    user = db.get(User, user_id)
+    if user and user.bot_blocked:
+        user.bot_blocked = False
         db.commit()
 
 
+def requeue_notification(db: Session, notification_id: int) -> bool:
+    """Возвращает уведомление из dead-letter в очередь"""
+    result = db.execute(
+        update(Notification)
+        .where(Notification.id == notification_id, Notification.status == "dead")
+        .values(status="pending", attempts=0, next_attempt_at=None, claimed_by=None, claimed_until=None)
+        .execution_options(synchronize_session=False)
+    )
+    signal_outbox(db)
+    db.commit()
+    wake_outbox_listeners()
+    return result.rowcount > 0
+
+
+def claim_notifications(db: Session, batch_size: int = 100, lease_seconds: int = 60) -> Tuple[str, list]:
+    """
+    Забирает пачку неотправленных уведомлений в аренду.
+    На PostgreSQL строки выбираются через FOR UPDATE SKIP LOCKED, на SQLite
+    конкурентные записи сериализуются самой базой; аренда (claimed_until)
+    позволяет вернуть уведомления, если обработчик упал
+    Берутся только уведомления в статусе pending, у которых наступило время
+    следующей попытки, и только для пользователей, не заблокировавших бота
+    Returns: (токен аренды, строки (id, message, attempts, telegram_id)); токен
+    передается в mark_notifications_sent/record_delivery_failures
+    """
+    now = datetime.utcnow()
+    token = uuid.uuid4().hex
+
+    candidates = (
+        select(Notification.id)
+        .join(User, User.id == Notification.user_id)
+        .where(
+            Notification.status == "pending",
+            or_(Notification.next_attempt_at.is_(None), Notification.next_attempt_at <= now),
+            or_(Notification.claimed_until.is_(None), Notification.claimed_until < now),
+            User.telegram_id.isnot(None),
+            User.bot_blocked.isnot(True)
+        )
+        .order_by(Notification.id)
+        .limit(batch_size)
+        .with_for_update(skip_locked=True, of=Notification)
+    )
+
+    db.execute(
+        update(Notification)
+        .where(Notification.id.in_(candidates.scalar_subquery()))
+        .values(claimed_by=token, claimed_until=now + timedelta(seconds=lease_seconds))
+        .execution_options(synchronize_session=False)
+    )
+
+    rows = db.execute(
+        select(Notification.id, Notification.message, Notification.attempts, User.telegram_id)
+        .join(User, User.id == Notification.user_id)
+        .where(Notification.claimed_by == token)
+        .order_by(Notification.id)
+    ).all()
+    db.commit()
+    return token, rows
+
+
 def get_pending_notifications(db: Session, user_id: Optional[int] = None) -> list:
     """Получает неотправленные уведомления"""
-    query = db.query(Notification).filter(Notification.sent == False)
+    query = db.query(Notification).filter(Notification.status == "pending")
     if user_id:
         query = query.filter(Notification.user_id == user_id)
     return query.all()
-
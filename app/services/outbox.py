@@ -0,0 +1,150 @@
+import asyncio
+import logging
+from typing import Optional
+from aiogram import Bot
+from app.config import settings
+from app.database import AsyncSessionLocal, engine
+from app.services.delivery import (
+    get_delivery_pool,
+    wait_deliveries,
+    is_retryable_error,
+    is_unreachable_error
+)
+from app.services.notifications import (
+    OUTBOX_CHANNEL,
+    add_outbox_listener,
+    claim_notifications,
+    mark_notifications_sent,
+    record_delivery_failures
+)
+
+logger = logging.getLogger(__name__)
+
+
+class OutboxDispatcher:
+    """
+    Диспетчер таблицы notifications.
+    Просыпается сразу после create_notification (в этом же процессе или через
+    PostgreSQL NOTIFY из процесса API), опрос раз в outbox_poll_interval
+    остается запасным вариантом. На SQLite NOTIFY нет, и уведомления из процесса
+    API ждут опроса - интервал там короче (outbox_poll_interval_sqlite)
+    """
+
+    def __init__(self, bot: Bot, batch_size: Optional[int] = None, poll_interval: Optional[float] = None):
+        self.bot = bot
+        self.batch_size = batch_size or settings.outbox_batch_size
+        if not poll_interval:
+            poll_interval = (
+                settings.outbox_poll_interval_sqlite if engine.dialect.name == "sqlite"
+                else settings.outbox_poll_interval
+            )
+        self.poll_interval = poll_interval
+        self._event: Optional[asyncio.Event] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._task: Optional[asyncio.Task] = None
+        self._pg_conn = None
+
+    def start(self):
+        """Запускает цикл диспетчера в текущем event loop"""
+        if self._task:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._event = asyncio.Event()
+        add_outbox_listener(self.wake)
+        self._listen_postgres()
+        self._task = asyncio.create_task(self.run())
+        logger.info("Диспетчер уведомлений запущен")
+
+    async def stop(self):
+        if self._pg_conn is not None:
+            self._loop.remove_reader(self._pg_conn.fileno())
+            self._pg_conn.close()
+            self._pg_conn = None
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def wake(self):
+        """Будит диспетчер; безопасно вызывать из любого потока"""
+        if self._loop is not None and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._event.set)
+
+    def _listen_postgres(self):
+        """Подписывается на NOTIFY без отдельного потока (psycopg2 + add_reader)"""
+        if engine.dialect.name != "postgresql":
+            return
+        try:
+            import psycopg2
+            import psycopg2.extensions
+
+            dsn = engine.url.set(drivername="postgresql").render_as_string(hide_password=False)
+            conn = psycopg2.connect(dsn)
+            conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+            with conn.cursor() as cursor:
+                cursor.execute(f"LISTEN {OUTBOX_CHANNEL}")
+            self._loop.add_reader(conn.fileno(), self._on_pg_notify)
+            self._pg_conn = conn
+        except Exception as e:
+            logger.warning(f"LISTEN {OUTBOX_CHANNEL} недоступен, используется опрос: {e}")
+
+    def _on_pg_notify(self):
+        try:
+            self._pg_conn.poll()
+            self._pg_conn.notifies.clear()
+        except Exception as e:
+            logger.warning(f"Соединение LISTEN потеряно, используется опрос: {e}")
+            self._loop.remove_reader(self._pg_conn.fileno())
+            self._pg_conn = None
+        self._event.set()
+
+    async def run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._event.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._event.clear()
+            try:
+                await self.drain()
+            except Exception as e:
+                logger.error(f"Ошибка диспетчера уведомлений: {e}")
+
+    async def drain(self) -> int:
+        """Отправляет все доступные уведомления пачками; возвращает число отправленных"""
+        pool = get_delivery_pool(self.bot)
+        total = 0
+        while True:
+            async with AsyncSessionLocal() as db:
+                token, batch = await db.run_sync(claim_notifications, self.batch_size)
+                if not batch:
+                    return total
+
+                futures = [await pool.send_message(row.telegram_id, row.message) for row in batch]
+                results = await wait_deliveries(futures)
+
+                sent_ids = []
+                failures = []
+                for row, result in zip(batch, results):
+                    if isinstance(result, Exception):
+                        logger.error(f"Ошибка отправки уведомления {row.id}: {result}")
+                        failures.append((row, result, is_retryable_error(result), is_unreachable_error(result)))
+                    else:
+                        sent_ids.append(row.id)
+
+                # Неудачные откладываются по next_attempt_at и не попадут в следующую пачку.
+                # Строки, аренду которых перехватил другой диспетчер, не трогаем
+                await db.run_sync(mark_notifications_sent, sent_ids, token)
+                await db.run_sync(record_delivery_failures, failures, token)
+                total += len(sent_ids)
+
+
+_dispatcher: Optional[OutboxDispatcher] = None
+
+
+def get_outbox_dispatcher(bot: Bot) -> OutboxDispatcher:
+    """Возвращает общий диспетчер уведомлений процесса"""
+    global _dispatcher
+    if _dispatcher is None:
+        _dispatcher = OutboxDispatcher(bot)
+    return _dispatcher
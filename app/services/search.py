@@ -0,0 +1,229 @@
+import re
+from dataclasses import dataclass
+from sqlalchemy import select, func, or_, text, literal
+from sqlalchemy.orm import Session, defer
+from app.models import User
+from typing import Dict, List, Set, Tuple
+
+
+# Порог похожести имени для нечеткого поиска (как pg_trgm.similarity_threshold по умолчанию)
+SIMILARITY_THRESHOLD = 0.3
+
+# Порядок групп в выдаче: точное совпадение ID, префикс ID, префикс имени, подстрока, похожие имена
+MATCH_RANK = {
+    "id": 0,
+    "telegram_id": 0,
+    "id_prefix": 1,
+    "telegram_id_prefix": 1,
+    "name_prefix": 2,
+    "name_contains": 3,
+    "name_similar": 4,
+}
+
+
+@dataclass
+class SearchResult:
+    user: User
+    match: str
+    score: float
+
+
+def _trigrams(value: str) -> Set[str]:
+    """Триграммы в стиле pg_trgm: по словам, с двумя пробелами в начале и одним в конце"""
+    grams = set()
+    for word in re.findall(r"\w+", value.lower()):
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def similarity(a: str, b: str) -> float:
+    """Доля общих триграмм (аналог pg_trgm similarity)"""
+    grams_a, grams_b = _trigrams(a), _trigrams(b)
+    if not grams_a or not grams_b:
+        return 0.0
+    return len(grams_a & grams_b) / len(grams_a | grams_b)
+
+
+def word_similarity(query: str, name: str) -> float:
+    """
+    Похожесть запроса на наиболее близкий фрагмент имени из стольких же слов
+    (приближение pg_trgm word_similarity): "ивнов" находит "Петр Иванов"
+    """
+    query_words = len(re.findall(r"\w+", query)) or 1
+    words = re.findall(r"\w+", name)
+    best = similarity(query, name)
+    for i in range(max(len(words) - query_words + 1, 0)):
+        best = max(best, similarity(query, " ".join(words[i:i + query_words])))
+    return best
+
+
+def _prefix_ranges(prefix: str, max_value: int) -> List[Tuple[int, int]]:
+    """
+    Диапазоны [p*10^k, (p+1)*10^k) чисел, начинающихся с prefix, от коротких
+    к длинным; каждый диапазон - отдельный проход по B-tree индексу
+    """
+    value = int(prefix)
+    ranges = []
+    for extra in range(len(str(max_value)) - len(prefix) + 1):
+        low = value * 10 ** extra
+        if low > max_value:
+            break
+        ranges.append((low, (value + 1) * 10 ** extra))
+    return ranges
+
+
+def _search_numeric(db: Session, query: str, limit: int) -> List[SearchResult]:
+    """Поиск по префиксу id и telegram_id"""
+    results = []
+    if query.startswith("0"):
+        # ID не начинаются с нуля, а диапазоны для префикса "0" покрыли бы все малые числа
+        return results
+    for column, field in ((User.id, "id"), (User.telegram_id, "telegram_id")):
+        max_value = db.scalar(select(func.max(column)))
+        if not max_value:
+            continue
+        found = 0
+        for low, high in _prefix_ranges(query, max_value):
+            users = db.execute(
+                select(User)
+                .options(defer(User.key_data))
+                .where(column >= low, column < high)
+                .order_by(column)
+                .limit(limit - found)
+            ).scalars().all()
+            for user in users:
+                value = str(getattr(user, field))
+                match = field if value == query else f"{field}_prefix"
+                # Чем короче найденное число, тем ближе оно к запросу
+                results.append(SearchResult(user, match, len(query) / len(value)))
+            found += len(users)
+            if found >= limit:
+                break
+    return results
+
+
+def _classify_name(user: User, query: str) -> SearchResult:
+    name = user.name.lower()
+    score = word_similarity(query, name)
+    if name.startswith(query):
+        return SearchResult(user, "name_prefix", score)
+    if query in name:
+        return SearchResult(user, "name_contains", score)
+    return SearchResult(user, "name_similar", score)
+
+
+def _search_name_postgres(db: Session, query: str, limit: int) -> List[SearchResult]:
+    """Префикс, подстрока и похожесть через GIN-индекс ix_users_name_trgm"""
+    name = func.lower(User.name)
+    # Порог оператора <% действует до конца транзакции
+    db.execute(
+        select(func.set_config("pg_trgm.word_similarity_threshold", str(SIMILARITY_THRESHOLD), True))
+    )
+    users = db.execute(
+        select(User)
+        .options(defer(User.key_data))
+        .where(or_(
+            name.contains(query, autoescape=True),
+            literal(query).op("<%")(name)
+        ))
+        .order_by(
+            name.startswith(query, autoescape=True).desc(),
+            func.word_similarity(query, name).desc()
+        )
+        .limit(limit)
+    ).scalars().all()
+    return [_classify_name(user, query) for user in users]
+
+
+def _fts_match(query: str) -> str:
+    return '"' + query.replace('"', '""') + '"'
+
+
+def _fts_candidates(db: Session, match: str, limit: int, ranked: bool) -> List[int]:
+    order = " ORDER BY rank" if ranked else ""
+    return db.execute(
+        text(f"SELECT rowid FROM users_fts WHERE users_fts MATCH :match{order} LIMIT :limit"),
+        {"match": match, "limit": limit}
+    ).scalars().all()
+
+
+def _name_prefix_filter(query: str):
+    """
+    Имя начинается с query. LIKE в SQLite не учитывает регистр только для латиницы,
+    поэтому проверяются типичные написания
+    """
+    variants = {query, query.capitalize(), query.upper()}
+    return or_(*[User.name.startswith(variant, autoescape=True) for variant in variants])
+
+
+def _search_name_sqlite(db: Session, query: str, limit: int) -> List[SearchResult]:
+    """
+    Отдельным запросом - совпадения префикса (самые короткие имена первыми, точное
+    совпадение впереди), затем кандидаты из FTS5 (users_fts, триграммы): подстрока
+    целиком, при нехватке результатов - любые общие триграммы (нечеткий поиск)
+    """
+    prefix_query = (
+        select(User)
+        .options(defer(User.key_data))
+        .order_by(func.length(User.name), User.id)
+        .limit(limit)
+    )
+    if len(query) < 3:
+        # Триграммный индекс не работает с короткими запросами
+        users = db.execute(prefix_query.where(_name_prefix_filter(query))).scalars().all()
+        return [_classify_name(user, query) for user in users]
+
+    fts_ids = text("SELECT rowid FROM users_fts WHERE users_fts MATCH :match").bindparams(match=_fts_match(query))
+    prefix_users = db.execute(
+        prefix_query.where(User.id.in_(fts_ids), _name_prefix_filter(query))
+    ).scalars().all()
+    results = [_classify_name(user, query) for user in prefix_users]
+    if len(results) >= limit:
+        return results
+
+    # Совпадения подстроки равноценны (порядок уточняется ниже), bm25 нужен только
+    # для отбора лучших кандидатов по общим триграммам
+    ids = _fts_candidates(db, _fts_match(query), limit * 5, ranked=False)
+    if len(ids) < limit:
+        grams = {query[i:i + 3] for i in range(len(query) - 2)}
+        fuzzy = _fts_candidates(db, " OR ".join(map(_fts_match, grams)), limit * 5, ranked=True)
+        ids = list(dict.fromkeys(ids + fuzzy))
+    seen = {user.id for user in prefix_users}
+    ids = [user_id for user_id in ids if user_id not in seen]
+    if ids:
+        users = db.execute(
+            select(User).options(defer(User.key_data)).where(User.id.in_(ids))
+        ).scalars().all()
+        results.extend(_classify_name(user, query) for user in users)
+    return results
+
+
+def search_users(db: Session, query: str, limit: int = 20) -> List[SearchResult]:
+    """
+    Поиск пользователей по имени (префикс, подстрока, нечеткий) и по префиксу id/telegram_id.
+    Результаты упорядочены по группе совпадения и похожести
+    """
+    query = query.strip().lower()
+    if not query:
+        return []
+
+    results: List[SearchResult] = []
+    if query.isdigit():
+        # Числовой запрос - это ID, имена не просматриваем
+        results.extend(_search_numeric(db, query, limit))
+    elif db.get_bind().dialect.name == "postgresql":
+        results.extend(_search_name_postgres(db, query, limit))
+    else:
+        results.extend(_search_name_sqlite(db, query, limit))
+
+    best: Dict[int, SearchResult] = {}
+    for result in results:
+        if result.match == "name_similar" and result.score < SIMILARITY_THRESHOLD:
+            continue
+        current = best.get(result.user.id)
+        if current is None or MATCH_RANK[result.match] < MATCH_RANK[current.match]:
+            best[result.user.id] = result
+
+    ranked = sorted(best.values(), key=lambda r: (MATCH_RANK[r.match], -r.score, r.user.id))
+    return ranked[:limit]
@@ -0,0 +1,112 @@
+from sqlalchemy import select, func, case, update, insert, delete, literal, true
+from sqlalchemy.orm import Session
+from app.models import User, Stats, StatsDelta
+from datetime import datetime
+import logging
+
+logger = logging.getLogger(__name__)
+
+STATS_FIELDS = ("total_users", "active_users", "debt_users", "blocked_users", "ghost_users", "total_balance")
+
+
+def _statistics_query():
+    """Все счетчики одним проходом по users (условные агрегаты)"""
+    return select(
+        func.count(User.id).label("total_users"),
+        func.coalesce(func.sum(case((User.status == "active", 1), else_=0)), 0).label("active_users"),
+        func.coalesce(func.sum(case((User.status == "debt", 1), else_=0)), 0).label("debt_users"),
+        func.coalesce(func.sum(case((User.status == "blocked", 1), else_=0)), 0).label("blocked_users"),
+        func.coalesce(func.sum(case((User.is_ghost == True, 1), else_=0)), 0).label("ghost_users"),
+        func.coalesce(func.sum(User.balance), 0.0).label("total_balance")
+    )
+
+
+def _lock_stats(db: Session) -> bool:
+    """
+    Блокирует строку stats до конца транзакции (PostgreSQL): свертка и пересчет
+    не пересекаются. Писатели users в PostgreSQL эту строку не трогают.
+    Возвращает False, если строки еще нет
+    """
+    return db.execute(select(Stats.id).where(Stats.id == 1).with_for_update()).first() is not None
+
+
+def recompute_statistics(db: Session) -> dict:
+    """
+    Пересчитывает строку stats по таблице users (сверка накопленных изменений).
+    Строка stats блокируется до пересчета, а сам пересчет - один UPDATE ... FROM
+    (агрегат). В PostgreSQL тот же оператор удаляет stats_deltas: все его части
+    видят один снимок, поэтому изменения users, зафиксированные позже, остаются
+    в stats_deltas и не теряются
+    """
+    now = datetime.utcnow()
+    if not _lock_stats(db):
+        db.execute(insert(Stats).values(id=1, updated_at=now, **{field: 0 for field in STATS_FIELDS}))
+    totals = _statistics_query().add_columns(literal(1).label("id")).subquery()
+    statement = (
+        update(Stats)
+        .where(Stats.id == totals.c.id)
+        .values(updated_at=now, **{field: totals.c[field] for field in STATS_FIELDS})
+        .execution_options(synchronize_session=False)
+    )
+    if db.get_bind().dialect.name == "postgresql":
+        statement = statement.add_cte(delete(StatsDelta).cte("folded"))
+    db.execute(statement)
+    db.commit()
+    return get_statistics(db)
+
+
+def fold_stats_deltas(db: Session) -> int:
+    """
+    Сворачивает stats_deltas в строку stats (PostgreSQL) одним оператором:
+    удаленные изменения прибавляются к счетчикам. Возвращает число свернутых
+    строк; в SQLite триггеры пишут в stats напрямую и сворачивать нечего
+    """
+    if db.get_bind().dialect.name != "postgresql":
+        return 0
+    if not _lock_stats(db):
+        # Строки stats еще нет: пересчет создаст ее и удалит накопленные изменения
+        db.rollback()
+        recompute_statistics(db)
+        return 0
+    folded = delete(StatsDelta).returning(StatsDelta.id, *[StatsDelta.__table__.c[field] for field in STATS_FIELDS])
+    folded = folded.cte("folded")
+    result = db.execute(
+        update(Stats)
+        .where(Stats.id == 1)
+        .values(
+            updated_at=datetime.utcnow(),
+            **{
+                field: Stats.__table__.c[field]
+                + select(func.coalesce(func.sum(folded.c[field]), 0)).scalar_subquery()
+                for field in STATS_FIELDS
+            }
+        )
+        .add_cte(folded)
+        .returning(select(func.count()).select_from(folded).scalar_subquery())
+        .execution_options(synchronize_session=False)
+    )
+    count = result.scalar()
+    db.commit()
+    return count
+
+
+def get_statistics(db: Session) -> dict:
+    """
+    Счетчики пользователей без прохода по users: строка stats, которую
+    поддерживают триггеры БД, плюс еще не свернутые stats_deltas (PostgreSQL).
+    Если строки еще нет, считает ее одним агрегатным запросом
+    """
+    deltas = select(*[
+        func.coalesce(func.sum(StatsDelta.__table__.c[field]), 0).label(field) for field in STATS_FIELDS
+    ]).subquery()
+    row = db.execute(
+        select(Stats.updated_at, *[(Stats.__table__.c[field] + deltas.c[field]).label(field) for field in STATS_FIELDS])
+        .join_from(Stats, deltas, true())
+        .where(Stats.id == 1)
+    ).one_or_none()
+    if row is None:
+        logger.info("Строка stats отсутствует, пересчитываем статистику")
+        return recompute_statistics(db)
+    stats = {field: getattr(row, field) for field in STATS_FIELDS}
+    stats["updated_at"] = row.updated_at
+    return stats
@@ -0,0 +1,47 @@
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from app.models import SystemSettings
+from app.services.cache import TTLCache
+from app.config import settings
+from typing import Dict, Optional
+
+# Все ключи system_settings читаются одним запросом и живут в кэше процесса.
+# Запись через set_system_settings сбрасывает кэш; изменения из другого процесса
+# (API/бот) становятся видны не позже чем через system_settings_cache_ttl секунд
+_cache = TTLCache(ttl=settings.system_settings_cache_ttl, maxsize=1)
+
+
+def _load_all(db: Session) -> Dict[str, str]:
+    return {key: value for key, value in db.execute(select(SystemSettings.key, SystemSettings.value))}
+
+
+def get_system_settings(db: Session) -> Dict[str, str]:
+    """Возвращает все системные настройки (из кэша, если он свежий)"""
+    return _cache.get_or_load("all", lambda: _load_all(db))
+
+
+def get_system_setting(db: Session, key: str, default: Optional[str] = None) -> Optional[str]:
+    """Возвращает значение одной настройки"""
+    return get_system_settings(db).get(key, default)
+
+
+def set_system_settings(db: Session, values: Dict[str, str]):
+    """Сохраняет настройки (upsert) и сбрасывает кэш"""
+    if not values:
+        return
+    existing = {
+        setting.key: setting
+        for setting in db.query(SystemSettings).filter(SystemSettings.key.in_(list(values))).all()
+    }
+    for key, value in values.items():
+        if key in existing:
+            existing[key].value = value
+        else:
+            db.add(SystemSettings(key=key, value=value))
+    db.commit()
+    invalidate_system_settings()
+
+
+def invalidate_system_settings():
+    """Сбрасывает кэш настроек"""
+    _cache.clear()
@@ -0,0 +1,55 @@
+import hashlib
+import os
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from app.models import TelegramFile
+from typing import Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Виды файлов: QR-код СБП (owner - путь к файлу) и VPN-конфиг пользователя (owner - ID пользователя)
+KIND_SBP_QR = "sbp_qr"
+KIND_VPN_KEY = "vpn_key"
+
+
+def file_fingerprint(path: str) -> str:
+    """Версия файла на диске: время изменения и размер"""
+    stat = os.stat(path)
+    return f"{stat.st_mtime_ns}:{stat.st_size}"
+
+
+def content_fingerprint(content: str) -> str:
+    """Версия содержимого: sha256"""
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+def get_file_id(db: Session, kind: str, owner: str, fingerprint: str) -> Optional[str]:
+    """file_id сохраненной загрузки, если содержимое с тех пор не менялось"""
+    row = db.execute(
+        select(TelegramFile.fingerprint, TelegramFile.file_id)
+        .where(TelegramFile.kind == kind, TelegramFile.owner == owner)
+    ).first()
+    if row is None or row.fingerprint != fingerprint:
+        return None
+    return row.file_id
+
+
+def save_file_id(db: Session, kind: str, owner: str, fingerprint: str, file_id: str):
+    """Сохраняет file_id новой загрузки, заменяя запись прежней версии файла"""
+    record = db.execute(
+        select(TelegramFile).where(TelegramFile.kind == kind, TelegramFile.owner == owner)
+    ).scalar_one_or_none()
+    if record is None:
+        db.add(TelegramFile(kind=kind, owner=owner, fingerprint=fingerprint, file_id=file_id))
+    else:
+        record.fingerprint = fingerprint
+        record.file_id = file_id
+    try:
+        db.commit()
+    except IntegrityError:
+        # Тот же файл параллельно загрузил другой обработчик - его file_id тоже годится
+        db.rollback()
+        logger.debug(f"file_id {kind}/{owner} уже сохранен")
+
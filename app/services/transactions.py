@@ -0,0 +1,114 @@
+import base64
+import hashlib
+import hmac
+import json
+from datetime import date, datetime, timedelta
+from sqlalchemy import select, func, or_, and_
+from sqlalchemy.orm import Session
+from app.config import settings
+from app.models import Transaction, TransactionTotal
+from typing import List, Optional, Tuple
+
+
+def created_at_range(date_from: Optional[date] = None, date_to: Optional[date] = None) -> list:
+    """Условия по transactions.created_at для периода дат включительно"""
+    conditions = []
+    if date_from:
+        conditions.append(Transaction.created_at >= datetime.combine(date_from, datetime.min.time()))
+    if date_to:
+        date_to_end = datetime.combine(date_to + timedelta(days=1), datetime.min.time())
+        conditions.append(Transaction.created_at < date_to_end)
+    return conditions
+
+
+def _cursor_signature(scope: list, raw: bytes) -> str:
+    """HMAC курсора (SECRET_KEY): нарастающий итог нельзя подменить или перенести в другую выборку"""
+    message = json.dumps(scope).encode("utf-8") + b":" + raw
+    return hmac.new(settings.secret_key.encode("utf-8"), b"transactions-cursor:" + message, hashlib.sha256).hexdigest()
+
+
+def encode_cursor(scope: list, created_at: datetime, transaction_id: int, running_total: float) -> str:
+    """Курсор: позиция последней строки и нарастающий итог до нее, подписанные вместе с фильтром"""
+    raw = json.dumps([created_at.isoformat(), transaction_id, running_total]).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii") + "." + _cursor_signature(scope, raw)
+
+
+def decode_cursor(scope: list, cursor: str) -> Tuple[datetime, int, float]:
+    """Разбирает курсор; ValueError, если он поврежден или подписан для другой выборки"""
+    try:
+        payload, signature = cursor.split(".", 1)
+        raw = base64.urlsafe_b64decode(payload.encode("ascii"))
+        if not hmac.compare_digest(signature, _cursor_signature(scope, raw)):
+            raise ValueError
+        created_at, transaction_id, running_total = json.loads(raw)
+        return datetime.fromisoformat(created_at), int(transaction_id), float(running_total)
+    except Exception:
+        raise ValueError("Некорректный курсор")
+
+
+def _filter_total(db: Session, conditions: list, user_id: int, transaction_type: Optional[str], by_date: bool) -> float:
+    """
+    Сумма по фильтру для первой страницы. Без периода берется из transaction_totals
+    (поддерживается триггерами), с периодом - агрегат только по диапазону индекса
+    """
+    if by_date:
+        query = select(func.coalesce(func.sum(Transaction.amount), 0.0)).where(*conditions)
+    else:
+        query = select(func.coalesce(func.sum(TransactionTotal.total), 0.0)).where(TransactionTotal.user_id == user_id)
+        if transaction_type:
+            query = query.where(TransactionTotal.transaction_type == transaction_type)
+    return float(db.scalar(query))
+
+
+def get_transaction_page(
+    db: Session,
+    user_id: int,
+    transaction_type: Optional[str] = None,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    cursor: Optional[str] = None,
+    limit: int = 50
+) -> Tuple[List[Tuple[Transaction, float]], Optional[str], Optional[float]]:
+    """
+    Страница истории транзакций от новых к старым (индекс ix_transactions_user_created).
+    Нарастающий итог на первой странице берется из transaction_totals и дальше
+    передается в подписанном курсоре, поэтому каждая страница - один проход по индексу
+    Returns: ([(транзакция, нарастающий итог после нее)], курсор, сумма по фильтру
+    для первой страницы)
+    """
+    conditions = [Transaction.user_id == user_id]
+    if transaction_type:
+        conditions.append(Transaction.transaction_type == transaction_type)
+    conditions.extend(created_at_range(date_from, date_to))
+    scope = [user_id, transaction_type, date_from and date_from.isoformat(), date_to and date_to.isoformat()]
+
+    total_amount = None
+    if cursor:
+        last_created_at, last_id, running_total = decode_cursor(scope, cursor)
+        page_conditions = conditions + [or_(
+            Transaction.created_at < last_created_at,
+            and_(Transaction.created_at == last_created_at, Transaction.id < last_id)
+        )]
+    else:
+        total_amount = _filter_total(db, conditions, user_id, transaction_type, bool(date_from or date_to))
+        running_total = total_amount
+        page_conditions = conditions
+
+    transactions = db.execute(
+        select(Transaction)
+        .where(*page_conditions)
+        .order_by(Transaction.created_at.desc(), Transaction.id.desc())
+        .limit(limit + 1)
+    ).scalars().all()
+
+    has_more = len(transactions) > limit
+    items = []
+    for transaction in transactions[:limit]:
+        items.append((transaction, round(running_total, 2)))
+        running_total -= transaction.amount
+
+    next_cursor = None
+    if has_more:
+        last = items[-1][0]
+        next_cursor = encode_cursor(scope, last.created_at, last.id, running_total)
+    return items, next_cursor, total_amount
@@ -0,0 +1,123 @@
+import itertools
+from dataclasses import dataclass
+from datetime import date
+from sqlalchemy import event, inspect, select
+from sqlalchemy.orm import Session, ORMExecuteState
+from app.models import User
+from app.services.cache import TTLCache
+from app.config import settings
+from typing import Iterable, Optional, Set
+
+# Снимки профилей по telegram_id для обработчиков бота.
+# Изменения User в этом процессе (ORM и массовые UPDATE/INSERT/DELETE через сессию)
+# сбрасывают кэш сразу и повторно после коммита; изменения из другого процесса (API)
+# становятся видны не позже чем через user_cache_ttl секунд. Поэтому баланс и ключ,
+# которые видит пользователь, читаются через load_user_snapshot в обход кэша
+_cache = TTLCache(ttl=settings.user_cache_ttl, maxsize=settings.user_cache_size)
+
+_PENDING_KEYS = "user_cache_keys"
+_PENDING_CLEAR = "user_cache_clear"
+
+
+@dataclass(frozen=True)
+class UserSnapshot:
+    """Неизменяемый снимок профиля, не привязанный к сессии"""
+    id: int
+    telegram_id: Optional[int]
+    name: str
+    balance: float
+    status: str
+    next_billing_date: Optional[date]
+    certificates_count: Optional[int]
+    server_name: Optional[str]
+    key_data: Optional[str]
+    is_ghost: bool
+    bot_blocked: bool
+
+    @classmethod
+    def from_user(cls, user: User) -> "UserSnapshot":
+        return cls(
+            id=user.id,
+            telegram_id=user.telegram_id,
+            name=user.name,
+            balance=user.balance or 0.0,
+            status=user.status,
+            next_billing_date=user.next_billing_date,
+            certificates_count=user.certificates_count,
+            server_name=user.server_name,
+            key_data=user.key_data,
+            is_ghost=bool(user.is_ghost),
+            bot_blocked=bool(user.bot_blocked)
+        )
+
+
+def load_user_snapshot(db: Session, telegram_id: int) -> Optional[UserSnapshot]:
+    """Профиль по Telegram ID одним запросом в обход кэша; свежий снимок кладется в кэш"""
+    user = db.execute(select(User).where(User.telegram_id == telegram_id)).scalar_one_or_none()
+    if user is None:
+        _cache.invalidate(telegram_id)
+        return None
+    snapshot = UserSnapshot.from_user(user)
+    _cache.set(telegram_id, snapshot)
+    return snapshot
+
+
+def get_user_snapshot(db: Session, telegram_id: int) -> Optional[UserSnapshot]:
+    """
+    Профиль по Telegram ID из кэша или одним запросом. Отсутствие не кэшируется:
+    профиль, созданный админкой, виден боту сразу
+    """
+    snapshot = _cache.get(telegram_id)
+    if snapshot is None:
+        snapshot = load_user_snapshot(db, telegram_id)
+    return snapshot
+
+
+def invalidate_users(telegram_ids: Iterable[Optional[int]]):
+    for telegram_id in telegram_ids:
+        if telegram_id is not None:
+            _cache.invalidate(telegram_id)
+
+
+def _flushed_telegram_ids(user: User) -> Set[int]:
+    """Текущий и прежний telegram_id измененного пользователя"""
+    history = inspect(user).attrs.telegram_id.history
+    return {user.telegram_id, *history.added, *history.deleted} - {None}
+
+
+@event.listens_for(Session, "after_flush")
+def _invalidate_flushed_users(session: Session, flush_context):
+    keys = set()
+    for obj in itertools.chain(session.new, session.dirty, session.deleted):
+        if isinstance(obj, User):
+            keys |= _flushed_telegram_ids(obj)
+    if keys:
+        invalidate_users(keys)
+        session.info.setdefault(_PENDING_KEYS, set()).update(keys)
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _invalidate_bulk_statements(state: ORMExecuteState):
+    """Массовые изменения users (биллинг, импорт, админка) затрагивают неизвестные ключи"""
+    if not (state.is_update or state.is_delete or state.is_insert):
+        return
+    # Для update(User) здесь аннотированная копия таблицы, поэтому сравниваем по имени
+    if getattr(getattr(state.statement, "table", None), "name", None) == User.__tablename__:
+        _cache.clear()
+        state.session.info[_PENDING_CLEAR] = True
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_committed(session: Session):
+    # Повторный сброс: до коммита другой обработчик мог закэшировать старые данные
+    keys = session.info.pop(_PENDING_KEYS, None)
+    if session.info.pop(_PENDING_CLEAR, False):
+        _cache.clear()
+    elif keys:
+        invalidate_users(keys)
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_pending(session: Session):
+    session.info.pop(_PENDING_KEYS, None)
+    session.info.pop(_PENDING_CLEAR, None)
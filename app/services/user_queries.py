@@ -0,0 +1,133 @@
+import base64
+import json
+from dataclasses import dataclass
+from datetime import date
+from sqlalchemy import select, func, or_, and_
+from sqlalchemy.orm import Session, defer
+from sqlalchemy.sql import Select
+from app.models import User
+from typing import List, Optional, Tuple
+
+
+# Допустимые ключи сортировки списка пользователей.
+# created_at не используется: порядок регистрации совпадает с порядком id.
+# balance допускает NULL: сортируется и попадает в курсор как 0, иначе keyset-условие теряет строки
+SORT_COLUMNS = {
+    "id": User.id,
+    "name": User.name,
+    "balance": func.coalesce(User.balance, 0.0),
+    "next_billing_date": User.next_billing_date,
+}
+
+
+@dataclass
+class UserFilters:
+    """Фильтры списка пользователей (админка, экспорт, массовые операции)"""
+    status: Optional[str] = None
+    server_name: Optional[str] = None
+    is_ghost: Optional[bool] = None
+    min_balance: Optional[float] = None
+    max_balance: Optional[float] = None
+    q: Optional[str] = None
+
+
+def apply_user_filters(query: Select, filters: UserFilters) -> Select:
+    """Добавляет условия фильтров к запросу по users"""
+    if filters.status:
+        query = query.where(User.status == filters.status)
+    if filters.server_name:
+        query = query.where(User.server_name == filters.server_name)
+    if filters.is_ghost is not None:
+        query = query.where(User.is_ghost == filters.is_ghost)
+    if filters.min_balance is not None:
+        query = query.where(User.balance >= filters.min_balance)
+    if filters.max_balance is not None:
+        query = query.where(User.balance <= filters.max_balance)
+    if filters.q:
+        q = filters.q.strip()
+        conditions = [User.name.ilike(f"%{q}%")]
+        if q.isdigit():
+            conditions.append(User.id == int(q))
+            conditions.append(User.telegram_id == int(q))
+        query = query.where(or_(*conditions))
+    return query
+
+
+def encode_cursor(value, user_id: int) -> str:
+    """Курсор keyset-пагинации: значение ключа сортировки и id последней строки"""
+    if isinstance(value, date):
+        value = value.isoformat()
+    raw = json.dumps([value, user_id]).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+
+def decode_cursor(cursor: str, sort: str) -> Tuple[object, int]:
+    """Разбирает курсор; ValueError, если он поврежден"""
+    try:
+        value, user_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    except Exception:
+        raise ValueError("Некорректный курсор")
+    if value is not None and sort == "next_billing_date":
+        value = date.fromisoformat(value)
+    return value, int(user_id)
+
+
+def list_users(
+    db: Session,
+    filters: UserFilters,
+    sort: str = "id",
+    descending: bool = False,
+    cursor: Optional[str] = None,
+    limit: int = 50
+) -> Tuple[List[User], Optional[str]]:
+    """
+    Страница пользователей с keyset-пагинацией по (ключ сортировки, id).
+    key_data не загружается
+    Returns: (пользователи, курсор следующей страницы или None)
+    """
+    if sort not in SORT_COLUMNS:
+        raise ValueError(f"Неизвестный ключ сортировки: {sort}")
+    column = SORT_COLUMNS[sort]
+
+    query = apply_user_filters(select(User).options(defer(User.key_data)), filters)
+    if cursor:
+        value, last_id = decode_cursor(cursor, sort)
+        if sort == "id":
+            query = query.where(User.id < last_id if descending else User.id > last_id)
+        elif descending:
+            query = query.where(or_(column < value, and_(column == value, User.id < last_id)))
+        else:
+            query = query.where(or_(column > value, and_(column == value, User.id > last_id)))
+
+    if descending:
+        query = query.order_by(column.desc(), User.id.desc())
+    else:
+        query = query.order_by(column.asc(), User.id.asc())
+
+    users = db.execute(query.limit(limit + 1)).scalars().all()
+    next_cursor = None
+    if len(users) > limit:
+        users = users[:limit]
+        last = users[-1]
+        value = getattr(last, sort)
+        if sort == "balance":
+            value = value or 0.0
+        next_cursor = encode_cursor(value, last.id)
+    return users, next_cursor
+
+
+def count_users(db: Session, filters: UserFilters) -> dict:
+    """Итоги по фильтру одним агрегатным запросом: всего, по статусам, общий баланс"""
+    query = apply_user_filters(
+        select(User.status, func.count(User.id), func.coalesce(func.sum(User.balance), 0.0)),
+        filters
+    ).group_by(User.status)
+
+    counts = {}
+    total = 0
+    total_balance = 0.0
+    for status, count, balance in db.execute(query):
+        counts[status or ""] = count
+        total += count
+        total_balance += float(balance or 0)
+    return {"total": total, "counts": counts, "total_balance": total_balance}
@@ -1,5 +1,9 @@
 let adminTelegramId = null;
-let allUsers = []; // Сохраняем всех пользователей для фильтрации
+let loadedUsers = []; // Загруженные страницы пользователей
+let usersNextCursor = null; // Курсор следующей страницы
+let usersSearchTimer = null;
+const USERS_PAGE_SIZE = 50;
+const selectedUserIds = new Set(); // Отмеченные для массовых операций
 
 // Вход в админ-панель
 async function adminLogin() {
@@ -34,6 +38,7 @@ async function adminLogin() {
     loadDebtors();
     loadSettings();
     loadServers();
+    loadBroadcasts();
 }
 
 // Импорт CSV
@@ -60,20 +65,47 @@ async function importCSV() {
             throw new Error('Ошибка импорта');
         }
         
-        const result = await response.json();
-        const resultDiv = document.getElementById('importResult');
+        const job = await response.json();
+        pollImportJob(job.id);
+    } catch (error) {
+        alert('Ошибка импорта: ' + error.message);
+    }
+}
+
+// Опрос прогресса фонового импорта
+async function pollImportJob(jobId) {
+    const resultDiv = document.getElementById('importResult');
+    try {
+        const response = await fetch(`/api/admin/import-csv/${jobId}?telegram_id=${adminTelegramId}`);
+        if (!response.ok) throw new Error('Ошибка получения статуса импорта');
+        const job = await response.json();
+        
+        if (job.status === 'pending' || job.status === 'running') {
+            const percent = job.total_rows ? Math.min(100, Math.round(job.processed_rows * 100 / job.total_rows)) : 0;
+            resultDiv.innerHTML = `
+                <div class="progress mb-2">
+                    <div class="progress-bar" role="progressbar" style="width: ${percent}%">${percent}%</div>
+                </div>
+                <small class="text-muted">Обработано строк: ${job.processed_rows}${job.total_rows ? ' из ' + job.total_rows : ''}, импортировано: ${job.imported}</small>
+            `;
+            setTimeout(() => pollImportJob(jobId), 1000);
+            return;
+        }
+        
+        const alertClass = job.status === 'done' ? 'alert-success' : 'alert-danger';
         resultDiv.innerHTML = `
-            <div class="alert alert-success">
-                <strong>Импорт завершен!</strong><br>
-                Импортировано: ${result.imported}<br>
-                Спящих профилей: ${result.ghost_users}<br>
-                Ошибок: ${result.errors.length}
+            <div class="alert ${alertClass}">
+                <strong>${job.status === 'done' ? 'Импорт завершен!' : 'Импорт прерван'}</strong><br>
+                Импортировано: ${job.imported}<br>
+                Спящих профилей: ${job.ghost_users}<br>
+                Ошибок: ${job.error_count}
             </div>
         `;
         
-        if (result.errors.length > 0) {
-            const errorsList = result.errors.map(e => `Строка ${e.row}: ${e.error}`).join('<br>');
-            resultDiv.innerHTML += `<div class="alert alert-warning">${errorsList}</div>`;
+        if (job.errors.length > 0) {
+            const errorsList = job.errors.map(e => `Строка ${e.row}: ${e.error}`).join('<br>');
+            const more = job.error_count > job.errors.length ? `<br>... и еще ${job.error_count - job.errors.length}` : '';
+            resultDiv.innerHTML += `<div class="alert alert-warning" style="max-height: 300px; overflow-y: auto;">${errorsList}${more}</div>`;
         }
         
         // Обновляем списки
@@ -85,21 +117,48 @@ async function importCSV() {
 }
 
 // Загрузка пользователей
-async function loadUsers() {
+async function loadUsers(append = false) {
     try {
-        const response = await fetch(`/api/admin/users?telegram_id=${adminTelegramId}`);
+        const params = getUsersQueryParams();
+        params.set('limit', USERS_PAGE_SIZE);
+        if (append && usersNextCursor) params.set('cursor', usersNextCursor);
+        
+        const response = await fetch(`/api/admin/users?${params}`);
         if (!response.ok) throw new Error('Ошибка загрузки');
         
-        const users = await response.json();
-        allUsers = users; // Сохраняем для фильтрации
-        displayUsers(users);
-        updateUsersStats(users);
+        const page = await response.json();
+        loadedUsers = append ? loadedUsers.concat(page.items) : page.items;
+        usersNextCursor = page.next_cursor;
+        displayUsers(loadedUsers);
+        if (!append) updateUsersStats(page);
+        
+        const loadMoreBtn = document.getElementById('usersLoadMore');
+        if (loadMoreBtn) loadMoreBtn.style.display = usersNextCursor ? 'inline-block' : 'none';
     } catch (error) {
         console.error('Error loading users:', error);
     }
 }
 
-// Отображение пользователей в таблице
+// Параметры запроса списка пользователей из фильтров на странице
+function getUsersQueryParams() {
+    const params = new URLSearchParams({ telegram_id: adminTelegramId });
+    const searchText = document.getElementById('userSearchInput')?.value.trim() || '';
+    const statusFilter = document.getElementById('statusFilter')?.value || '';
+    const sortValue = document.getElementById('usersSort')?.value || 'id:asc';
+    const [sort, order] = sortValue.split(':');
+    
+    if (searchText) params.set('q', searchText);
+    if (statusFilter) params.set('status', statusFilter);
+    params.set('sort', sort);
+    params.set('order', order);
+    return params;
+}
+
+// Следующая страница пользователей
+function loadMoreUsers() {
+    if (usersNextCursor) loadUsers(true);
+}
+
 function displayUsers(users) {
     const tbody = document.getElementById('usersTableBody');
     if (!tbody) return;
@@ -114,6 +173,7 @@ function displayUsers(users) {
             : '-';
         return `
             <tr>
+                <td><input type="checkbox" class="form-check-input" ${selectedUserIds.has(user.id) ? 'checked' : ''} onchange="toggleUserSelection(${user.id}, this.checked)"></td>
                 <td>${user.id}</td>
                 <td>${user.name}</td>
                 <td>${telegramLink}</td>
@@ -168,15 +228,27 @@ async function loadGhostUsers() {
     }
 }
 
-// Загрузка должников
-async function loadDebtors() {
+// Загрузка должников (страницами по возрастанию баланса)
+let loadedDebtors = [];
+let debtorsNextCursor = null;
+
+async function loadDebtors(append = false) {
     try {
-        const response = await fetch(`/api/admin/debtors?telegram_id=${adminTelegramId}`);
+        const params = new URLSearchParams({ telegram_id: adminTelegramId, limit: USERS_PAGE_SIZE });
+        if (append && debtorsNextCursor) params.set('cursor', debtorsNextCursor);
+        const response = await fetch(`/api/admin/debtors?${params}`);
         if (!response.ok) throw new Error('Ошибка загрузки');
         
-        const debtors = await response.json();
+        const page = await response.json();
+        loadedDebtors = append ? loadedDebtors.concat(page.items) : page.items;
+        debtorsNextCursor = page.next_cursor;
+        if (!append) {
+            document.getElementById('debtorsSummary').textContent =
+                `Должников: ${page.count}, не хватает до оплаты: ${page.total_debt.toFixed(2)} ₽`;
+        }
+        
         const tbody = document.getElementById('debtorsTableBody');
-        tbody.innerHTML = debtors.map(user => {
+        tbody.innerHTML = loadedDebtors.map(user => {
             const telegramLink = user.telegram_id 
                 ? `<a href="tg://user?id=${user.telegram_id}" class="text-decoration-none" title="Открыть диалог в Telegram">${user.telegram_id} <i class="bi bi-telegram"></i></a>`
                 : '-';
@@ -192,6 +264,9 @@ async function loadDebtors() {
             </tr>
         `;
         }).join('');
+        
+        const loadMoreBtn = document.getElementById('debtorsLoadMore');
+        if (loadMoreBtn) loadMoreBtn.style.display = debtorsNextCursor ? 'inline-block' : 'none';
     } catch (error) {
         console.error('Error loading debtors:', error);
     }
@@ -583,36 +658,23 @@ function logout() {
     document.getElementById('adminPanel').style.display = 'none';
 }
 
-// Поиск и фильтрация пользователей
+// Поиск и фильтрация пользователей (на сервере)
 function filterUsers() {
-    const searchText = document.getElementById('userSearchInput')?.value.toLowerCase() || '';
-    const statusFilter = document.getElementById('statusFilter')?.value || '';
-    
-    let filtered = allUsers.filter(user => {
-        const matchesSearch = !searchText || 
-            user.name.toLowerCase().includes(searchText) ||
-            user.id.toString().includes(searchText) ||
-            (user.telegram_id && user.telegram_id.toString().includes(searchText));
-        
-        const matchesStatus = !statusFilter || user.status === statusFilter;
-        
-        return matchesSearch && matchesStatus;
-    });
-    
-    displayUsers(filtered);
-    updateUsersStats(filtered);
+    clearTimeout(usersSearchTimer);
+    usersSearchTimer = setTimeout(() => loadUsers(), 300);
 }
 
 // Обновление статистики пользователей
-function updateUsersStats(users) {
+function updateUsersStats(page) {
     const statsDiv = document.getElementById('usersStats');
     if (!statsDiv) return;
     
-    const total = users.length;
-    const active = users.filter(u => u.status === 'active').length;
-    const blocked = users.filter(u => u.status === 'blocked').length;
-    const debt = users.filter(u => u.status === 'debt').length;
-    const totalBalance = users.reduce((sum, u) => sum + u.balance, 0);
+    const counts = page.counts || {};
+    const total = page.total || 0;
+    const active = counts.active || 0;
+    const blocked = counts.blocked || 0;
+    const debt = counts.debt || 0;
+    const totalBalance = page.total_balance || 0;
     
     statsDiv.innerHTML = `
         <div class="row g-2">
@@ -660,21 +722,79 @@ function updateUsersStats(users) {
     `;
 }
 
+// Массовая операция над пользователями; в таблице обновляются только затронутые строки
+async function bulkUpdateUsers(body) {
+    const response = await fetch(`/api/admin/users/bulk?telegram_id=${adminTelegramId}`, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify(body)
+    });
+    const result = await response.json();
+    if (!response.ok) throw new Error(result.detail || 'Ошибка операции');
+    
+    const changed = new Map(result.results.filter(r => r.success).map(r => [r.user_id, r]));
+    loadedUsers = loadedUsers.map(user => {
+        const r = changed.get(user.id);
+        return r ? { ...user, telegram_id: r.telegram_id, status: r.status, balance: r.balance, server_name: r.server_name } : user;
+    });
+    displayUsers(loadedUsers);
+    return result;
+}
+
+function toggleUserSelection(userId, checked) {
+    if (checked) selectedUserIds.add(userId); else selectedUserIds.delete(userId);
+    updateBulkSelectedCount();
+}
+
+function updateBulkSelectedCount() {
+    const counter = document.getElementById('bulkSelectedCount');
+    if (counter) counter.textContent = selectedUserIds.size;
+}
+
+function toggleAllUsersSelection(checked) {
+    loadedUsers.forEach(user => toggleUserSelection(user.id, checked));
+    displayUsers(loadedUsers);
+}
+
+// Применение массовой операции к отмеченным пользователям
+async function applyBulkOperation() {
+    if (selectedUserIds.size === 0) {
+        alert('Не выбраны пользователи');
+        return;
+    }
+    const body = { user_ids: Array.from(selectedUserIds) };
+    const status = document.getElementById('bulkStatus').value;
+    const delta = parseFloat(document.getElementById('bulkBalanceDelta').value);
+    if (status) body.status = status;
+    if (!isNaN(delta) && delta !== 0) {
+        body.balance_delta = delta;
+        body.description = document.getElementById('bulkDescription').value || null;
+    }
+    if (!body.status && !body.balance_delta) {
+        alert('Укажите статус или сумму корректировки');
+        return;
+    }
+    if (!confirm(`Применить к ${selectedUserIds.size} пользователям?`)) return;
+    
+    try {
+        const result = await bulkUpdateUsers(body);
+        const errors = result.results.filter(r => !r.success).map(r => `${r.user_id}: ${r.error}`);
+        alert(`Изменено: ${result.updated}` + (errors.length ? `\nОшибки:\n${errors.join('\n')}` : ''));
+        selectedUserIds.clear();
+        updateBulkSelectedCount();
+        displayUsers(loadedUsers);
+        loadDebtors();
+    } catch (error) {
+        alert('Ошибка: ' + error.message);
+    }
+}
+
 // Быстрая блокировка пользователя
 async function quickBlockUser(userId) {
     if (!confirm('Заблокировать пользователя?')) return;
     
     try {
-        const response = await fetch(`/api/admin/users/${userId}?telegram_id=${adminTelegramId}`, {
-            method: 'PUT',
-            headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify({ status: 'blocked' })
-        });
-        
-        if (!response.ok) throw new Error('Ошибка блокировки');
-        
-        alert('Пользователь заблокирован');
-        loadUsers();
+        await bulkUpdateUsers({ user_ids: [userId], status: 'blocked' });
         loadDebtors();
     } catch (error) {
         alert('Ошибка: ' + error.message);
@@ -686,16 +806,7 @@ async function quickUnblockUser(userId) {
     if (!confirm('Разблокировать пользователя?')) return;
     
     try {
-        const response = await fetch(`/api/admin/users/${userId}?telegram_id=${adminTelegramId}`, {
-            method: 'PUT',
-            headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify({ status: 'active' })
-        });
-        
-        if (!response.ok) throw new Error('Ошибка разблокировки');
-        
-        alert('Пользователь разблокирован');
-        loadUsers();
+        await bulkUpdateUsers({ user_ids: [userId], status: 'active' });
         loadDebtors();
     } catch (error) {
         alert('Ошибка: ' + error.message);
@@ -703,13 +814,12 @@ async function quickUnblockUser(userId) {
 }
 
 // Просмотр транзакций пользователя
+let transactionsCursor = null;
+
 async function showUserTransactions(userId) {
     try {
-        const response = await fetch(`/api/users/${userId}/transactions`);
-        if (!response.ok) throw new Error('Ошибка загрузки');
-        
-        const transactions = await response.json();
-        const user = allUsers.find(u => u.id === userId);
+        const page = await fetchUserTransactions(userId, null);
+        const user = loadedUsers.find(u => u.id === userId);
         
         let html = `
             <div class="modal fade" id="transactionsModal" tabindex="-1">
@@ -726,37 +836,25 @@ async function showUserTransactions(userId) {
                                         <th>Дата</th>
                                         <th>Тип</th>
                                         <th>Сумма</th>
+                                        <th>Итог</th>
                                         <th>Описание</th>
                                     </tr>
                                 </thead>
-                                <tbody>
+                                <tbody id="transactionsTableBody">
         `;
         
-        if (transactions.length === 0) {
-            html += '<tr><td colspan="4" class="text-center">Транзакций нет</td></tr>';
+        if (page.items.length === 0) {
+            html += '<tr><td colspan="5" class="text-center">Транзакций нет</td></tr>';
         } else {
-            transactions.forEach(t => {
-                const date = new Date(t.created_at).toLocaleString('ru-RU');
-                const typeBadge = t.transaction_type === 'deposit' 
-                    ? '<span class="badge bg-success">Пополнение</span>'
-                    : t.transaction_type === 'withdrawal'
-                    ? '<span class="badge bg-danger">Списание</span>'
-                    : '<span class="badge bg-warning">Корректировка</span>';
-                const amountClass = t.amount >= 0 ? 'text-success' : 'text-danger';
-                html += `
-                    <tr>
-                        <td>${date}</td>
-                        <td>${typeBadge}</td>
-                        <td class="${amountClass}">${t.amount >= 0 ? '+' : ''}${t.amount.toFixed(2)} ₽</td>
-                        <td>${t.description || '-'}</td>
-                    </tr>
-                `;
-            });
+            html += renderTransactionRows(page.items);
         }
         
         html += `
                                 </tbody>
                             </table>
+                            <div class="text-center">
+                                <button class="btn btn-sm btn-outline-primary" id="transactionsLoadMore" style="display: ${page.next_cursor ? 'inline-block' : 'none'};" onclick="loadMoreTransactions(${userId})">Загрузить еще</button>
+                            </div>
                         </div>
                     </div>
                 </div>
@@ -776,39 +874,72 @@ async function showUserTransactions(userId) {
     }
 }
 
-// Экспорт пользователей в CSV
-function exportUsersToCSV() {
-    if (allUsers.length === 0) {
-        alert('Нет данных для экспорта');
-        return;
-    }
+// Загрузка страницы истории транзакций
+async function fetchUserTransactions(userId, cursor) {
+    const params = new URLSearchParams({ limit: 50 });
+    if (cursor) params.set('cursor', cursor);
+    const response = await fetch(`/api/users/${userId}/transactions?${params}`);
+    if (!response.ok) throw new Error('Ошибка загрузки');
     
-    const headers = ['ID', 'Имя', 'Telegram ID', 'Баланс', 'Статус', 'Дата списания'];
-    const rows = allUsers.map(user => [
-        user.id,
-        user.name,
-        user.telegram_id || '',
-        user.balance.toFixed(2),
-        user.status,
-        user.next_billing_date || ''
-    ]);
-    
-    const csvContent = [
-        headers.join(';'),
-        ...rows.map(row => row.join(';'))
-    ].join('\n');
-    
-    const blob = new Blob(['\ufeff' + csvContent], { type: 'text/csv;charset=utf-8;' });
+    const page = await response.json();
+    transactionsCursor = page.next_cursor;
+    return page;
+}
+
+// Следующая страница транзакций в открытом модальном окне
+async function loadMoreTransactions(userId) {
+    if (!transactionsCursor) return;
+    try {
+        const page = await fetchUserTransactions(userId, transactionsCursor);
+        document.getElementById('transactionsTableBody').insertAdjacentHTML('beforeend', renderTransactionRows(page.items));
+        document.getElementById('transactionsLoadMore').style.display = page.next_cursor ? 'inline-block' : 'none';
+    } catch (error) {
+        alert('Ошибка: ' + error.message);
+    }
+}
+
+function renderTransactionRows(transactions) {
+    return transactions.map(t => {
+        const date = new Date(t.created_at).toLocaleString('ru-RU');
+        const typeBadge = t.transaction_type === 'deposit' 
+            ? '<span class="badge bg-success">Пополнение</span>'
+            : t.transaction_type === 'withdrawal'
+            ? '<span class="badge bg-danger">Списание</span>'
+            : '<span class="badge bg-warning">Корректировка</span>';
+        const amountClass = t.amount >= 0 ? 'text-success' : 'text-danger';
+        return `
+            <tr>
+                <td>${date}</td>
+                <td>${typeBadge}</td>
+                <td class="${amountClass}">${t.amount >= 0 ? '+' : ''}${t.amount.toFixed(2)} ₽</td>
+                <td>${t.running_total.toFixed(2)} ₽</td>
+                <td>${t.description || '-'}</td>
+            </tr>
+        `;
+    }).join('');
+}
+
+// Экспорт в CSV по текущим фильтрам: файл формирует сервер потоком
+function downloadExport(kind) {
+    const params = getUsersQueryParams();
+    params.delete('sort');
+    params.delete('order');
     const link = document.createElement('a');
-    const url = URL.createObjectURL(blob);
-    link.setAttribute('href', url);
-    link.setAttribute('download', `users_${new Date().toISOString().split('T')[0]}.csv`);
+    link.href = `/api/admin/export/${kind}?${params}`;
     link.style.visibility = 'hidden';
     document.body.appendChild(link);
     link.click();
     document.body.removeChild(link);
 }
 
+function exportUsersToCSV() {
+    downloadExport('users');
+}
+
+function exportTransactionsToCSV() {
+    downloadExport('transactions');
+}
+
 // Вспомогательные функции
 async function updateCertificatesCount() {
     const userId = parseInt(document.getElementById('modalUserId').value);
@@ -957,6 +1088,109 @@ async function deleteServer(serverId) {
     }
 }
 
+// Рассылки
+let broadcastsTimer = null;
+const BROADCAST_SEGMENTS = { all: 'Все', debtors: 'Должники', server: 'Сервер', status: 'Статус' };
+
+function updateBroadcastSegmentValue() {
+    const segment = document.getElementById('broadcastSegment').value;
+    const input = document.getElementById('broadcastSegmentValue');
+    input.style.display = (segment === 'server' || segment === 'status') ? 'block' : 'none';
+    input.placeholder = segment === 'status' ? 'active, debt или blocked' : 'Название сервера';
+}
+
+async function loadBroadcasts() {
+    try {
+        const response = await fetch(`/api/admin/broadcasts?telegram_id=${adminTelegramId}`);
+        if (!response.ok) throw new Error('Ошибка загрузки');
+        
+        const campaigns = await response.json();
+        const tbody = document.getElementById('broadcastsTableBody');
+        tbody.innerHTML = campaigns.map(campaign => {
+            const done = campaign.sent + campaign.failed + campaign.cancelled;
+            const percent = campaign.total_recipients ? Math.round(done * 100 / campaign.total_recipients) : 100;
+            const message = campaign.message.length > 80 ? campaign.message.slice(0, 80) + '…' : campaign.message;
+            const segment = BROADCAST_SEGMENTS[campaign.segment] + (campaign.segment_value ? `: ${campaign.segment_value}` : '');
+            return `
+                <tr>
+                    <td>${campaign.id}</td>
+                    <td>${message}</td>
+                    <td>${segment}</td>
+                    <td style="min-width: 200px;">
+                        <div class="progress mb-1">
+                            <div class="progress-bar" style="width: ${percent}%">${percent}%</div>
+                        </div>
+                        <small>Отправлено ${campaign.sent} из ${campaign.total_recipients}, ошибок ${campaign.failed}${campaign.cancelled ? `, отменено ${campaign.cancelled}` : ''}</small>
+                    </td>
+                    <td>
+                        ${campaign.status === 'sending'
+                            ? `<button class="btn btn-sm btn-outline-danger" onclick="cancelBroadcast(${campaign.id})">Отменить</button>`
+                            : ''}
+                    </td>
+                </tr>
+            `;
+        }).join('');
+        
+        // Пока есть незавершенные рассылки, обновляем прогресс
+        clearTimeout(broadcastsTimer);
+        if (campaigns.some(campaign => campaign.status === 'sending')) {
+            broadcastsTimer = setTimeout(loadBroadcasts, 5000);
+        }
+    } catch (error) {
+        console.error('Ошибка загрузки рассылок:', error);
+    }
+}
+
+async function createBroadcast() {
+    const message = document.getElementById('broadcastMessage').value.trim();
+    const segment = document.getElementById('broadcastSegment').value;
+    const segmentValue = document.getElementById('broadcastSegmentValue').value.trim() || null;
+    
+    if (!message) {
+        alert('Введите текст сообщения');
+        return;
+    }
+    
+    try {
+        const params = new URLSearchParams({ telegram_id: adminTelegramId, segment });
+        if (segmentValue) params.set('segment_value', segmentValue);
+        const preview = await fetch(`/api/admin/broadcasts/preview?${params}`);
+        const previewData = await preview.json();
+        if (!preview.ok) throw new Error(previewData.detail || 'Ошибка сегмента');
+        if (!confirm(`Отправить сообщение ${previewData.recipients} пользователям?`)) return;
+        
+        const response = await fetch(`/api/admin/broadcasts?telegram_id=${adminTelegramId}`, {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ message, segment, segment_value: segmentValue })
+        });
+        
+        if (!response.ok) {
+            const error = await response.json();
+            throw new Error(error.detail || 'Ошибка создания рассылки');
+        }
+        
+        document.getElementById('broadcastMessage').value = '';
+        loadBroadcasts();
+    } catch (error) {
+        alert('Ошибка: ' + error.message);
+    }
+}
+
+async function cancelBroadcast(campaignId) {
+    if (!confirm('Отменить неотправленные сообщения рассылки?')) return;
+    
+    try {
+        const response = await fetch(`/api/admin/broadcasts/${campaignId}/cancel?telegram_id=${adminTelegramId}`, {
+            method: 'POST'
+        });
+        if (!response.ok) throw new Error('Ошибка отмены');
+        loadBroadcasts();
+    } catch (error) {
+        alert('Ошибка: ' + error.message);
+    }
+}
+
 function getStatusBadge(status) {
     const badges = {
         'active': '<span class="badge bg-success">Активен</span>',